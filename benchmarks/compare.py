@@ -0,0 +1,58 @@
+"""
+Compares two bench_results.json files written by the benchmarks in this directory.
+
+Every benchmark found in both files is listed with its time per bit before and after. Any benchmark
+that got slower than the threshold (10% by default) is flagged, and the exit status is then 1, so the
+script can gate a CI job:
+
+    python benchmarks/compare.py before.json after.json --threshold 0.05
+"""
+import argparse
+import json
+import sys
+
+
+def load(path):
+    with open(path) as f:
+        data = json.load(f)
+    results = {(r["name"], json.dumps(r["params"], sort_keys=True)): r for r in data["results"]}
+    return data, results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float, default=0.1, help="the relative slowdown flagged as a regression")
+    args = parser.parse_args(argv)
+
+    before_data, before = load(args.before)
+    after_data, after = load(args.after)
+    print(f"before: {before_data['version']} ({before_data['simulator']}, python {before_data['python']})")
+    print(f"after:  {after_data['version']} ({after_data['simulator']}, python {after_data['python']})")
+    print()
+    print(f"{'benchmark':<20} {'params':<50} {'before':>10} {'after':>10} {'change':>8}")
+
+    regressions = 0
+    for key in sorted(before.keys() & after.keys()):
+        name, params = key
+        old = before[key]["ns_per_bit"]
+        new = after[key]["ns_per_bit"]
+        change = new / old - 1
+        flag = ""
+        if change > args.threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        print(f"{name:<20} {params:<50} {old:>7.0f} ns {new:>7.0f} ns {change:>+7.1%}{flag}")
+
+    for key in sorted(before.keys() ^ after.keys()):
+        print(f"{key[0]:<20} {key[1]:<50} only in {'before' if key in before else 'after'}")
+
+    if regressions:
+        print(f"\n{regressions} benchmark(s) slower by more than {args.threshold:.0%}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
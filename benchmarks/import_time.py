@@ -0,0 +1,60 @@
+"""
+Measures the time it takes to import the device packages, on top of cocotbext.spi itself.
+
+Each measurement runs in a fresh interpreter, which imports cocotbext.spi first (it brings in cocotb
+and cocotb_bus, which every testbench pays for anyway), then times importing a vendor package, and
+getting a single model from it as a testbench does. The medians of the runs are reported:
+
+    python benchmarks/import_time.py --runs 20
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+
+# a model of each vendor package
+MODELS = [
+    ("cocotbext.spi.devices.ADI", "ADXL345"),
+    ("cocotbext.spi.devices.TI", "DRV8304"),
+    ("cocotbext.spi.devices.Trinamic", "TMC4671"),
+]
+
+SCRIPT = """
+import time
+import cocotbext.spi
+start = time.perf_counter()
+import {package}
+package = time.perf_counter()
+{package}.{model}
+print(package - start, time.perf_counter() - start)
+"""
+
+
+def measure(package, model, runs):
+    package_times = []
+    model_times = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", SCRIPT.format(package=package, model=model)],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        package_time, model_time = output.split()
+        package_times.append(float(package_time))
+        model_times.append(float(model_time))
+    return statistics.median(package_times), statistics.median(model_times)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    print(f"{'package':<32} {'model':<10} {'package':>10} {'+ model':>10}")
+    for package, model in MODELS:
+        package_time, model_time = measure(package, model, args.runs)
+        print(f"{package:<32} {model:<10} {package_time * 1e3:>7.2f} ms {model_time * 1e3:>7.2f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
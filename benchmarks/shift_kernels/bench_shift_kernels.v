@@ -0,0 +1,11 @@
+`timescale 1ns / 1ps
+
+module bench_shift_kernels
+(
+    inout wire sclk,
+    inout wire mosi,
+    inout wire miso,
+    inout wire ncs
+);
+
+endmodule // bench_shift_kernels
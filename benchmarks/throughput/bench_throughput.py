@@ -0,0 +1,224 @@
+"""
+Throughput benchmarks of the master, the slave base and the device models.
+
+Every benchmark clocks a fixed workload on the wire and measures the wall-clock time it takes, which
+is reported per bit and per frame. The results are logged as a table at the end of the run, and
+written as JSON to bench_results.json (or to $BENCH_RESULTS), along with the versions they were
+measured with, so that two runs can be compared with compare.py:
+
+    make
+    cp bench_results.json before.json
+    ... change cocotbext/spi ...
+    make
+    python ../compare.py before.json bench_results.json
+
+Run with `make` in this directory.
+"""
+import json
+import logging
+import os
+import platform
+import time
+
+import cocotb
+from cocotb.regression import TestFactory
+from cocotb.triggers import Timer
+from cocotb.utils import get_sim_time
+
+from cocotbext.spi import __version__
+from cocotbext.spi import SpiBus
+from cocotbext.spi import SpiConfig
+from cocotbext.spi import SpiMaster
+from cocotbext.spi.devices.ADI import ADXL345
+from cocotbext.spi.devices.generic import SpiSlaveLoopback
+from cocotbext.spi.devices.TI import ADS8028
+from cocotbext.spi.devices.TI import DRV8304
+from cocotbext.spi.devices.Trinamic import TMC4671
+
+FRAME_COUNT = 64
+SLAVE_COUNT = 8
+
+results = []
+
+
+async def measure(name, params, frames, bits, workload):
+    """ Run the workload, and record its wall-clock time per bit and per frame """
+    log = logging.getLogger("cocotb.bench")
+
+    sim_start = get_sim_time('ns')
+    start = time.perf_counter()
+    await workload
+    wall = time.perf_counter() - start
+    sim_time = get_sim_time('ns') - sim_start
+
+    result = {
+        "name": name,
+        "params": params,
+        "frames": frames,
+        "bits": bits,
+        "wall_s": wall,
+        "sim_ns": sim_time,
+        "ns_per_bit": wall * 1e9 / bits,
+        "us_per_frame": wall * 1e6 / frames,
+    }
+    results.append(result)
+    log.info("%s %s: %.0f ns/bit, %.1f us/frame", name, params, result["ns_per_bit"], result["us_per_frame"])
+
+
+def mode_config(spi_mode, **kwargs):
+    return SpiConfig(cpol=bool(spi_mode in [2, 3]), cpha=bool(spi_mode in [1, 3]), **kwargs)
+
+
+async def run_bench_loopback(dut, word_width=8, spi_mode=0, ddr=False):
+    """ SpiMaster and SpiSlaveLoopback, one word per frame """
+    bus = SpiBus.from_entity(dut, cs_name="ncs")
+    config = mode_config(spi_mode, word_width=word_width, sclk_freq=25e6, frame_spacing_ns=10, ddr=ddr)
+    source = SpiMaster(bus, config)
+    sink = SpiSlaveLoopback(bus, config)
+
+    await Timer(1, 'us')
+
+    mask = (1 << word_width) - 1
+    data = [(k * 0x9E3779B97F4A7C15) & mask for k in range(FRAME_COUNT)]
+
+    params = {"word_width": word_width, "spi_mode": spi_mode, "ddr": ddr}
+    await measure("loopback", params, FRAME_COUNT, FRAME_COUNT * word_width, source.write(data))
+
+    rx_data = await source.read()
+    assert list(rx_data[1:]) + [await sink.get_contents()] == data
+
+
+@cocotb.test()
+async def run_bench_adxl345(dut):
+    """ ADXL345 multibyte reads, a command and five data bytes per frame """
+    bus = SpiBus.from_entity(dut, cs_name="ncs")
+    config = SpiConfig(word_width=8, sclk_freq=25e6, cpol=True, cpha=True)
+    source = SpiMaster(bus, config)
+    sink = ADXL345(bus)
+
+    await Timer(1, 'us')
+
+    async def workload():
+        for _ in range(FRAME_COUNT):
+            await source.write([sink.create_spi_command("read", 0x2C, multibyte=True)] + [0] * 5, burst=True)
+            await Timer(200, 'ns')
+
+    await measure("adxl345_multibyte", {}, FRAME_COUNT, FRAME_COUNT * 6 * 8, workload())
+    assert list(source.read_nowait())[-5:] == [0b0000_1010, 0x00, 0x00, 0x00, 0b0000_0010]
+
+
+@cocotb.test()
+async def run_bench_tmc4671(dut):
+    """ TMC4671 40 bit register reads """
+    bus = SpiBus.from_entity(dut, cs_name="ncs")
+    config = SpiConfig(word_width=40, sclk_freq=2e6, cpol=True, cpha=True)
+    source = SpiMaster(bus, config)
+    sink = TMC4671(bus)
+
+    await Timer(1, 'us')
+
+    # point CHIPINFO_DATA at SI_TYPE
+    await source.write([sink.create_spi_word("write", 0x01, 0)])
+    await Timer(20, 'ns')
+
+    async def workload():
+        for _ in range(FRAME_COUNT):
+            await source.write([sink.create_spi_word("read", 0x00, 0)])
+            await Timer(20, 'ns')
+
+    await measure("tmc4671", {}, FRAME_COUNT, FRAME_COUNT * 40, workload())
+    assert source.read_nowait()[-1] & 0xFFFF_FFFF == 0x34363731
+
+
+@cocotb.test()
+async def run_bench_ads8028(dut):
+    """ ADS8028 conversions in repeat mode, after a single write of the control register """
+    bus = SpiBus.from_entity(dut, cs_name="ncs")
+    config = SpiConfig(word_width=16, sclk_freq=25e6, cpol=True, cpha=False)
+    source = SpiMaster(bus, config)
+    sink = ADS8028(bus)
+
+    await Timer(1, 'us')
+
+    await source.write([sink.create_spi_word("write", 0b111100011100100)])
+    await Timer(20, 'ns')
+
+    async def workload():
+        for _ in range(FRAME_COUNT):
+            await source.write([sink.create_spi_word("read", 0x0000)])
+            await Timer(20, 'ns')
+
+    await measure("ads8028_repeat", {}, FRAME_COUNT, FRAME_COUNT * 16, workload())
+
+
+@cocotb.test()
+async def run_bench_drv8304(dut):
+    """ DRV8304 register reads """
+    bus = SpiBus.from_entity(dut, cs_name="ncs")
+    config = SpiConfig(word_width=16, sclk_freq=25e6, cpol=False, cpha=True)
+    source = SpiMaster(bus, config)
+    sink = DRV8304(bus)
+
+    await Timer(1, 'us')
+
+    async def workload():
+        for _ in range(FRAME_COUNT):
+            await source.write([sink.create_spi_word("read", 0x03, 0)])
+            await Timer(500, 'ns')
+
+    await measure("drv8304", {}, FRAME_COUNT, FRAME_COUNT * 16, workload())
+    assert source.read_nowait()[-1] & 0x7FF == 0x377
+
+
+@cocotb.test()
+async def run_bench_many_slaves(dut):
+    """ One master and SLAVE_COUNT loopback slaves on a shared bus, addressed round robin """
+    chip_selects = [f"ncs{k}" for k in range(SLAVE_COUNT)]
+    config = SpiConfig(word_width=16, sclk_freq=25e6, frame_spacing_ns=10)
+    source = SpiMaster(SpiBus.from_entity(dut, cs_name=chip_selects), config)
+    sinks = [SpiSlaveLoopback(SpiBus.from_entity(dut, cs_name=cs), config) for cs in chip_selects]
+
+    await Timer(1, 'us')
+
+    data = [k * 0x9E37 & 0xFFFF for k in range(FRAME_COUNT)]
+
+    async def workload():
+        for k, word in enumerate(data):
+            source.write_nowait([word], target=k % SLAVE_COUNT)
+        await source.wait()
+
+    params = {"slaves": SLAVE_COUNT}
+    await measure("many_slaves", params, FRAME_COUNT, FRAME_COUNT * 16, workload())
+    assert [await sink.get_contents() for sink in sinks] == data[-SLAVE_COUNT:]
+
+
+if cocotb.SIM_NAME:
+    factory = TestFactory(run_bench_loopback)
+    factory.add_option("word_width", [8, 16, 32, 64])
+    factory.add_option("spi_mode", [0, 1, 2, 3])
+    factory.add_option("ddr", [False, True])
+    factory.generate_tests()
+
+
+@cocotb.test()
+async def report(dut):
+    log = logging.getLogger("cocotb.bench")
+    log.info("%-20s %-50s %12s %14s", "benchmark", "params", "ns/bit", "us/frame")
+    for result in results:
+        log.info(
+            "%-20s %-50s %12.0f %14.1f",
+            result["name"], json.dumps(result["params"]), result["ns_per_bit"], result["us_per_frame"],
+        )
+
+    path = os.environ.get("BENCH_RESULTS", "bench_results.json")
+    with open(path, "w") as f:
+        json.dump({
+            "version": __version__,
+            "cocotb": cocotb.__version__,
+            "simulator": f"{cocotb.SIM_NAME} {cocotb.SIM_VERSION}",
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "results": results,
+        }, f, indent=2)
+    log.info("Results written to %s", path)
@@ -0,0 +1,19 @@
+`timescale 1ns / 1ps
+
+module bench_throughput
+(
+    inout wire sclk,
+    inout wire mosi,
+    inout wire miso,
+    inout wire ncs,
+    inout wire ncs0,
+    inout wire ncs1,
+    inout wire ncs2,
+    inout wire ncs3,
+    inout wire ncs4,
+    inout wire ncs5,
+    inout wire ncs6,
+    inout wire ncs7
+);
+
+endmodule // bench_throughput
@@ -20,22 +20,52 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 THE SOFTWARE.
 """
 from .about import __version__
+from .bfm import bfm_sources
+from .bfm import SpiMasterBfm
+from .bfm import SpiSlaveBfm
 from .exceptions import SpiFrameError
 from .exceptions import SpiFrameTimeout
+from .monitor import SpiFrame
+from .monitor import SpiMonitor
 from .spi import reverse_word
+from .spi import reverse_words
 from .spi import SpiBus
 from .spi import SpiConfig
 from .spi import SpiMaster
+from .spi import SpiMessage
+from .spi import SpiProfile
 from .spi import SpiSlaveBase
+from .spi import SpiTransaction
+from .spi import SpiTransfer
+from .stats import SpiBusStats
+from .trace import SpiTrace
+from .trace import SpiTraceRecord
+from .trace import SpiTraceRecorder
+from .vcd import decode_vcd
 
 
 __all__ = [
     "__version__",
     "SpiMaster",
     "SpiSlaveBase",
+    "SpiMonitor",
+    "SpiFrame",
+    "SpiTraceRecorder",
+    "SpiTrace",
+    "SpiTraceRecord",
+    "decode_vcd",
     "SpiBus",
     "SpiConfig",
+    "SpiTransfer",
+    "SpiMessage",
+    "SpiTransaction",
+    "SpiProfile",
+    "SpiBusStats",
+    "SpiMasterBfm",
+    "SpiSlaveBfm",
+    "bfm_sources",
     "SpiFrameError",
     "SpiFrameTimeout",
     "reverse_word",
+    "reverse_words",
 ]
@@ -0,0 +1,52 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: 2021 Spencer Chang
+# Handles on the Verilog BFMs in hdl/, which shift the bits of a word in the simulator
+import os
+from typing import List
+
+from cocotb_bus.bus import Bus
+
+HDL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'hdl')
+
+
+def bfm_sources() -> List[str]:
+    """ The Verilog sources of spi_bfm_master and spi_bfm_slave, to compile along with the testbench """
+    return [os.path.join(HDL_DIR, f) for f in ('spi_bfm_master.v', 'spi_bfm_slave.v')]
+
+
+class SpiMasterBfm(Bus):
+    """ The Python side ports of a spi_bfm_master instance """
+    _signals = [
+        'sclk_in', 'mosi_in', 'tx_word', 'mosi_next', 'rx_word', 'word_width',
+        'cpha', 'ddr', 'msb_first', 'step_ps', 'req', 'ack',
+    ]
+
+    def __init__(self, entity=None, prefix=None, **kwargs):
+        super().__init__(entity, prefix, self._signals, **kwargs)
+
+    @classmethod
+    def from_entity(cls, entity, **kwargs):
+        return cls(entity, **kwargs)
+
+    @classmethod
+    def from_prefix(cls, entity, prefix, **kwargs):
+        return cls(entity, prefix, **kwargs)
+
+
+class SpiSlaveBfm(Bus):
+    """ The Python side ports of a spi_bfm_slave instance """
+    _signals = [
+        'miso_in', 'tx_word', 'rx_word', 'word_width',
+        'cpha', 'ddr', 'cs_active_low', 'req', 'ack', 'frame_error',
+    ]
+
+    def __init__(self, entity=None, prefix=None, **kwargs):
+        super().__init__(entity, prefix, self._signals, **kwargs)
+
+    @classmethod
+    def from_entity(cls, entity, **kwargs):
+        return cls(entity, **kwargs)
+
+    @classmethod
+    def from_prefix(cls, entity, prefix, **kwargs):
+        return cls(entity, prefix, **kwargs)
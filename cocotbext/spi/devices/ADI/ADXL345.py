@@ -2,13 +2,15 @@ from cocotb.triggers import FallingEdge
 from cocotb.triggers import First
 from cocotb.triggers import RisingEdge
 
-from ...spi import SpiBus
+from ...registers import READ_ONLY
+from ...registers import SpiRegister
+from ...registers import SpiRegisterDevice
+from ...registers import SpiRegisterField
 from ...spi import SpiConfig
 from ...spi import SpiFrameError
-from ...spi import SpiSlaveBase
 
 
-class ADXL345(SpiSlaveBase):
+class ADXL345(SpiRegisterDevice):
     _config = SpiConfig(
         # technically, a word is 16 bits long on this chip, but this chip allows for 16+8n bits if the multibyte is set
         word_width=8,
@@ -19,44 +21,63 @@ class ADXL345(SpiSlaveBase):
         cs_active_low=True,
     )
 
-    def __init__(self, bus: SpiBus):
-        self._registers = {
-            0x00: 0b1110_0101,  # DEVID
-            0x1D: 0x00,         # Tap Threshold
-            0x1E: 0x00,         # OFSX
-            0x1F: 0x00,         # OFSY
-            0x20: 0x00,         # OFSZ
-            0x21: 0x00,         # DUR
-            0x22: 0x00,         # LATENT
-            0x23: 0x00,         # WINDOW
-            0x24: 0x00,         # THRESH_ACT
-            0x25: 0x00,         # THRESH_INACT
-            0x26: 0x00,         # TIME_INACT
-            0x27: 0x00,         # ACT_INACT_CTL
-            0x28: 0x00,         # THRESH_FF
-            0x29: 0x00,         # TIME_FF
-            0x2A: 0x00,         # TAP_AXES
-            0x2B: 0x00,         # ACT_TAP_STATUS
-            0x2C: 0b0000_1010,  # BW_RATE
-            0x2D: 0x00,         # POWER_CTL
-            0x2E: 0x00,         # INT_ENABLE
-            0x2F: 0x00,         # INT_MAP
-            0x30: 0b0000_0010,  # INT_SOURCE
-            0x31: 0x00,         # DATA_FORMAT
-            0x32: 0x00,         # DATAX0
-            0x33: 0x00,         # DATAX1
-            0x34: 0x00,         # DATAY0
-            0x35: 0x00,         # DATAY1
-            0x36: 0x00,         # DATAZ0
-            0x37: 0x00,         # DATAZ1
-            0x38: 0x00,         # FIFO_CTL
-            0x39: 0x00,         # FIFO_STATUS
-        }
-        super().__init__(bus)
-
-    async def get_register(self, reg_num: int) -> int:
-        await self.idle.wait()
-        return self._registers[reg_num]
+    _register_layout = (
+        SpiRegister("DEVID", 0x00, reset=0b1110_0101, access=READ_ONLY),
+        SpiRegister("THRESH_TAP", 0x1D),
+        SpiRegister("OFSX", 0x1E),
+        SpiRegister("OFSY", 0x1F),
+        SpiRegister("OFSZ", 0x20),
+        SpiRegister("DUR", 0x21),
+        SpiRegister("LATENT", 0x22),
+        SpiRegister("WINDOW", 0x23),
+        SpiRegister("THRESH_ACT", 0x24),
+        SpiRegister("THRESH_INACT", 0x25),
+        SpiRegister("TIME_INACT", 0x26),
+        SpiRegister("ACT_INACT_CTL", 0x27),
+        SpiRegister("THRESH_FF", 0x28),
+        SpiRegister("TIME_FF", 0x29),
+        SpiRegister("TAP_AXES", 0x2A),
+        SpiRegister("ACT_TAP_STATUS", 0x2B, access=READ_ONLY),
+        SpiRegister("BW_RATE", 0x2C, reset=0b0000_1010, fields=(
+            SpiRegisterField("RATE", 0, 4),
+            SpiRegisterField("LOW_POWER", 4),
+        )),
+        SpiRegister("POWER_CTL", 0x2D, fields=(
+            SpiRegisterField("WAKEUP", 0, 2),
+            SpiRegisterField("SLEEP", 2),
+            SpiRegisterField("MEASURE", 3),
+            SpiRegisterField("AUTO_SLEEP", 4),
+            SpiRegisterField("LINK", 5),
+        )),
+        SpiRegister("INT_ENABLE", 0x2E),
+        SpiRegister("INT_MAP", 0x2F),
+        SpiRegister("INT_SOURCE", 0x30, reset=0b0000_0010, access=READ_ONLY),
+        SpiRegister("DATA_FORMAT", 0x31, fields=(
+            SpiRegisterField("RANGE", 0, 2),
+            SpiRegisterField("JUSTIFY", 2),
+            SpiRegisterField("FULL_RES", 3),
+            SpiRegisterField("INT_INVERT", 5),
+            SpiRegisterField("SPI", 6),
+            SpiRegisterField("SELF_TEST", 7),
+        )),
+        SpiRegister("DATAX0", 0x32, access=READ_ONLY),
+        SpiRegister("DATAX1", 0x33, access=READ_ONLY),
+        SpiRegister("DATAY0", 0x34, access=READ_ONLY),
+        SpiRegister("DATAY1", 0x35, access=READ_ONLY),
+        SpiRegister("DATAZ0", 0x36, access=READ_ONLY),
+        SpiRegister("DATAZ1", 0x37, access=READ_ONLY),
+        SpiRegister("FIFO_CTL", 0x38, fields=(
+            SpiRegisterField("SAMPLES", 0, 5),
+            SpiRegisterField("TRIGGER", 5),
+            SpiRegisterField("FIFO_MODE", 6, 2),
+        )),
+        SpiRegister("FIFO_STATUS", 0x39, access=READ_ONLY, fields=(
+            SpiRegisterField("ENTRIES", 0, 6),
+            SpiRegisterField("FIFO_TRIG", 7),
+        )),
+    )
+    # the address is 6 bits, multibyte accesses wrap around from 0x3F to 0x00
+    _register_space = 64
 
     def create_spi_command(self, operation: str, address: int, *, multibyte: bool = False) -> int:
         command = 0
@@ -68,14 +89,35 @@ class ADXL345(SpiSlaveBase):
         else:
             raise ValueError("Expected operation to bein ['read', 'write']")
 
-        if address not in self._registers:
-            raise ValueError(f"Expected address to be in {list(self._registers.keys())}")
+        self._registers.check(address)
 
         if multibyte:
             command |= 1 << 6
 
         return command | (address & 0x0f_ff)
 
+    def backdoor(self, frame: int, num_bits: int) -> int:
+        if num_bits < 16 or num_bits % 8:
+            raise SpiFrameError(f"ADXL345: expected a frame of 16+8n bits, got {num_bits}")
+        num_words = num_bits // 8
+
+        command = frame >> (num_bits - 8)
+        do_write = not command & 0b1000_0000
+        do_multibyte = bool(command & 0b0100_0000)
+        address = command & 0b0011_1111
+        if num_words > 2 and not do_multibyte:
+            raise SpiFrameError("ADXL345: received another clock edge when end of frame expected")
+
+        # the command byte is shifted in while miso idles, then one register per byte
+        rx_frame = self._idle_bits(8)
+        for word in self._registers.read_block(address, num_words - 1):
+            rx_frame = (rx_frame << 8) | word
+        if do_write:
+            self._registers.write_block(
+                address, [(frame >> (8 * (num_words - 2 - k))) & 0xFF for k in range(num_words - 1)],
+            )
+        return rx_frame
+
     async def _transaction(self, frame_start, frame_end) -> None:
         await frame_start
         self.idle.clear()
@@ -83,22 +125,25 @@ class ADXL345(SpiSlaveBase):
         if not bool(self._sclk.value):
             raise SpiFrameError("ADXL345: sclk should be high at chip select edge")
 
+        registers = self._registers
+        values = registers.values
+
         do_write = not bool(await self._shift(1))
         do_multibyte = bool(await self._shift(1))
         address = int(await self._shift(6))
-        content = int(await self._shift(8, tx_word=self._registers[address]))
+        content = int(await self._shift(8, tx_word=values[address]))
 
         if do_write:
-            self._registers[address] = content
+            registers.write(address, content)
 
         if do_multibyte:
             # check for multibyte read/write by seeing which is first, a clk edge or frame end
             while await First(frame_end, FallingEdge(self._sclk)) != frame_end:
-                address = address + 1
-                self._miso.value = bool(self._registers[address] & 0b1000_0000)
+                address = (address + 1) % len(values)
+                self._miso.value = bool(values[address] & 0b1000_0000)
 
                 # shift in the remaining words
-                rx_word = int(await self._shift(7, tx_word=(self._registers[address] & 0b0111_1111))) << 1
+                rx_word = int(await self._shift(7, tx_word=(values[address] & 0b0111_1111))) << 1
 
                 # grab the last bit
                 if (await First(RisingEdge(self._sclk), frame_end)) == frame_end or self._cs.value == 1:
@@ -107,7 +152,7 @@ class ADXL345(SpiSlaveBase):
 
                 # perform write if necessary
                 if do_write:
-                    self._registers[address] = rx_word
+                    registers.write(address, rx_word)
         else:
             if await First(frame_end, FallingEdge(self._sclk)) != frame_end:
                 raise SpiFrameError("ADXL345: received another clock edge when end of frame expected")
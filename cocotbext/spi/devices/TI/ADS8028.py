@@ -1,11 +1,13 @@
 # SPDX-License-Identifier: MIT
 # SPDX-FileCopyrightText: 2021 Spencer Chang
 from collections import deque
+from typing import Optional
 
 from cocotb.triggers import FallingEdge
 from cocotb.triggers import First
 from cocotb.triggers import RisingEdge
 
+from ...bfm import SpiSlaveBfm
 from ...exceptions import SpiFrameError
 from ...spi import SpiBus
 from ...spi import SpiConfig
@@ -22,7 +24,7 @@ class ADS8028(SpiSlaveBase):
         cs_active_low=True,
     )
 
-    def __init__(self, bus: SpiBus):
+    def __init__(self, bus: SpiBus, bfm: Optional[SpiSlaveBfm] = None, *, target: int = 0):
         self._control_register = 0
         self._control_register_updated = False
         self.adc_values = {
@@ -38,10 +40,10 @@ class ADS8028(SpiSlaveBase):
         }
         self._out_queue = deque()
 
-        super().__init__(bus)
+        super().__init__(bus, bfm, target=target)
 
-    async def get_control_register(self):
-        await self.idle.wait()
+    async def get_control_register(self, *, timeout_ns: Optional[float] = None):
+        await self.wait(timeout_ns=timeout_ns)
         return self._control_register
 
     def create_spi_word(self, operation, content):
@@ -80,6 +82,22 @@ class ADS8028(SpiSlaveBase):
             return self._out_queue.popleft()
         return 0
 
+    def _write_control_register(self, content):
+        self._control_register = content
+        self._control_register_updated = True
+        self._out_queue.clear()
+        self._out_queue.append(0)
+
+    def backdoor(self, frame: int, num_bits: int) -> int:
+        if num_bits != 16:
+            raise SpiFrameError(f"ADS8028: expected a 16 bit frame, got {num_bits}")
+
+        tx_word = self._generate_output()
+
+        if frame & (1 << 15):
+            self._write_control_register(frame & 0x7FFF)
+        return tx_word
+
     async def _transaction(self, frame_start, frame_end):
         await frame_start
         self.idle.clear()
@@ -93,7 +111,8 @@ class ADS8028(SpiSlaveBase):
         # propagate the first bit on the fram start
         self._miso.value = bool(tx_word & (1 << 15))
 
-        do_write = bool(await self._shift(1, tx_word=(tx_word & (1 << 14))))
+        # with CPHA=0 the bit shifted out after sampling is the next one, bit 14 here
+        do_write = bool(await self._shift(1, tx_word=(tx_word >> 14)))
         content = int(await self._shift(14, tx_word=(tx_word & (0x3FFF))))
 
         # get the last data bit
@@ -111,7 +130,4 @@ class ADS8028(SpiSlaveBase):
             raise SpiFrameError("ADS8028: sclk should be high at chip select edge")
 
         if do_write:
-            self._control_register = content
-            self._control_register_updated = True
-            self._out_queue.clear()
-            self._out_queue.append(0)
+            self._write_control_register(content)
@@ -4,12 +4,13 @@ from cocotb.triggers import First
 from cocotb.triggers import RisingEdge
 
 from ...exceptions import SpiFrameError
-from ...spi import SpiBus
+from ...registers import READ_ONLY
+from ...registers import SpiRegister
+from ...registers import SpiRegisterDevice
 from ...spi import SpiConfig
-from ...spi import SpiSlaveBase
 
 
-class DRV8304(SpiSlaveBase):
+class DRV8304(SpiRegisterDevice):
     _config = SpiConfig(
         word_width=16,
         cpol=False,
@@ -19,22 +20,18 @@ class DRV8304(SpiSlaveBase):
         cs_active_low=True,
     )
 
-    def __init__(self, bus: SpiBus):
-        self._registers = {
-            0: 0b00000000000,
-            1: 0b00000000000,
-            2: 0b00000000000,
-            3: 0b01101110111,
-            4: 0b11101110111,
-            5: 0b00101000101,
-            6: 0b01010000011,
-        }
-
-        super().__init__(bus)
-
-    async def get_register(self, reg_num):
-        await self.idle.wait()
-        return self._registers[reg_num]
+    _register_layout = (
+        SpiRegister("FAULT_STATUS_1", 0x0, access=READ_ONLY),
+        SpiRegister("VGS_STATUS_2", 0x1, access=READ_ONLY),
+        SpiRegister("DRIVER_CONTROL", 0x2),
+        SpiRegister("GATE_DRIVE_HS", 0x3, reset=0b01101110111),
+        SpiRegister("GATE_DRIVE_LS", 0x4, reset=0b11101110111),
+        SpiRegister("OCP_CONTROL", 0x5, reset=0b00101000101),
+        SpiRegister("CSA_CONTROL", 0x6, reset=0b01010000011),
+    )
+    _register_width = 11
+    # the address is 4 bits
+    _register_space = 16
 
     def create_spi_word(self, operation, address, content):
         command = 0
@@ -46,17 +43,24 @@ class DRV8304(SpiSlaveBase):
         else:
             raise ValueError("Expected operation to be in ['read', 'write']")
 
-        try:
-            self._registers[address]
-        except KeyError:
-            raise ValueError(
-                f"Expected address to be in {list(self._registers.keys())}",
-            )
+        self._registers.check(address)
         command |= (address & 0b1111) << 11
         command |= content & 0b11111111111
 
         return command
 
+    def backdoor(self, frame: int, num_bits: int) -> int:
+        if num_bits != 16:
+            raise SpiFrameError(f"DRV8304: expected a 16 bit frame, got {num_bits}")
+
+        do_write = not frame & (1 << 15)
+        address = (frame >> 11) & 0b1111
+        rx_frame = (self._idle_bits(5) << 11) | self._registers.values[address]
+
+        if do_write:
+            self._registers.write(address, frame & 0b11111111111)
+        return rx_frame
+
     async def _transaction(self, frame_start, frame_end):
         await frame_start
         self.idle.clear()
@@ -67,7 +71,7 @@ class DRV8304(SpiSlaveBase):
 
         do_write = not bool(await self._shift(1))
         address = int(await self._shift(4))
-        content = int(await self._shift(11, tx_word=self._registers[address]))
+        content = int(await self._shift(11, tx_word=self._registers.values[address]))
 
         # end of frame
         if await First(frame_end, RisingEdge(self._sclk)) != frame_end:
@@ -77,4 +81,4 @@ class DRV8304(SpiSlaveBase):
             raise SpiFrameError("DRV8304: sclk should be low at chip select edge")
 
         if do_write:
-            self._registers[address] = content
+            self._registers.write(address, content)
@@ -1,17 +1,22 @@
 # SPDX-License-Identifier: MIT
 # SPDX-FileCopyrightText: 2021 Spencer Chang
+from typing import Optional
+
 from cocotb.triggers import FallingEdge
 from cocotb.triggers import First
 from cocotb.triggers import RisingEdge
 from cocotb.triggers import Timer
 
+from ...bfm import SpiSlaveBfm
 from ...exceptions import SpiFrameError
+from ...registers import READ_ONLY
+from ...registers import SpiRegister
+from ...registers import SpiRegisterDevice
 from ...spi import SpiBus
 from ...spi import SpiConfig
-from ...spi import SpiSlaveBase
 
 
-class TMC4671(SpiSlaveBase):
+class TMC4671(SpiRegisterDevice):
     _config = SpiConfig(
         word_width=40,
         cpol=True,
@@ -21,14 +26,18 @@ class TMC4671(SpiSlaveBase):
         cs_active_low=True,
     )
 
-    def __init__(self, bus: SpiBus):
-        self._address_change_callbacks = {}
+    # mockup of the test registers
+    _register_layout = (
+        SpiRegister("CHIPINFO_DATA", 0x00, reset=int.from_bytes(b"4671", byteorder='big'), access=READ_ONLY),
+        SpiRegister("CHIPINFO_ADDR", 0x01),
+    )
+    _register_width = 32
+    # the address is 7 bits
+    _register_space = 128
 
-        # mockup of the test registers
-        self._registers = {
-            0x00: int.from_bytes(b"4671", byteorder='big'),
-            0x01: 0x0000_0000,
-        }
+    def __init__(self, bus: SpiBus, bfm: Optional[SpiSlaveBfm] = None, *, target: int = 0):
+        self._address_change_callbacks = {}
+        super().__init__(bus, bfm, target=target)
 
         self._register_address_changed_hook(
             0x01, [0x00],
@@ -42,12 +51,6 @@ class TMC4671(SpiSlaveBase):
             }[self._registers[0x01]],
         )
 
-        super().__init__(bus)
-
-    async def get_register(self, reg_num):
-        await self.idle.wait()
-        return self._registers[reg_num]
-
     def create_spi_word(self, operation, address, content):
         command = 0
         if operation == "read":
@@ -58,10 +61,7 @@ class TMC4671(SpiSlaveBase):
         else:
             raise ValueError("Expected operation to be in ['read', 'write']")
 
-        try:
-            self._registers[address]
-        except KeyError:
-            raise ValueError(f"Expected address to be in {list(self._registers.keys())}")
+        self._registers.check(address)
         command |= (address & 0b1111) << 32
         command |= (content & 0xFFFF_FFFF)
 
@@ -70,6 +70,27 @@ class TMC4671(SpiSlaveBase):
     def _register_address_changed_hook(self, watch_address, update_addresses, f):
         self._address_change_callbacks[watch_address] = (update_addresses, f)
 
+    def _write_register(self, address, content):
+        self._registers.write(address, content)
+
+        if address in self._address_change_callbacks:
+            cb = self._address_change_callbacks[address]
+            for addr in cb[0]:
+                self._registers[addr] = cb[1]()
+
+    def backdoor(self, frame: int, num_bits: int) -> int:
+        if num_bits != 40:
+            raise SpiFrameError(f"TMC4671: expected a 40 bit frame, got {num_bits}")
+
+        do_write = bool(frame & (1 << 39))
+        address = (frame >> 32) & 0b111_1111
+        # the command byte is echoed back on miso, then the register content follows
+        rx_frame = (frame & (0xFF << 32)) | self._registers.values[address]
+
+        if do_write:
+            self._write_register(address, frame & 0xFFFF_FFFF)
+        return rx_frame
+
     async def _transaction(self, frame_start, frame_end):
         await frame_start
         self.idle.clear()
@@ -106,11 +127,12 @@ class TMC4671(SpiSlaveBase):
 
         # read in the content, while writing out the respective data
         content = 0
+        register = self._registers.values[address]
         for k in range(32):
             s = await First(FallingEdge(self._sclk), frame_end)
             t = await First(Timer(20, units='ns'), frame_end)
             content |= int(self._mosi.value.integer) << (32 - 1 - k)
-            self._miso.value = bool(self._registers[address] & (1 << (32 - 1 - k)))
+            self._miso.value = bool(register & (1 << (32 - 1 - k)))
 
             if frame_end in (s, t):
                 raise SpiFrameError("TMC4671: chip select deasserted in middle of transaction")
@@ -123,9 +145,4 @@ class TMC4671(SpiSlaveBase):
             raise SpiFrameError("TMC4671: sclk should be high at chip select edge")
 
         if do_write:
-            self._registers[address] = content
-
-            if address in self._address_change_callbacks:
-                cb = self._address_change_callbacks[address]
-                for addr in cb[0]:
-                    self._registers[addr] = cb[1]()
+            self._write_register(address, content)
@@ -0,0 +1,40 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: 2021 Spencer Chang
+# Imports the models of a vendor package the first time they are looked up
+import importlib
+import sys
+import types
+from typing import Dict
+
+
+class _LazyPackage(types.ModuleType):
+    """ A vendor package, its models are imported as attributes of it are first looked up """
+    _models: Dict[str, str]
+
+    def __getattr__(self, name):
+        models = self.__dict__.get('_models', {})
+        if name not in models:
+            raise AttributeError(f"module {self.__name__!r} has no attribute {name!r}")
+        return getattr(importlib.import_module(f"{self.__name__}.{models[name]}"), name)
+
+    def __dir__(self):
+        return sorted(set(self.__dict__) | set(self._models))
+
+    def __setattr__(self, name, value):
+        # the import of a model module binds it to its name, which is also the name of the model
+        if name in self._models and isinstance(value, types.ModuleType):
+            value = getattr(value, name)
+        super().__setattr__(name, value)
+
+
+def install_lazy_models(name: str, models: Dict[str, str]) -> None:
+    """ Make the package name import its models lazily, so a testbench only pays for the models it uses
+
+    Args:
+        name: the __name__ of the package
+        models: the models of the package by class name, and the module each one is defined in
+    """
+    package = sys.modules[name]
+    package._models = models
+    package.__all__ = list(models)
+    package.__class__ = _LazyPackage
@@ -2,10 +2,12 @@
 # SPDX-FileCopyrightText: 2021 Spencer Chang
 # Transmits the previously received word on the next transaction
 from collections import deque
+from typing import Optional
 
 from cocotb.triggers import Edge
 from cocotb.triggers import First
 
+from ..bfm import SpiSlaveBfm
 from ..exceptions import SpiFrameError
 from ..spi import reverse_word
 from ..spi import SpiBus
@@ -14,29 +16,37 @@ from ..spi import SpiSlaveBase
 
 
 class SpiSlaveLoopback(SpiSlaveBase):
-    def __init__(self, bus: SpiBus, config: SpiConfig):
+    def __init__(self, bus: SpiBus, config: SpiConfig, bfm: Optional[SpiSlaveBfm] = None, *, target: int = 0):
         self._config = config
 
         self._out_queue = deque()
         self._out_queue.append(0)
 
-        super().__init__(bus)
+        super().__init__(bus, bfm, target=target)
 
-    async def get_contents(self):
-        await self.idle.wait()
+    async def get_contents(self, *, timeout_ns: Optional[float] = None):
+        await self.wait(timeout_ns=timeout_ns)
         if self._config.msb_first:
             return self._out_queue[0]
         else:
             return reverse_word(self._out_queue[0], self._config.word_width)
 
+    def backdoor(self, frame: int, num_bits: int) -> int:
+        if num_bits != self._config.word_width:
+            raise SpiFrameError(f"Expected a {self._config.word_width} bit frame, got {num_bits}")
+
+        tx_word = self._out_queue.popleft()
+        self._out_queue.append(frame)
+        return tx_word
+
     async def _transaction(self, frame_start, frame_end):
         await frame_start
         self.idle.clear()
 
         # we do not have to reverse the word based on msb or lsb since we are just looping back
         tx_word = self._out_queue.popleft()
-        if not self._config.cpha:
-            # when CPHA=0, we use the chip select edge (frame start) to propagate data.
+        if not self._config.cpha or self._config.ddr:
+            # when CPHA=0 (or DDR), we use the chip select edge (frame start) to propagate data.
             self._miso.value = bool(tx_word & (1 << self._config.word_width - 1))
             # now we can do the sclk cycles, but we do one less (because we don't have all the words
             content = int(await self._shift(self._config.word_width - 1, tx_word=tx_word))
@@ -0,0 +1,234 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: 2021 Spencer Chang
+# A generic SPI EEPROM or FRAM, stored in sparse pages
+from typing import Dict
+from typing import Iterator
+from typing import Optional
+from typing import Tuple
+
+from ...exceptions import SpiFrameError
+from ...spi import SpiBus
+from ...spi import SpiConfig
+from .base import SpiMemoryBase
+
+READ = 0x03
+WRITE = 0x02
+READ_STATUS = 0x05
+WRITE_STATUS = 0x01
+WRITE_ENABLE = 0x06
+WRITE_DISABLE = 0x04
+
+# the block protect bits of the status register: none, the upper quarter, half or all of the memory
+STATUS_BP = 0b0000_1100
+# the status register bits WRITE_STATUS stores, WPEN has no effect on the model (it has no WP pin)
+_STATUS_WRITABLE = 0b1000_1100
+
+_OPERATIONS = {
+    "read": READ,
+    "write": WRITE,
+    "read_status": READ_STATUS,
+    "write_status": WRITE_STATUS,
+    "write_enable": WRITE_ENABLE,
+    "write_disable": WRITE_DISABLE,
+}
+
+# the bytes of a storage page, allocated on the first write to it
+_STORAGE_PAGE = 256
+# the write cycle of an EEPROM, a FRAM has none
+_WRITE_CYCLE_NS = 5e6
+
+
+class SpiEeprom(SpiMemoryBase):
+    _config = SpiConfig(
+        word_width=8,
+        cpol=False,
+        cpha=False,
+        msb_first=True,
+        frame_spacing_ns=50,
+        cs_active_low=True,
+    )
+    _operations = _OPERATIONS
+    _addressed = frozenset((READ, WRITE))
+
+    def __init__(
+        self,
+        bus: SpiBus,
+        size: int,
+        *,
+        page_size: Optional[int] = 64,
+        address_bytes: Optional[int] = None,
+        write_cycle_ns: Optional[float] = None,
+        erased: int = 0xFF,
+        config: Optional[SpiConfig] = None,
+        target: int = 0,
+    ):
+        """ A SPI EEPROM (25xx series) or FRAM, its contents stored in pages allocated on the first write
+
+        The pages that were never written to read as erased without taking any memory, so a large part
+        costs next to nothing until it is written to.
+
+        Args:
+            bus: the bus of the memory
+            size: the number of bytes of the memory
+            page_size: the page a WRITE wraps around in, None for a FRAM, which writes on to the end of
+                the memory and wraps around to address 0
+            address_bytes: the number of address bytes, by default as many as the size takes
+            write_cycle_ns: the write cycle after each WRITE and WRITE_STATUS, during which WIP is set and
+                every command but READ_STATUS is ignored, by default 5 ms, or 0 for a FRAM
+            erased: the value of the bytes never written to
+            config: the SPI mode 0 (the default) or 3 config of the memory
+            target: the chip select of the memory, on a bus with several cs signals
+        """
+        self.size = size
+        self.page_size = page_size or size
+        if write_cycle_ns is None:
+            write_cycle_ns = _WRITE_CYCLE_NS if page_size is not None else 0
+        self.write_cycle_ns = write_cycle_ns
+        self._address_bytes = address_bytes or (max(size - 1, 1).bit_length() + 7) // 8
+        self._block = min(size, _STORAGE_PAGE)
+        if size % self._block or size % self.page_size:
+            raise ValueError(f"SpiEeprom: expected a size that is a multiple of {self._block} and of the page size")
+        self._erased = bytes((erased,)) * self._block
+        self._pages: Dict[int, bytearray] = {}
+
+        super().__init__(bus, config, target=target)
+
+    @property
+    def pages_allocated(self) -> int:
+        """ The number of storage pages written to so far """
+        return len(self._pages)
+
+    def read_memory(self, address: int, count: int) -> bytes:
+        """ The contents from address on, straight from the storage """
+        data = bytearray()
+        for chunk in self._memory_chunks(address):
+            data += chunk[:count - len(data)]
+            if len(data) == count:
+                return bytes(data)
+
+    def write_memory(self, address: int, data: bytes) -> None:
+        """ Store data from address on, straight into the storage, e.g. to preload the memory """
+        block = self._block
+        for k, byte in enumerate(data):
+            index, offset = divmod((address + k) % self.size, block)
+            self._page(index)[offset] = byte
+
+    def backdoor(self, frame: int, num_bits: int) -> int:
+        data, tx = self._frame_bytes(frame, num_bits)
+        count = len(data)
+        opcode = data[0]
+
+        if self.busy and opcode != READ_STATUS:
+            self.log.debug("SpiEeprom: busy, ignoring command %#04x", opcode)
+        elif opcode in (READ, WRITE):
+            address, header = self._address(data)
+            if opcode == READ:
+                tx[header:] = self.read_memory(address, count - header)
+            else:
+                self._write(address, data[header:])
+        elif opcode == READ_STATUS:
+            tx[1:] = bytes((self.status,)) * (count - 1)
+        elif opcode == WRITE_STATUS:
+            if count != 2:
+                raise SpiFrameError(f"SpiEeprom: expected a 16 bit WRITE_STATUS frame, got {num_bits}")
+            self._write_status(data[1])
+        elif opcode in (WRITE_ENABLE, WRITE_DISABLE):
+            if count != 1:
+                raise SpiFrameError("SpiEeprom: received another clock edge when end of frame expected")
+            self._write_enable = opcode == WRITE_ENABLE
+        else:
+            self.log.warning("SpiEeprom: ignoring unsupported command %#04x", opcode)
+        return int.from_bytes(tx, 'big')
+
+    async def _transaction(self, frame_start, frame_end):
+        await frame_start
+        self.idle.clear()
+
+        opcode = await self._receive_byte()
+        if opcode is None:
+            # the chip select was asserted without any clock edge
+            return
+
+        if self.busy and opcode != READ_STATUS:
+            self.log.debug("SpiEeprom: busy, ignoring command %#04x", opcode)
+            await frame_end
+        elif opcode in (READ, WRITE):
+            address, _ = self._address(bytes((opcode,)) + await self._receive_bytes(self._address_bytes))
+            if opcode == READ:
+                # a sequential read streams whole pages, not a byte at a time
+                await self._transmit(self._memory_chunks(address))
+            else:
+                self._write(address, await self._receive_until_end())
+        elif opcode == READ_STATUS:
+            await self._transmit(self._status_bytes())
+        elif opcode == WRITE_STATUS:
+            value = await self._receive_bytes(1)
+            await self._end_of_command()
+            self._write_status(value[0])
+        elif opcode in (WRITE_ENABLE, WRITE_DISABLE):
+            await self._end_of_command()
+            self._write_enable = opcode == WRITE_ENABLE
+        else:
+            self.log.warning("SpiEeprom: ignoring unsupported command %#04x", opcode)
+            await frame_end
+
+        self._miso.value = self._config.data_output_idle
+
+    def _page(self, index: int) -> bytearray:
+        page = self._pages.get(index)
+        if page is None:
+            page = self._pages[index] = bytearray(self._erased)
+        return page
+
+    def _memory_chunks(self, address: int) -> Iterator[bytes]:
+        """ The contents from address on, a storage page at a time, wrapping around at the end of the memory """
+        pages = self._pages
+        erased = self._erased
+        block = self._block
+        count = self.size // block
+        index, offset = divmod(address, block)
+        while True:
+            yield pages.get(index, erased)[offset:]
+            index = (index + 1) % count
+            offset = 0
+
+    def _address(self, data: bytes) -> Tuple[int, int]:
+        """ The address of a READ or WRITE, and the number of bytes up to the end of the address """
+        header = 1 + self._address_bytes
+        if len(data) < header:
+            raise SpiFrameError("SpiEeprom: end of frame before the end of the address")
+        return int.from_bytes(data[1:header], 'big') % self.size, header
+
+    def _protected_from(self) -> int:
+        """ The first address the block protect bits keep from being written """
+        bp = (self._status & STATUS_BP) >> 2
+        return self.size - (self.size >> (3 - bp) if bp else 0)
+
+    def _write(self, address: int, data: bytes) -> None:
+        """ Store the data from address on, wrapping around within the page """
+        if not data or not self._start_write(self.write_cycle_ns):
+            return
+        page_size = self.page_size
+        page = address - address % page_size
+        offset = address % page_size
+        if len(data) > page_size:
+            # only the last page size bytes are written
+            offset = (offset + len(data) - page_size) % page_size
+            data = data[-page_size:]
+
+        protected = self._protected_from()
+        block = self._block
+        k = 0
+        while k < len(data):
+            target = page + (offset + k) % page_size
+            # as many bytes as stay within the page, the storage page and the unprotected memory
+            count = min(len(data) - k, page_size - (offset + k) % page_size, block - target % block)
+            if target < protected:
+                count = min(count, protected - target)
+                start = target % block
+                self._page(target // block)[start:start + count] = data[k:k + count]
+            k += count
+
+    def _write_status(self, value: int) -> None:
+        if self._start_write(self.write_cycle_ns):
+            self._status = value & _STATUS_WRITABLE
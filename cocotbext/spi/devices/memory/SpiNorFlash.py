@@ -0,0 +1,305 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: 2021 Spencer Chang
+# A generic serial NOR flash, stored in a memory mapped image file
+import mmap
+from typing import Iterator
+from typing import Optional
+from typing import Tuple
+
+from ...exceptions import SpiFrameError
+from ...spi import SpiBus
+from ...spi import SpiConfig
+from .base import SpiMemoryBase
+
+READ = 0x03
+FAST_READ = 0x0B
+READ_4B = 0x13
+FAST_READ_4B = 0x0C
+PAGE_PROGRAM = 0x02
+PAGE_PROGRAM_4B = 0x12
+SECTOR_ERASE = 0x20
+SECTOR_ERASE_4B = 0x21
+BLOCK_ERASE = 0xD8
+BLOCK_ERASE_4B = 0xDC
+CHIP_ERASE = 0xC7
+CHIP_ERASE_ALT = 0x60
+READ_STATUS = 0x05
+WRITE_STATUS = 0x01
+WRITE_ENABLE = 0x06
+WRITE_DISABLE = 0x04
+READ_JEDEC_ID = 0x9F
+ENTER_4B_MODE = 0xB7
+EXIT_4B_MODE = 0xE9
+
+# the status register bits WRITE_STATUS stores, they have no effect on the model
+_STATUS_WRITABLE = 0b1111_1100
+
+PAGE_SIZE = 256
+SECTOR_SIZE = 4 << 10
+BLOCK_SIZE = 64 << 10
+
+# the commands followed by an address: opcode: (address bytes, None in the current address mode; dummy bytes)
+_ADDRESSED = {
+    READ: (None, 0),
+    FAST_READ: (None, 1),
+    READ_4B: (4, 0),
+    FAST_READ_4B: (4, 1),
+    PAGE_PROGRAM: (None, 0),
+    PAGE_PROGRAM_4B: (4, 0),
+    SECTOR_ERASE: (None, 0),
+    SECTOR_ERASE_4B: (4, 0),
+    BLOCK_ERASE: (None, 0),
+    BLOCK_ERASE_4B: (4, 0),
+}
+_READS = frozenset((READ, FAST_READ, READ_4B, FAST_READ_4B))
+_PROGRAMS = frozenset((PAGE_PROGRAM, PAGE_PROGRAM_4B))
+_ERASES = {
+    SECTOR_ERASE: SECTOR_SIZE,
+    SECTOR_ERASE_4B: SECTOR_SIZE,
+    BLOCK_ERASE: BLOCK_SIZE,
+    BLOCK_ERASE_4B: BLOCK_SIZE,
+}
+# the commands made of the opcode alone
+_SINGLES = frozenset((WRITE_ENABLE, WRITE_DISABLE, ENTER_4B_MODE, EXIT_4B_MODE, CHIP_ERASE, CHIP_ERASE_ALT))
+
+_OPERATIONS = {
+    "read": READ,
+    "fast_read": FAST_READ,
+    "page_program": PAGE_PROGRAM,
+    "sector_erase": SECTOR_ERASE,
+    "block_erase": BLOCK_ERASE,
+    "chip_erase": CHIP_ERASE,
+    "read_status": READ_STATUS,
+    "write_status": WRITE_STATUS,
+    "write_enable": WRITE_ENABLE,
+    "write_disable": WRITE_DISABLE,
+    "read_jedec_id": READ_JEDEC_ID,
+    "enter_4b_mode": ENTER_4B_MODE,
+    "exit_4b_mode": EXIT_4B_MODE,
+}
+
+# the bytes a read streams out of the mapping at a time
+_READ_CHUNK = 256
+# the bytes an erase or create_image() writes at a time
+_FILL_CHUNK = 1 << 20
+
+
+class SpiNorFlash(SpiMemoryBase):
+    _config = SpiConfig(
+        word_width=8,
+        cpol=False,
+        cpha=False,
+        msb_first=True,
+        frame_spacing_ns=50,
+        cs_active_low=True,
+    )
+    _operations = _OPERATIONS
+    _addressed = frozenset(_ADDRESSED)
+
+    # the time WIP is set for after each operation, during which every command but READ_STATUS is ignored
+    page_program_ns: float = 700e3
+    sector_erase_ns: float = 45e6
+    block_erase_ns: float = 150e6
+    chip_erase_ns: float = 40e9
+    write_status_ns: float = 10e6
+
+    def __init__(
+        self,
+        bus: SpiBus,
+        image: str,
+        *,
+        jedec_id: Optional[bytes] = None,
+        persist: bool = False,
+        config: Optional[SpiConfig] = None,
+        target: int = 0,
+    ):
+        """ A serial NOR flash, its contents stored in an image file the size of the part
+
+        The image is memory mapped, so a part of any size only takes memory for the pages that are
+        accessed. create_image() writes an erased image, along with the data to boot from.
+
+        Args:
+            bus: the bus of the flash
+            image: the path of the image file
+            jedec_id: the 3 bytes READ_JEDEC_ID returns, by default a Winbond W25Q part of the size of the image
+            persist: if true, the programs and erases are written back to the image file, else the file is
+                left as it is
+            config: the SPI mode 0 (the default) or 3 config of the flash
+            target: the chip select of the flash, on a bus with several cs signals
+        """
+        with open(image, 'r+b' if persist else 'rb') as f:
+            self.memory = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_WRITE if persist else mmap.ACCESS_COPY)
+        self.size = len(self.memory)
+        if jedec_id is None:
+            jedec_id = bytes((0xEF, 0x40, (self.size - 1).bit_length()))
+        self.jedec_id = bytes(jedec_id)
+        self._address_bytes = 3
+
+        super().__init__(bus, config, target=target)
+
+    @staticmethod
+    def create_image(path: str, size: int, data: bytes = b"", offset: int = 0) -> None:
+        """ Write an erased image of size bytes (all 0xFF), with data at offset """
+        if offset + len(data) > size:
+            raise ValueError(f"The data does not fit in {size} bytes")
+        erased = b"\xff" * min(size, _FILL_CHUNK)
+        with open(path, 'wb') as f:
+            for start in range(0, size, _FILL_CHUNK):
+                f.write(erased[:size - start])
+            f.seek(offset)
+            f.write(data)
+
+    def close(self) -> None:
+        """ Unmap the image, writing the changes back to it with persist """
+        self.memory.close()
+
+    def backdoor(self, frame: int, num_bits: int) -> int:
+        data, tx = self._frame_bytes(frame, num_bits)
+        count = len(data)
+        opcode = data[0]
+
+        if self.busy and opcode != READ_STATUS:
+            self.log.debug("SpiNorFlash: busy, ignoring command %#04x", opcode)
+        elif opcode in _ADDRESSED:
+            address, header = self._address(opcode, data)
+            if opcode in _READS:
+                # the bulk read, a single slice of the mapping
+                tx[header:] = self._read(address, count - header)
+            elif opcode in _PROGRAMS:
+                self._program(address, data[header:])
+            else:
+                if count > header:
+                    raise SpiFrameError("SpiNorFlash: received another clock edge when end of frame expected")
+                self._erase(address, _ERASES[opcode])
+        elif opcode == READ_STATUS:
+            tx[1:] = bytes((self.status,)) * (count - 1)
+        elif opcode == READ_JEDEC_ID:
+            jedec_id = self.jedec_id[:count - 1]
+            tx[1:1 + len(jedec_id)] = jedec_id
+        elif opcode == WRITE_STATUS:
+            if count != 2:
+                raise SpiFrameError(f"SpiNorFlash: expected a 16 bit WRITE_STATUS frame, got {num_bits}")
+            self._write_status(data[1])
+        elif opcode in _SINGLES:
+            if count != 1:
+                raise SpiFrameError("SpiNorFlash: received another clock edge when end of frame expected")
+            self._single(opcode)
+        else:
+            self.log.warning("SpiNorFlash: ignoring unsupported command %#04x", opcode)
+        return int.from_bytes(tx, 'big')
+
+    async def _transaction(self, frame_start, frame_end):
+        await frame_start
+        self.idle.clear()
+
+        opcode = await self._receive_byte()
+        if opcode is None:
+            # the chip select was asserted without any clock edge
+            return
+
+        if self.busy and opcode != READ_STATUS:
+            self.log.debug("SpiNorFlash: busy, ignoring command %#04x", opcode)
+            await frame_end
+        elif opcode in _ADDRESSED:
+            address_bytes, dummy = _ADDRESSED[opcode]
+            header = bytes((opcode,)) + await self._receive_bytes((address_bytes or self._address_bytes) + dummy)
+            address, _ = self._address(opcode, header)
+
+            if opcode in _READS:
+                await self._transmit(self._memory_chunks(address))
+            elif opcode in _PROGRAMS:
+                self._program(address, await self._receive_until_end())
+            else:
+                await self._end_of_command()
+                self._erase(address, _ERASES[opcode])
+        elif opcode == READ_STATUS:
+            await self._transmit(self._status_bytes())
+        elif opcode == READ_JEDEC_ID:
+            await self._transmit((self.jedec_id,))
+        elif opcode == WRITE_STATUS:
+            value = await self._receive_bytes(1)
+            await self._end_of_command()
+            self._write_status(value[0])
+        elif opcode in _SINGLES:
+            await self._end_of_command()
+            self._single(opcode)
+        else:
+            self.log.warning("SpiNorFlash: ignoring unsupported command %#04x", opcode)
+            await frame_end
+
+        self._miso.value = self._config.data_output_idle
+
+    def _memory_chunks(self, address: int) -> Iterator[bytes]:
+        """ The contents from address on, wrapping around at the end of the memory """
+        memory = self.memory
+        size = self.size
+        while True:
+            end = min(address + _READ_CHUNK, size)
+            yield memory[address:end]
+            address = end % size
+
+    def _address(self, opcode: int, data: bytes) -> Tuple[int, int]:
+        """ The address of a command, and the number of bytes up to the end of its dummy bytes """
+        address_bytes, dummy = _ADDRESSED[opcode]
+        address_bytes = address_bytes or self._address_bytes
+        header = 1 + address_bytes + dummy
+        if len(data) < header:
+            raise SpiFrameError("SpiNorFlash: end of frame before the end of the address")
+        return int.from_bytes(data[1:1 + address_bytes], 'big') % self.size, header
+
+    def _read(self, address: int, count: int) -> bytes:
+        """ count bytes from address on, wrapping around at the end of the memory """
+        memory = self.memory
+        end = address + count
+        if end <= self.size:
+            return memory[address:end]
+        data = bytearray(memory[address:])
+        while len(data) < count:
+            data += memory[:count - len(data)]
+        return bytes(data)
+
+    def _program(self, address: int, data: bytes) -> None:
+        """ Clear the bits written as 0, wrapping around within the page """
+        if not data or not self._start_write(self.page_program_ns):
+            return
+        page = address - address % PAGE_SIZE
+        offset = address % PAGE_SIZE
+        if len(data) > PAGE_SIZE:
+            # the address wraps around within the page, only the last page size bytes are programmed
+            offset = (offset + len(data) - PAGE_SIZE) % PAGE_SIZE
+            data = data[-PAGE_SIZE:]
+        memory = self.memory
+        for start, chunk in ((offset, data[:PAGE_SIZE - offset]), (0, data[PAGE_SIZE - offset:])):
+            if not chunk:
+                continue
+            begin, end = page + start, page + start + len(chunk)
+            old = int.from_bytes(memory[begin:end], 'big')
+            memory[begin:end] = (old & int.from_bytes(chunk, 'big')).to_bytes(len(chunk), 'big')
+
+    def _erase(self, address: int, size: int) -> None:
+        """ Set the size bytes aligned block holding address to 0xFF """
+        busy_ns = self.sector_erase_ns if size == SECTOR_SIZE else self.block_erase_ns
+        if self._start_write(busy_ns):
+            self._fill(address - address % size, min(size, self.size))
+
+    def _fill(self, start: int, count: int) -> None:
+        erased = b"\xff" * min(count, _FILL_CHUNK)
+        for offset in range(start, start + count, _FILL_CHUNK):
+            end = min(offset + _FILL_CHUNK, start + count)
+            self.memory[offset:end] = erased[:end - offset]
+
+    def _write_status(self, value: int) -> None:
+        if self._start_write(self.write_status_ns):
+            self._status = value & _STATUS_WRITABLE
+
+    def _single(self, opcode: int) -> None:
+        if opcode == WRITE_ENABLE:
+            self._write_enable = True
+        elif opcode == WRITE_DISABLE:
+            self._write_enable = False
+        elif opcode == ENTER_4B_MODE:
+            self._address_bytes = 4
+        elif opcode == EXIT_4B_MODE:
+            self._address_bytes = 3
+        elif self._start_write(self.chip_erase_ns):
+            self._fill(0, self.size)
@@ -0,0 +1,164 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: 2021 Spencer Chang
+# What the serial memory models share: shifting whole bytes, streaming reads, and WIP/WEL
+from typing import Dict
+from typing import FrozenSet
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import Optional
+
+from cocotb.utils import get_sim_time
+
+from ...exceptions import SpiFrameError
+from ...spi import _bit_masks
+from ...spi import SpiBus
+from ...spi import SpiConfig
+from ...spi import SpiSlaveBase
+
+# the status register bits every memory has
+STATUS_WIP = 0b0000_0001
+STATUS_WEL = 0b0000_0010
+
+_BYTE_MASKS = _bit_masks(8)
+
+
+class SpiMemoryBase(SpiSlaveBase):
+    """ The base of the memory models
+
+    A frame is an opcode, then bytes in and/or out until the chip select rises. The models run their
+    own byte loop rather than the _shift kernels, so that a frame can end on any byte boundary and a
+    read can stream its data straight after the address, in SPI mode 0 as well as 3. Writes set WEL
+    aside and WIP for a while, as a write cycle does.
+    """
+    # the opcodes by name for create_spi_command(), and the opcodes followed by an address
+    _operations: Dict[str, int] = {}
+    _addressed: FrozenSet[int] = frozenset()
+    # the number of address bytes, and the number of bytes of the memory
+    _address_bytes: int
+    size: int
+
+    def __init__(self, bus: SpiBus, config: Optional[SpiConfig] = None, *, target: int = 0):
+        if config is not None:
+            self._config = config
+        if self._config.ddr or not self._config.msb_first:
+            raise ValueError(f"{type(self).__name__}: expected a SDR, MSB first config")
+
+        # the status bits the model stores, without WIP and WEL
+        self._status = 0
+        self._write_enable = False
+        self._busy_until_ns = 0.0
+
+        super().__init__(bus, target=target)
+
+    def create_spi_command(self, operation: str, address: Optional[int] = None) -> List[int]:
+        """ The opcode of an operation and its address bytes, in the current address mode """
+        if operation not in self._operations:
+            raise ValueError(f"Expected operation to be in {list(self._operations)}")
+        opcode = self._operations[operation]
+        if opcode not in self._addressed:
+            return [opcode]
+        if address is None or not 0 <= address < self.size:
+            raise ValueError(f"Expected an address in [0, {self.size})")
+        count = self._address_bytes
+        return [opcode] + [(address >> (8 * (count - 1 - k))) & 0xFF for k in range(count)]
+
+    @property
+    def busy(self) -> bool:
+        return get_sim_time('ns') < self._busy_until_ns
+
+    @property
+    def status(self) -> int:
+        return self._status | (STATUS_WEL if self._write_enable else 0) | (STATUS_WIP if self.busy else 0)
+
+    def _start_write(self, busy_ns: float) -> bool:
+        """ Check and clear WEL, and set WIP for busy_ns; returns whether the write goes ahead """
+        if not self._write_enable:
+            self.log.debug("%s: ignoring a write without WRITE_ENABLE", type(self).__name__)
+            return False
+        self._write_enable = False
+        self._busy_until_ns = get_sim_time('ns') + busy_ns
+        return True
+
+    def _frame_bytes(self, frame: int, num_bits: int):
+        """ The bytes of a backdoor frame, and a buffer of idle MISO bytes as long to answer it with """
+        if num_bits < 8 or num_bits % 8:
+            raise SpiFrameError(f"{type(self).__name__}: expected a frame of 8n bits, got {num_bits}")
+        count = num_bits // 8
+        return frame.to_bytes(count, 'big'), bytearray(self._idle_bits(8).to_bytes(1, 'big') * count)
+
+    def _status_bytes(self) -> Iterator[bytes]:
+        """ The status register, over and over, as READ_STATUS streams it until the end of the frame """
+        while True:
+            yield bytes((self.status,))
+
+    async def _receive_byte(self) -> Optional[int]:
+        """ The next byte on MOSI, None if the frame ends before its first bit """
+        mosi, cs = self._mosi, self._cs
+        edge_or_frame_end = self._sclk_edge_or_frame_end
+        frame_end = self._frame_end
+        cs_inactive = self._cs_inactive
+        cpha = self._config.cpha
+
+        rx_byte = 0
+        for mask in _BYTE_MASKS:
+            # sample on the leading edge with CPHA=0, on the trailing edge with CPHA=1
+            if (await edge_or_frame_end) == frame_end or cs.value == cs_inactive:
+                if mask == 0x80:
+                    return None
+                raise SpiFrameError(f"{type(self).__name__}: end of frame in the middle of a byte")
+            if not cpha and mosi.value.integer:
+                rx_byte |= mask
+            if (await edge_or_frame_end) == frame_end or cs.value == cs_inactive:
+                raise SpiFrameError(f"{type(self).__name__}: end of frame in the middle of a byte")
+            if cpha and mosi.value.integer:
+                rx_byte |= mask
+        return rx_byte
+
+    async def _receive_bytes(self, count: int) -> bytearray:
+        """ The next count bytes on MOSI, the frame must not end before them """
+        data = bytearray()
+        for _ in range(count):
+            byte = await self._receive_byte()
+            if byte is None:
+                raise SpiFrameError(f"{type(self).__name__}: end of frame before the end of the command")
+            data.append(byte)
+        return data
+
+    async def _receive_until_end(self) -> bytearray:
+        """ The bytes on MOSI up to the end of the frame """
+        data = bytearray()
+        byte = await self._receive_byte()
+        while byte is not None:
+            data.append(byte)
+            byte = await self._receive_byte()
+        return data
+
+    async def _transmit(self, chunks: Iterable[bytes]) -> None:
+        """ Shift out the chunks on MISO, until the frame ends """
+        miso, cs = self._miso, self._cs
+        edge_or_frame_end = self._sclk_edge_or_frame_end
+        frame_end = self._frame_end
+        cs_inactive = self._cs_inactive
+        cpha = self._config.cpha
+
+        for chunk in chunks:
+            for byte in chunk:
+                for mask in _BYTE_MASKS:
+                    # propagate ahead of the leading edge with CPHA=0, on the leading edge with CPHA=1
+                    if not cpha:
+                        miso.value = bool(byte & mask)
+                    if (await edge_or_frame_end) == frame_end or cs.value == cs_inactive:
+                        return
+                    if cpha:
+                        miso.value = bool(byte & mask)
+                    if (await edge_or_frame_end) == frame_end or cs.value == cs_inactive:
+                        return
+
+        # nothing more to send, the master may go on clocking
+        miso.value = self._config.data_output_idle
+        await frame_end
+
+    async def _end_of_command(self) -> None:
+        if (await self._sclk_edge_or_frame_end) != self._frame_end and self._cs.value != self._cs_inactive:
+            raise SpiFrameError(f"{type(self).__name__}: received another clock edge when end of frame expected")
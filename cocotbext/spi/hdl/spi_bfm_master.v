@@ -0,0 +1,84 @@
+// SPDX-License-Identifier: MIT
+// SPI master bus functional model
+//
+// Clocks one word per handshake: Python sets tx_word, word_width and step_ps, then toggles req. The
+// word is shifted out in hardware and ack follows req once rx_word holds the received word, so the
+// Python side wakes up once per word instead of on every sclk edge.
+//
+// Between words, sclk and mosi follow sclk_in and mosi_in, which carry the levels the Python side
+// drives itself (idle levels, first bit with CPHA=0/DDR). At the end of a word, mosi goes to
+// mosi_next: the first bit of the next word when the clock keeps running, else the last bit.
+//
+// The edges mirror the SpiMaster kernels: step_ps is half a sclk period, or a quarter with DDR.
+`timescale 1ps / 1ps
+
+module spi_bfm_master #(
+    parameter MAX_WORD_WIDTH = 64
+) (
+    // levels driven from Python between words
+    input  wire                      sclk_in,
+    input  wire                      mosi_in,
+
+    // word handshake
+    input  wire [MAX_WORD_WIDTH-1:0] tx_word,
+    input  wire                      mosi_next,
+    output reg  [MAX_WORD_WIDTH-1:0] rx_word = {MAX_WORD_WIDTH{1'b0}},
+    input  wire [7:0]                word_width,
+    input  wire                      cpha,
+    input  wire                      ddr,
+    input  wire                      msb_first,
+    input  wire [31:0]               step_ps,
+    input  wire                      req,
+    output reg                       ack = 1'b0,
+
+    // spi pins
+    output reg                       sclk = 1'b0,
+    output reg                       mosi = 1'b1,
+    input  wire                      miso
+);
+
+    integer k;
+    reg sclk_idle;
+
+    // the position of the n-th bit on the wire in the word
+    function integer wire_bit(input integer n);
+        wire_bit = msb_first ? word_width - 1 - n : n;
+    endfunction
+
+    always @(sclk_in) if (req == ack) sclk = sclk_in;
+    always @(mosi_in) if (req == ack) mosi = mosi_in;
+
+    always @(req) begin
+        sclk_idle = sclk;
+        rx_word = {MAX_WORD_WIDTH{1'b0}};
+        for (k = 0; k < word_width; k = k + 1) begin
+            if (ddr) begin
+                // every edge samples, the next bit goes out in the middle between two edges
+                sclk = ~sclk;
+                rx_word[wire_bit(k)] = miso;
+                #(step_ps);
+                mosi = (k + 1 < word_width) ? tx_word[wire_bit(k + 1)] : mosi_next;
+                #(step_ps);
+            end else if (cpha) begin
+                // leading edge propagates, trailing edge samples
+                sclk = ~sclk_idle;
+                mosi = tx_word[wire_bit(k)];
+                #(step_ps);
+                sclk = sclk_idle;
+                rx_word[wire_bit(k)] = miso;
+                #(step_ps);
+            end else begin
+                // leading edge samples, trailing edge propagates
+                sclk = ~sclk_idle;
+                rx_word[wire_bit(k)] = miso;
+                #(step_ps);
+                sclk = sclk_idle;
+                mosi = (k + 1 < word_width) ? tx_word[wire_bit(k + 1)] : mosi_next;
+                #(step_ps);
+            end
+        end
+        mosi = mosi_next;
+        ack = req;
+    end
+
+endmodule // spi_bfm_master
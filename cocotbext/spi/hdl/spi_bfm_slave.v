@@ -0,0 +1,86 @@
+// SPDX-License-Identifier: MIT
+// SPI slave bus functional model
+//
+// Shifts one word per handshake: Python sets tx_word and word_width, then toggles req. The BFM
+// follows the sclk edges of the master, MSB first like SpiSlaveBase._shift, and ack follows req once
+// rx_word holds the received word. If the chip select is deasserted before the word is complete,
+// frame_error is set with ack.
+//
+// Between words, miso follows miso_in, which carries the levels the Python side drives itself (like
+// the first bit with CPHA=0). After a word, miso holds the last bit shifted out.
+`timescale 1ps / 1ps
+
+module spi_bfm_slave #(
+    parameter MAX_WORD_WIDTH = 64
+) (
+    // level driven from Python between words
+    input  wire                      miso_in,
+
+    // word handshake
+    input  wire [MAX_WORD_WIDTH-1:0] tx_word,
+    output reg  [MAX_WORD_WIDTH-1:0] rx_word = {MAX_WORD_WIDTH{1'b0}},
+    input  wire [7:0]                word_width,
+    input  wire                      cpha,
+    input  wire                      ddr,
+    input  wire                      cs_active_low,
+    input  wire                      req,
+    output reg                       ack = 1'b0,
+    output reg                       frame_error = 1'b0,
+
+    // spi pins
+    input  wire                      sclk,
+    input  wire                      mosi,
+    output reg                       miso = 1'b1,
+    input  wire                      cs
+);
+
+    integer k;
+
+    // wait for the next sclk edge, a chip select change can only be the end of the frame
+    task wait_edge;
+        begin
+            @(sclk or cs);
+            if (cs == cs_active_low)
+                frame_error = 1'b1;
+        end
+    endtask
+
+    always @(miso_in) if (req == ack) miso = miso_in;
+
+    always @(req) begin
+        // miso_in may have changed along with req, e.g. a first bit driven right before the word
+        miso = miso_in;
+        frame_error = 1'b0;
+        rx_word = {MAX_WORD_WIDTH{1'b0}};
+        for (k = word_width - 1; k >= 0 && !frame_error; k = k - 1) begin
+            if (ddr) begin
+                // every edge samples and shifts out
+                wait_edge;
+                if (!frame_error) begin
+                    rx_word[k] = mosi;
+                    miso = tx_word[k];
+                end
+            end else if (cpha) begin
+                // shift out on the first edge, sample on the second
+                wait_edge;
+                if (!frame_error)
+                    miso = tx_word[k];
+                if (!frame_error)
+                    wait_edge;
+                if (!frame_error)
+                    rx_word[k] = mosi;
+            end else begin
+                // sample on the first edge, shift out on the second
+                wait_edge;
+                if (!frame_error)
+                    rx_word[k] = mosi;
+                if (!frame_error)
+                    wait_edge;
+                if (!frame_error)
+                    miso = tx_word[k];
+            end
+        end
+        ack = req;
+    end
+
+endmodule // spi_bfm_slave
@@ -0,0 +1,309 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: 2021 Spencer Chang
+# Builds device models from register description files
+#
+# A device description is a JSON file:
+#
+#     {
+#         "name": "ADXL345",
+#         "config": {"word_width": 8, "cpol": true, "cpha": true, "frame_spacing_ns": 150},
+#         "frame": {"command_width": 8, "rw_bit": 7, "address_width": 6, "data_width": 8,
+#                   "auto_increment": "bit", "auto_increment_bit": 6},
+#         "registers": [
+#             {"name": "DEVID", "address": "0x00", "reset": "0xE5", "access": "ro"},
+#             {"name": "BW_RATE", "address": "0x2C", "reset": "0x0A", "fields": ["RATE[3:0]", "LOW_POWER[4]"]}
+#         ]
+#     }
+#
+# "config" holds SpiConfig arguments and "frame" SpiFrameLayout arguments. "registers" is either the
+# list of registers, or the path (relative to the description) of a CSV file with a name, address,
+# reset, access and fields column, the fields separated by spaces.
+import csv
+import json
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict
+from typing import Optional
+from typing import Tuple
+from typing import Type
+
+from .exceptions import SpiFrameError
+from .registers import READ_WRITE
+from .registers import SpiRegister
+from .registers import SpiRegisterDevice
+from .registers import SpiRegisterField
+from .spi import _bit_masks
+from .spi import reverse_word
+from .spi import SpiConfig
+
+# the auto-increment of the address after each data word of a frame
+AUTO_INCREMENT_NEVER = "never"
+AUTO_INCREMENT_ALWAYS = "always"
+# only when auto_increment_bit of the command is set
+AUTO_INCREMENT_BIT = "bit"
+
+
+@dataclass(frozen=True)
+class SpiFrameLayout:
+    """ The frames of a register based device: a command word, then one or more data words
+
+    The bit positions are counted from the LSB of the command word.
+    """
+    command_width: int
+    address_width: int
+    rw_bit: int
+    data_width: int = 8
+    address_lsb: int = 0
+    # the level of the R/W bit that makes the frame a read
+    read_level: int = 1
+    auto_increment: str = AUTO_INCREMENT_NEVER
+    auto_increment_bit: Optional[int] = None
+
+
+@lru_cache(maxsize=None)
+def _command_table(layout: SpiFrameLayout) -> Tuple[Tuple[bool, int, bool], ...]:
+    """ (read, address, auto-increment) for every command word, worked out once per layout """
+    if layout.command_width > 16:
+        raise ValueError("Expected a command word of at most 16 bits")
+    address_mask = (1 << layout.address_width) - 1
+    table = []
+    for command in range(1 << layout.command_width):
+        if layout.auto_increment == AUTO_INCREMENT_BIT:
+            increment = bool((command >> layout.auto_increment_bit) & 1)
+        else:
+            increment = layout.auto_increment == AUTO_INCREMENT_ALWAYS
+        table.append((
+            (command >> layout.rw_bit) & 1 == layout.read_level,
+            (command >> layout.address_lsb) & address_mask,
+            increment,
+        ))
+    return tuple(table)
+
+
+class SpiDescribedDevice(SpiRegisterDevice):
+    """ The base of the device models built by load_device(), driven by their SpiFrameLayout
+
+    Every frame is a command word followed by data words. MISO idles during the command, then
+    shifts out the register each data word addresses. A write stores the data words, with the
+    access semantics of the registers. Without auto-increment, a frame holds a single data word.
+    """
+    _frame_layout: SpiFrameLayout
+    _commands: Tuple[Tuple[bool, int, bool], ...]
+
+    def create_spi_command(self, operation: str, address: int, *, multibyte: bool = False) -> int:
+        layout = self._frame_layout
+        if operation not in ("read", "write"):
+            raise ValueError("Expected operation to be in ['read', 'write']")
+        self._registers.check(address)
+
+        level = layout.read_level if operation == "read" else 1 - layout.read_level
+        command = (level << layout.rw_bit) | (address << layout.address_lsb)
+        if multibyte:
+            if layout.auto_increment == AUTO_INCREMENT_NEVER:
+                raise ValueError(f"{type(self).__name__} has no multibyte access")
+            if layout.auto_increment == AUTO_INCREMENT_BIT:
+                command |= 1 << layout.auto_increment_bit
+        return command
+
+    def create_spi_word(self, operation: str, address: int, content: int = 0) -> int:
+        """ The command word and a single data word, as one word of command_width + data_width bits """
+        data_width = self._frame_layout.data_width
+        return (self.create_spi_command(operation, address) << data_width) | (content & ((1 << data_width) - 1))
+
+    def backdoor(self, frame: int, num_bits: int) -> int:
+        layout = self._frame_layout
+        command_width, data_width = layout.command_width, layout.data_width
+        count, rest = divmod(num_bits - command_width, data_width)
+        if count < 1 or rest:
+            raise SpiFrameError(
+                f"{type(self).__name__}: expected a frame of {command_width}+{data_width}n bits, got {num_bits}",
+            )
+        msb_first = self._config.msb_first
+
+        command = frame >> (num_bits - command_width)
+        if not msb_first:
+            command = reverse_word(command, command_width)
+        read, address, increment = self._commands[command]
+        if count > 1 and not increment:
+            raise SpiFrameError(f"{type(self).__name__}: received another data word when end of frame expected")
+
+        registers = self._registers
+        values = registers.values
+        mask = (1 << data_width) - 1
+        rx_frame = self._idle_bits(command_width)
+        for k in range(count):
+            tx_word = values[address]
+            rx_frame = (rx_frame << data_width) | (tx_word if msb_first else reverse_word(tx_word, data_width))
+            if not read:
+                word = (frame >> (data_width * (count - 1 - k))) & mask
+                registers.write(address, word if msb_first else reverse_word(word, data_width))
+            address = (address + 1) % len(values)
+        return rx_frame
+
+    async def _transaction(self, frame_start, frame_end):
+        await frame_start
+        self.idle.clear()
+
+        layout = self._frame_layout
+        config = self._config
+        registers = self._registers
+        values = registers.values
+        commands = self._commands
+        mosi, miso, cs = self._mosi, self._miso, self._cs
+        edge_or_frame_end = self._sclk_edge_or_frame_end
+        cs_inactive = self._cs_inactive
+        data_output_idle = config.data_output_idle
+        cpha = config.cpha
+        data_masks = _bit_masks(layout.data_width, config.msb_first)
+
+        # the word being shifted: its masks in wire order, the bits received so far and the word shifted out
+        masks = _bit_masks(layout.command_width, config.msb_first)
+        rx_word = 0
+        tx_word = None
+        k = 0
+        command = True
+        read = increment = False
+        address = 0
+
+        # with CPHA=0, the first bit goes out on the chip select edge
+        if not cpha:
+            miso.value = data_output_idle
+        while True:
+            if cpha:
+                # propagate on the leading edge, sample on the trailing edge
+                if (await edge_or_frame_end) == frame_end or cs.value == cs_inactive:
+                    break
+                miso.value = data_output_idle if tx_word is None else bool(tx_word & masks[k])
+                if (await edge_or_frame_end) == frame_end or cs.value == cs_inactive:
+                    raise SpiFrameError("End of frame in the middle of a transaction")
+                if mosi.value.integer:
+                    rx_word |= masks[k]
+            else:
+                # sample on the leading edge, propagate the next bit on the trailing edge
+                if (await edge_or_frame_end) == frame_end or cs.value == cs_inactive:
+                    break
+                if mosi.value.integer:
+                    rx_word |= masks[k]
+                if (await edge_or_frame_end) == frame_end or cs.value == cs_inactive:
+                    raise SpiFrameError("End of frame in the middle of a transaction")
+
+            k += 1
+            if k == len(masks):
+                if command:
+                    read, address, increment = commands[rx_word]
+                    command = False
+                    tx_word = values[address]
+                elif tx_word is None:
+                    raise SpiFrameError(f"{type(self).__name__}: received another data word when end of frame expected")
+                else:
+                    if not read:
+                        registers.write(address, rx_word)
+                    # the next data word, a frame without auto-increment has a single one
+                    if increment:
+                        address = (address + 1) % len(values)
+                        tx_word = values[address]
+                    else:
+                        tx_word = None
+                masks = data_masks
+                rx_word = 0
+                k = 0
+            if not cpha:
+                miso.value = data_output_idle if tx_word is None else bool(tx_word & masks[k])
+
+        if k:
+            raise SpiFrameError("End of frame in the middle of a transaction")
+        if command:
+            raise SpiFrameError(f"{type(self).__name__}: end of frame before the end of the command")
+        miso.value = data_output_idle
+
+
+def load_registers(path: str) -> Tuple[SpiRegister, ...]:
+    """ Read the registers from a CSV file, or from the list of registers of a JSON file """
+    with open(path, newline='') as f:
+        if path.endswith('.csv'):
+            rows = list(csv.DictReader(f))
+        else:
+            rows = json.load(f)
+            if isinstance(rows, dict):
+                rows = rows["registers"]
+    return tuple(_register(row) for row in rows)
+
+
+def load_device(path: str) -> Type[SpiDescribedDevice]:
+    """ Build the model of a device from its JSON description
+
+    The class, the decode table of its command words and its register map are built once per
+    file (until it is modified), so creating instances of the model costs no parsing.
+
+    Returns:
+        a SpiSlaveBase subclass, instantiated like the built-in models with a SpiBus
+    """
+    path = os.path.abspath(path)
+    return _load_device(path, os.stat(path).st_mtime_ns)
+
+
+@lru_cache(maxsize=None)
+def _load_device(path: str, mtime_ns: int) -> Type[SpiDescribedDevice]:
+    with open(path) as f:
+        description = json.load(f)
+
+    name = description.get("name") or os.path.splitext(os.path.basename(path))[0]
+    config = SpiConfig(**description.get("config", {}))
+    if config.ddr:
+        raise ValueError(f"{name}: DDR is not supported by the described devices")
+    layout = SpiFrameLayout(**{key: _number(value) for key, value in description["frame"].items()})
+    if layout.auto_increment not in (AUTO_INCREMENT_NEVER, AUTO_INCREMENT_ALWAYS, AUTO_INCREMENT_BIT):
+        raise ValueError(f"{name}: expected auto_increment to be in ['never', 'always', 'bit']")
+    if layout.auto_increment == AUTO_INCREMENT_BIT and layout.auto_increment_bit is None:
+        raise ValueError(f"{name}: auto_increment 'bit' needs an auto_increment_bit")
+
+    registers = description["registers"]
+    if isinstance(registers, str):
+        registers = load_registers(os.path.join(os.path.dirname(path), registers))
+    else:
+        registers = tuple(_register(row) for row in registers)
+
+    return type(name, (SpiDescribedDevice,), {
+        "__module__": __name__,
+        "__qualname__": name,
+        "__doc__": f"{name}, built from {os.path.basename(path)}",
+        "_config": config,
+        "_frame_layout": layout,
+        "_commands": _command_table(layout),
+        "_register_layout": registers,
+        "_register_width": _number(description.get("register_width", layout.data_width)),
+        "_register_space": 1 << layout.address_width,
+    })
+
+
+def _register(row: Dict) -> SpiRegister:
+    fields = row.get("fields") or ()
+    if isinstance(fields, str):
+        fields = fields.split()
+    return SpiRegister(
+        row["name"],
+        _number(row["address"]),
+        reset=_number(row.get("reset") or 0),
+        access=row.get("access") or READ_WRITE,
+        fields=tuple(_field(field) for field in fields),
+    )
+
+
+def _field(text: str) -> SpiRegisterField:
+    """ A field written as NAME[msb:lsb] or NAME[bit] """
+    name, _, bits = text.partition('[')
+    msb, _, lsb = bits.rstrip(']').partition(':')
+    if not lsb:
+        lsb = msb
+    return SpiRegisterField(name, int(lsb), int(msb) - int(lsb) + 1)
+
+
+def _number(value):
+    """ Numbers can be written as strings, e.g. '0x2C' or '0b1010' """
+    if isinstance(value, str):
+        try:
+            return int(value, 0)
+        except ValueError:
+            return value
+    return value
@@ -0,0 +1,225 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: 2021 Spencer Chang
+# Passively decodes the words on a bus, whoever drives it
+import logging
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable
+from typing import Deque
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+import cocotb
+from cocotb.triggers import Edge
+from cocotb.triggers import Event
+from cocotb.triggers import FallingEdge
+from cocotb.triggers import RisingEdge
+from cocotb.utils import get_sim_time
+
+from .spi import _bus_chip_selects
+from .spi import reverse_words
+from .spi import SpiBus
+from .spi import SpiConfig
+
+
+@dataclass
+class SpiFrame:
+    """ The words seen on the bus during one chip select assertion """
+    mosi: List[int]
+    miso: List[int]
+    # the number of bits clocked, bits after the last whole word are not part of mosi/miso
+    num_bits: int
+    start_time: float
+    end_time: float
+
+
+class SpiMonitor:
+    def __init__(
+        self,
+        bus: SpiBus,
+        config: SpiConfig,
+        *,
+        target: int = 0,
+        batch_size: int = 1,
+        callback: Optional[Callable[[List[SpiFrame]], None]] = None,
+    ) -> None:
+        """ Reconstructs the MOSI/MISO words of every frame on a bus, without driving anything
+
+        Only the capture edges of sclk are waited on, and the chip select edges to delimit the frames,
+        so the monitor costs a single wake-up per bit. The frames are handed over batch_size at a time,
+        to the callback if there is one, else to the queue read with recv().
+
+        Args:
+            bus: the SpiBus to observe
+            config: the SpiConfig the bus is clocked with
+            target: the chip select to observe, on a bus with several of them
+            batch_size: the number of frames collected before they are handed over
+            callback: called with every batch of frames, instead of queueing them
+        """
+        self.log = logging.getLogger(f"cocotb.{bus.sclk._path}")
+
+        self._sclk = bus.sclk
+        self._mosi = bus.mosi
+        self._miso = bus.miso
+        chip_selects = _bus_chip_selects(bus)
+        if not 0 <= target < len(chip_selects):
+            raise ValueError(f"Expected target to be in range({len(chip_selects)})")
+        self._cs, self._cs_bit = chip_selects[target]
+
+        self.batch_size = batch_size
+        self.callback = callback
+        self.queue: Deque[SpiFrame] = deque()
+        self._batch: List[SpiFrame] = []
+        self._queue_sync = Event()
+
+        self._active = False
+        self._start_time = 0.0
+
+        self._config = config
+        self._bits_coroutine_obj = None
+        self._configure()
+        self._frames_coroutine_obj = cocotb.start_soon(self._run_frames())
+
+    def reconfigure(self, config: SpiConfig) -> None:
+        """ Follow the bus over to a new SpiConfig, best done between frames """
+        self._config = config
+        self._configure()
+
+    def _configure(self) -> None:
+        config = self._config
+        # the words of the current frame
+        self._words = _FrameWords(config)
+        self._cs_inactive = int(config.cs_active_low)
+        if config.ddr:
+            # with DDR, every edge is a capture edge
+            self._capture_edge = Edge(self._sclk)
+        elif config.cpol == config.cpha:
+            self._capture_edge = RisingEdge(self._sclk)
+        else:
+            self._capture_edge = FallingEdge(self._sclk)
+
+        if self._bits_coroutine_obj is not None:
+            self._bits_coroutine_obj.kill()
+        self._bits_coroutine_obj = cocotb.start_soon(self._run_bits())
+
+    async def recv(self) -> SpiFrame:
+        while not self.queue:
+            self._queue_sync.clear()
+            await self._queue_sync.wait()
+        return self.queue.popleft()
+
+    def recv_nowait(self) -> SpiFrame:
+        return self.queue.popleft()
+
+    def count(self) -> int:
+        return len(self.queue)
+
+    def empty(self) -> bool:
+        return not self.queue
+
+    def clear(self) -> None:
+        """ Drops the queued frames, and the frames of the batch that has not been handed over yet """
+        self.queue.clear()
+        self._batch.clear()
+
+    def flush(self) -> None:
+        """ Hand over the frames collected so far, without waiting for a whole batch """
+        if not self._batch:
+            return
+        batch, self._batch = self._batch, []
+        if self.callback is not None:
+            self.callback(batch)
+        else:
+            self.queue.extend(batch)
+            self._queue_sync.set()
+
+    def _asserted(self) -> bool:
+        # an undriven chip select (X/Z) reads as deasserted
+        try:
+            level = self._cs.value.integer
+        except ValueError:
+            return False
+        if self._cs_bit is not None:
+            level = (level >> self._cs_bit) & 1
+        return level != self._cs_inactive
+
+    async def _run_bits(self):
+        capture_edge = self._capture_edge
+        mosi, miso = self._mosi, self._miso
+        add = self._words.add
+        while True:
+            await capture_edge
+            if not self._active:
+                continue
+            # an undriven line (X/Z) reads as 0
+            try:
+                mosi_bit = mosi.value.integer
+            except ValueError:
+                mosi_bit = 0
+            try:
+                miso_bit = miso.value.integer
+            except ValueError:
+                miso_bit = 0
+            add(mosi_bit, miso_bit)
+
+    async def _run_frames(self):
+        cs_edge = Edge(self._cs)
+        while True:
+            await cs_edge
+            asserted = self._asserted()
+            if asserted and not self._active:
+                self._words.reset()
+                self._start_time = get_sim_time('ns')
+            elif self._active and not asserted:
+                self._end_frame()
+            self._active = asserted
+
+    def _end_frame(self) -> None:
+        words = self._words
+        num_bits = words.num_bits
+        if words.word_bits:
+            self.log.warning("Frame ended %d bits into a word", words.word_bits)
+        mosi, miso = words.words()
+
+        self._batch.append(SpiFrame(mosi, miso, num_bits, self._start_time, get_sim_time('ns')))
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+
+class _FrameWords:
+    """ Collects the bits of a frame into MOSI and MISO words, a word at a time
+
+    Only the word in progress is held as an int, each whole word goes to a list, so a bit costs the
+    same however long the frame is.
+    """
+    __slots__ = ('width', 'msb_first', 'mosi', 'miso', 'mosi_word', 'miso_word', 'word_bits', 'num_bits')
+
+    def __init__(self, config: SpiConfig) -> None:
+        self.width = config.word_width
+        self.msb_first = config.msb_first
+        self.reset()
+
+    def reset(self) -> None:
+        self.mosi: List[int] = []
+        self.miso: List[int] = []
+        # the bits of the word in progress in wire order, the first one ends up in the MSB
+        self.mosi_word = self.miso_word = 0
+        self.word_bits = 0
+        self.num_bits = 0
+
+    def add(self, mosi_bit: int, miso_bit: int) -> None:
+        self.mosi_word = (self.mosi_word << 1) | mosi_bit
+        self.miso_word = (self.miso_word << 1) | miso_bit
+        self.num_bits += 1
+        self.word_bits += 1
+        if self.word_bits == self.width:
+            self.mosi.append(self.mosi_word)
+            self.miso.append(self.miso_word)
+            self.mosi_word = self.miso_word = self.word_bits = 0
+
+    def words(self) -> Tuple[List[int], List[int]]:
+        """ The whole words of the frame, the bits after the last one are dropped """
+        if self.msb_first:
+            return self.mosi, self.miso
+        return reverse_words(self.mosi, self.width), reverse_words(self.miso, self.width)
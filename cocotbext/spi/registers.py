@@ -0,0 +1,203 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: 2021 Spencer Chang
+# Declarative register maps for the device models, stored in flat arrays indexed by address
+from array import array
+from dataclasses import dataclass
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+
+from .bfm import SpiSlaveBfm
+from .spi import _word_typecode
+from .spi import SpiBus
+from .spi import SpiSlaveBase
+
+READ_WRITE = "rw"
+READ_ONLY = "ro"
+# the bits written as 1 are cleared, the bits written as 0 are left alone
+WRITE_1_TO_CLEAR = "w1c"
+
+
+@dataclass(frozen=True)
+class SpiRegisterField:
+    """ A bit field of a register, width bits from bit lsb up """
+    name: str
+    lsb: int
+    width: int = 1
+
+
+@dataclass(frozen=True)
+class SpiRegister:
+    """ The declaration of one register of a device model """
+    name: str
+    address: int
+    reset: int = 0
+    access: str = READ_WRITE
+    fields: Tuple[SpiRegisterField, ...] = ()
+
+
+class SpiRegisterMap:
+    def __init__(self, registers: Iterable[SpiRegister], *, word_width: int, size: Optional[int] = None) -> None:
+        """ The registers of a device, stored in an array indexed by address
+
+        Everything that depends on the declarations (the masks of the access semantics, and the masks
+        and shifts of the fields) is worked out here once, so reading a register is an array index and
+        a write a few bitwise operations. Addresses with no register declared read as 0 and ignore writes.
+
+        Args:
+            registers: the declarations of the registers
+            word_width: the number of bits of each register
+            size: the number of addresses of the device, by default up to the last declared register
+        """
+        self.registers: Tuple[SpiRegister, ...] = tuple(sorted(registers, key=lambda register: register.address))
+        self.word_width = word_width
+        mask = (1 << word_width) - 1
+        if size is None:
+            size = self.registers[-1].address + 1 if self.registers else 0
+        typecode = _word_typecode(word_width)
+
+        self._reset = array(typecode, bytes(size * array(typecode).itemsize))
+        # the bits an SPI write stores, and the bits it clears when written as 1
+        self._write_mask = array(typecode, self._reset)
+        self._clear_mask = array(typecode, self._reset)
+        self._by_name: Dict[str, int] = {}
+        # name: (address, shift, mask)
+        self._fields: Dict[str, Tuple[int, int, int]] = {}
+        used = set()
+        for register in self.registers:
+            address = register.address
+            if not 0 <= address < size:
+                raise ValueError(f"Register {register.name} at {address:#x} is outside of the {size} addresses")
+            if register.name in self._by_name:
+                raise ValueError(f"Register {register.name} is declared twice")
+            if address in used:
+                raise ValueError(f"Several registers are declared at {address:#x}")
+            used.add(address)
+            if register.access not in (READ_WRITE, READ_ONLY, WRITE_1_TO_CLEAR):
+                raise ValueError(f"Expected the access of {register.name} to be in ['rw', 'ro', 'w1c']")
+            self._by_name[register.name] = address
+            self._reset[address] = register.reset & mask
+            if register.access == READ_WRITE:
+                self._write_mask[address] = mask
+            elif register.access == WRITE_1_TO_CLEAR:
+                self._clear_mask[address] = mask
+            for field in register.fields:
+                if field.name in self._fields:
+                    raise ValueError(f"Field {field.name} is declared twice")
+                if field.lsb + field.width > word_width:
+                    raise ValueError(f"Field {field.name} does not fit in {word_width} bits")
+                self._fields[field.name] = (address, field.lsb, (1 << field.width) - 1)
+        self._defined = frozenset(used)
+
+        # the current values, models index it directly in their hot paths
+        self.values = array(typecode, self._reset)
+        self._mask = mask
+
+    def copy(self) -> 'SpiRegisterMap':
+        """ A map with the same declarations and its own copy of the values, without working them out again """
+        registers = object.__new__(SpiRegisterMap)
+        registers.__dict__.update(self.__dict__)
+        registers.values = array(self.values.typecode, self.values)
+        return registers
+
+    def __getitem__(self, address: int) -> int:
+        return self.values[address]
+
+    def __setitem__(self, address: int, value: int) -> None:
+        """ Store a value as the device itself would, whatever the access of the register """
+        self.values[address] = value & self._mask
+
+    def __contains__(self, address: int) -> bool:
+        return address in self._defined
+
+    def __len__(self) -> int:
+        return len(self.registers)
+
+    @property
+    def addresses(self) -> List[int]:
+        return [register.address for register in self.registers]
+
+    def address(self, name: str) -> int:
+        return self._by_name[name]
+
+    def check(self, address: int) -> None:
+        """ Raises a ValueError for an address with no register """
+        if address not in self._defined:
+            raise ValueError(f"Expected address to be in {self.addresses}")
+
+    def write(self, address: int, value: int) -> None:
+        """ Apply a write from the bus, with the access semantics of the register """
+        old = self.values[address]
+        write_mask = self._write_mask[address]
+        self.values[address] = (old & ~write_mask | value & write_mask) & ~(value & self._clear_mask[address])
+
+    def read_block(self, address: int, count: int) -> List[int]:
+        """ Read count registers from address on, the address incrementing and wrapping around """
+        size = len(self.values)
+        end = address + count
+        if end <= size:
+            return self.values[address:end].tolist()
+        return [self.values[k % size] for k in range(address, end)]
+
+    def write_block(self, address: int, words: Iterable[int]) -> None:
+        """ Apply writes from the bus to consecutive registers, the address incrementing and wrapping around """
+        size = len(self.values)
+        for k, word in enumerate(words):
+            self.write((address + k) % size, word)
+
+    def get_field(self, name: str) -> int:
+        address, shift, mask = self._fields[name]
+        return (self.values[address] >> shift) & mask
+
+    def set_field(self, name: str, value: int) -> None:
+        """ Store the value of a field as the device itself would, whatever the access of the register """
+        address, shift, mask = self._fields[name]
+        self.values[address] = self.values[address] & ~(mask << shift) | (value & mask) << shift
+
+    def snapshot(self) -> array:
+        """ A copy of all the values, indexed by address, to compare or restore later """
+        return array(self.values.typecode, self.values)
+
+    def restore(self, snapshot: Sequence[int]) -> None:
+        self.values[:] = array(self.values.typecode, snapshot)
+
+    def reset(self) -> None:
+        self.values[:] = self._reset
+
+    def as_dict(self) -> Dict[str, int]:
+        """ The values of all the registers, by name """
+        return {register.name: self.values[register.address] for register in self.registers}
+
+
+class SpiRegisterDevice(SpiSlaveBase):
+    """ The base of the device models with a register map
+
+    A model declares its registers in _register_layout, along with the width of the registers and
+    the number of addresses of the device, and finds them in self._registers, an SpiRegisterMap.
+    The map is worked out once per class, each instance starts from a copy of it.
+    """
+    _register_layout: Sequence[SpiRegister] = ()
+    _register_width: int = 8
+    _register_space: Optional[int] = None
+
+    def __init__(self, bus: SpiBus, bfm: Optional[SpiSlaveBfm] = None, *, target: int = 0):
+        cls = type(self)
+        template = cls.__dict__.get('_register_template')
+        if template is None:
+            template = SpiRegisterMap(self._register_layout, word_width=self._register_width, size=self._register_space)
+            cls._register_template = template
+        self._registers = template.copy()
+        super().__init__(bus, bfm, target=target)
+
+    async def get_register(self, reg_num: int, *, timeout_ns: Optional[float] = None) -> int:
+        await self.wait(timeout_ns=timeout_ns)
+        self._registers.check(reg_num)
+        return self._registers[reg_num]
+
+    async def get_registers(self, *, timeout_ns: Optional[float] = None) -> Dict[str, int]:
+        """ The values of all the registers by name, once the current frame is over """
+        await self.wait(timeout_ns=timeout_ns)
+        return self._registers.as_dict()
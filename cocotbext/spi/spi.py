@@ -1,26 +1,47 @@
 # SPDX-License-Identifier: MIT
 # SPDX-FileCopyrightText: 2021 Spencer Chang
 import logging
+import sys
+import time
 from abc import ABC
 from abc import abstractmethod
+from array import array
 from collections import deque
 from dataclasses import dataclass
+from dataclasses import field
+from functools import lru_cache
+from itertools import repeat
+from typing import AsyncIterable
 from typing import Deque
+from typing import Dict
 from typing import Iterable
+from typing import List
 from typing import Optional
+from typing import Sequence
 from typing import Tuple
+from typing import Union
 
 import cocotb
-from cocotb.clock import BaseClock
+from cocotb.queue import QueueFull
+from cocotb.result import SimTimeoutError
 from cocotb.triggers import Edge
 from cocotb.triggers import Event
 from cocotb.triggers import FallingEdge
 from cocotb.triggers import First
+from cocotb.triggers import Lock
 from cocotb.triggers import RisingEdge
 from cocotb.triggers import Timer
+from cocotb.triggers import with_timeout
+from cocotb.utils import get_sim_steps
+from cocotb.utils import get_sim_time
+from cocotb.utils import get_time_from_sim_steps
 from cocotb_bus.bus import Bus
 
+from .bfm import SpiMasterBfm
+from .bfm import SpiSlaveBfm
 from .exceptions import SpiFrameError
+from .exceptions import SpiFrameTimeout
+from .stats import SpiBusStats
 
 
 class SpiBus(Bus):
@@ -32,13 +53,24 @@ class SpiBus(Bus):
         mosi_name='mosi',
         miso_name='miso',
         cs_name=None,
+        io0_name=None,
+        io1_name=None,
+        io2_name=None,
+        io3_name=None,
         **kwargs,
     ):
         signals = {'sclk': sclk_name, 'mosi': mosi_name, 'miso': miso_name}
         if cs_name is None:
             optional_signals = {}
-        else:
+        elif isinstance(cs_name, str):
             optional_signals = {'cs': cs_name}
+        else:
+            # several chip selects, one per target of a SpiMaster
+            optional_signals = {f'cs{k}': name for k, name in enumerate(cs_name)}
+
+        # dual/quad spi lanes, io0 and io1 default to the mosi and miso signals when not named
+        io_names = (io0_name, io1_name, io2_name, io3_name)
+        optional_signals.update({f'io{k}': name for k, name in enumerate(io_names) if name is not None})
         super().__init__(entity, prefix, signals, optional_signals=optional_signals, **kwargs)
 
     @classmethod
@@ -60,122 +92,731 @@ class SpiConfig:
     data_output_idle: int = 1
     ignore_rx_value: Optional[int] = None
     cs_active_low: bool = True
+    ddr: bool = False
+
+
+@dataclass
+class SpiTransfer:
+    """ One segment of an SpiMessage, modeled on the Linux kernel spi_transfer
+
+    Any option left as None falls back to the master SpiConfig. With lanes=1 the segment is
+    full duplex on mosi/miso. With lanes=2 or 4 (dual/quad spi) it is half duplex on io0..io3:
+    the master drives the lanes when tx is given, and samples them for length words otherwise
+    (which is also how dummy cycles are clocked).
+    """
+    tx: Optional[Sequence[int]] = None
+    length: int = 0
+    lanes: int = 1
+    word_width: Optional[int] = None
+    sclk_freq: Optional[float] = None
+    cs_change: bool = False
+    word_delay_ns: int = 0
+    delay_ns: int = 0
+    rx: List[int] = field(default_factory=list)
+
+
+class SpiMessage:
+    """ A chain of SpiTransfer segments clocked under a single chip select assertion,
+    modeled on the Linux kernel spi_message
+    """
+    def __init__(self, transfers: Iterable[SpiTransfer]) -> None:
+        self.transfers: List[SpiTransfer] = list(transfers)
+        self.target = 0
+        self.done = Event()
+        # the sim time it was queued at, kept only by a master with stats
+        self.queued_ns: Optional[float] = None
+
+    async def wait(self) -> 'SpiMessage':
+        await self.done.wait()
+        return self
+
+    def __await__(self):
+        return self.wait().__await__()
+
+
+class SpiTransaction:
+    """ The handle of the words queued by one write() or xfer()
+
+    Awaiting it gives the words received while they were clocked, exactly one per word sent, whatever
+    the ignore_rx_value. If the TX queue is cleared first, it resolves with the words received so far.
+    """
+    def __init__(self, length: int, target: int = 0, *, to_rx_queue: bool = True) -> None:
+        self.length = length
+        self.target = target
+        # write() also hands the words to the RX queue, xfer() only to the handle
+        self.to_rx_queue = to_rx_queue
+        self.rx: List[int] = []
+        self.done = Event()
+        # the sim time it was queued at, kept only by a master with stats
+        self.queued_ns: Optional[float] = None
+        if not length:
+            self.done.set()
+
+    async def wait(self) -> List[int]:
+        await self.done.wait()
+        return self.rx
+
+    def __await__(self):
+        return self.wait().__await__()
+
+
+@dataclass
+class SpiProfile:
+    """ Counters of the time an SpiMaster or SpiSlaveBase spends on the frames it clocks
+
+    A master counts every frame it clocks (on the wire or through a backdoor), a slave every frame
+    its _transaction handles. One SpiProfile can be shared by several instances to add them up.
+    """
+    # chip select frames, and the bits clocked during them (for a slave, the bits its _transaction
+    # shifts with the _shift helpers)
+    frames: int = 0
+    bits: int = 0
+    # the triggers awaited, each one is a wake-up by the simulator
+    awaits: int = 0
+    # the wall-clock time spent running the Python code of _run (master) or _transaction (slave),
+    # not counting the time spent in the simulator or in other coroutines
+    wall_s: float = 0.0
+    # the sim time from the start to the end of the frames
+    sim_ns: float = 0.0
+
+    @property
+    def awaits_per_frame(self) -> float:
+        return self.awaits / self.frames if self.frames else 0.0
+
+    @property
+    def sim_ns_per_frame(self) -> float:
+        return self.sim_ns / self.frames if self.frames else 0.0
+
+    @property
+    def wall_ns_per_bit(self) -> float:
+        return self.wall_s * 1e9 / self.bits if self.bits else 0.0
+
+    def reset(self) -> None:
+        self.frames = self.bits = self.awaits = 0
+        self.wall_s = self.sim_ns = 0.0
 
 
 class SpiMaster:
-    def __init__(self, bus: SpiBus, config: SpiConfig) -> None:
+    def __init__(
+        self,
+        bus: SpiBus,
+        config: Union[SpiConfig, Sequence[SpiConfig]],
+        *,
+        bfm: Optional[SpiMasterBfm] = None,
+        tx_queue_limit: int = 0,
+        rx_queue_limit: int = 0,
+        timeout_ns: Optional[float] = None,
+        profile: Optional[SpiProfile] = None,
+        stats: Optional[SpiBusStats] = None,
+    ) -> None:
+        """
+        Args:
+            bus: the SpiBus, its chip selects (several cs signals, or one cs vector) are the targets
+            config: the SpiConfig shared by every target, or a sequence with one SpiConfig per target
+            bfm: a spi_bfm_master instance driving sclk and mosi, which then shifts the words in the simulator
+            tx_queue_limit: the number of words the TX queue holds before writers have to wait, 0 for no limit
+            rx_queue_limit: the number of words the RX queue holds before the master stops clocking, 0 for no limit.
+                A backdoor frame is applied whole once the RX queue has room, so it can go over the limit by
+                the rest of that frame
+            timeout_ns: the default timeout of the blocking calls, after which they raise SpiFrameTimeout,
+                None to wait forever
+            profile: a SpiProfile the master counts its frames, bits, trigger awaits and time into,
+                None (the default) to run without any instrumentation. It can also be assigned later,
+                it takes over once the master is idle
+            stats: a SpiBusStats the master records the latency and timing of its frames into
+        """
         self.log = logging.getLogger(f"cocotb.{bus.sclk._path}")
 
         # spi signals
         self._sclk = bus.sclk
         self._mosi = bus.mosi
         self._miso = bus.miso
-        self.has_cs = hasattr(bus, 'cs')
-        if self.has_cs:
-            self._cs = bus.cs
-
-        # size of a transfer
-        self._config = config
-
-        self.queue_tx: Deque[Tuple[int, bool]] = deque()
+        chip_selects = _bus_chip_selects(bus)
+        self.has_cs = bool(chip_selects)
+        self._io = _bus_lanes(bus)
+
+        # with a BFM, the levels driven from Python go to its pass-through inputs instead of the pins
+        self._bfm = bfm
+        if bfm is not None:
+            self._sclk = bfm.sclk_in
+            self._mosi = bfm.mosi_in
+            self._io = tuple(self._mosi if lane is bus.mosi else lane for lane in self._io)
+            self._bfm_ack = Edge(bfm.ack)
+            self._bfm_req = 0
+            bfm.req.setimmediatevalue(0)
+
+        # one config per target, a single config is shared by all of them
+        configs = [config] if isinstance(config, SpiConfig) else list(config)
+        if len(configs) == 1:
+            configs *= max(1, len(chip_selects))
+        if len(configs) != max(1, len(chip_selects)):
+            raise ValueError(f"Expected one SpiConfig per chip select ({len(chip_selects)}), got {len(configs)}")
+        self._configs = configs
+        self._chip_selects = chip_selects
+        self._cs_levels = _cs_levels(chip_selects, configs)
+
+        # (word, burst, target, transaction), a buffer is queued as one memoryview block of words and
+        # a transfer chain as its SpiMessage, without a transaction
+        self.queue_tx: Deque[
+            Tuple[Union[int, memoryview, SpiMessage], bool, int, Optional[SpiTransaction]]
+        ] = deque()
         self.queue_rx: Deque[int] = deque()
+        # the number of words in queue_tx, a block counts all of its words and a message counts as one
+        self._tx_count = 0
+
+        # with a limit, writers wait for _tx_dequeue and the engine for _rx_dequeue
+        self.tx_queue_limit = tx_queue_limit
+        self.rx_queue_limit = rx_queue_limit
+        self._tx_dequeue = Event()
+        self._rx_dequeue = Event()
+        # held by a writer queueing its words a part at a time, so that writers do not interleave
+        self._tx_lock = Lock()
+
+        self.timeout_ns = timeout_ns
+        # the profile the engine runs with is only swapped while it is idle, see the profile setter
+        self._profile = profile
+        self._run_profile = None
+        self._profile_restart = None
+        self.stats = stats
 
         self.sync = Event()
 
         self._idle = Event()
         self._idle.set()
 
-        self._sclk.setimmediatevalue(int(self._config.cpol))
-        self._mosi.setimmediatevalue(self._config.data_output_idle)
-        if self.has_cs:
-            self._cs.setimmediatevalue(1 if self._config.cs_active_low else 0)
+        # device models the words of a target are applied to in zero sim time, instead of the wire
+        self._backdoors: List[Optional[SpiSlaveBase]] = [None] * len(configs)
 
-        self._SpiClock = _SpiClock(
-            signal=self._sclk,
-            period=(1 / self._config.sclk_freq),
-            units="sec",
-            start_high=self._config.cpha,
-        )
+        self._sclk_timer_cache: Dict[float, Tuple[Timer, Timer, Timer]] = {}
+        self._step_ps: Dict[Timer, int] = {}
+        self._lane_masks_cache: Dict[Tuple, Tuple] = {}
+        self._select(0)
+
+        self._sclk.setimmediatevalue(self._sclk_idle)
+        self._mosi.setimmediatevalue(self._config.data_output_idle)
+        for cs, _, cs_inactive in self._cs_levels:
+            cs.setimmediatevalue(cs_inactive)
 
         self._run_coroutine_obj = None
         self._restart()
 
+    async def reconfigure(self, config: SpiConfig, *, target: int = 0, timeout_ns: Optional[float] = None) -> None:
+        """ Change the config of a target between transactions, without restarting the master
+
+        Waits for everything already queued to be clocked out with the old config first. Mode,
+        word width, sclk frequency, bit order and chip select polarity can all be changed.
+
+        Args:
+            config: the new SpiConfig
+            target: the chip select the config is for
+            timeout_ns: overrides the timeout_ns of the master for this call
+        """
+        self._check_target(target)
+        await self._deadline(self._idle.wait(), timeout_ns, "the TX queue to drain")
+
+        self._configs[target] = config
+        self._cs_levels = _cs_levels(self._chip_selects, self._configs)
+        self._select(self._target)
+
+        # move the idle levels over to the new config
+        self._sclk.value = self._sclk_idle
+        self._mosi.value = self._config.data_output_idle
+        for cs, _, cs_inactive in self._cs_levels:
+            cs.value = cs_inactive
+
+    def set_backdoor(self, model: Optional['SpiSlaveBase'], *, target: int = 0) -> None:
+        """ Apply the frames for a target straight to a device model, in zero sim time (fast mode)
+
+        The words are handed to model.backdoor() one chip select frame at a time, so the model goes
+        through the same state changes as on the wire, but nothing is clocked on the bus. Pass None
+        to go back to clocking the target on the wire. Dual/quad transfer chains are always clocked.
+        A frame is only started once the RX queue has room, but its words all go to the RX queue, even
+        past the rx_queue_limit.
+
+        Args:
+            model: the device model that sits on the chip select, or None
+            target: the chip select to address
+        """
+        self._check_target(target)
+        self._backdoors[target] = model
+
+    def _select(self, target: int) -> None:
+        """ Make target the one the engine clocks, with its chip select and config """
+        self._target = target
+        self._config = self._configs[target]
+        if self.has_cs:
+            self._cs, self._cs_active, self._cs_inactive = self._cs_levels[target]
+        self._configure()
+
+    def _configure(self) -> None:
+        """ Specialize the bit-level engine for the current config
+
+        Everything the per-bit loop needs (sclk levels, timers, bit masks in wire order and
+        the CPHA dependent kernel) is worked out here once instead of on every bit.
+        """
+        config = self._config
+
+        self._sclk_idle = int(config.cpol)
+        self._sclk_active = int(not config.cpol)
+
+        self._sclk_period, self._sclk_half_period, self._sclk_quarter_period = self._sclk_timers(config.sclk_freq)
+
+        # with CPHA=0 or DDR, the first bit of a word goes on the wire ahead of the first edge
+        self._drive_first = config.ddr or not config.cpha
+        # the kernels wait one step per edge, except DDR which also steps to the middle of each bit
+        self._sclk_step = self._sclk_quarter_period if config.ddr else self._sclk_half_period
+        if self._bfm is not None:
+            if config.word_width > len(self._bfm.tx_word):
+                raise ValueError(f"The BFM shifts at most {len(self._bfm.tx_word)} bits per word")
+            self._bfm.cpha.value = int(config.cpha)
+            self._bfm.ddr.value = int(config.ddr)
+            self._bfm.msb_first.value = int(config.msb_first)
+
+        if config.ddr:
+            self._xfer_word = self._xfer_word_ddr
+            self._xfer_lanes = self._xfer_lanes_ddr
+        elif config.cpha:
+            self._xfer_word = self._xfer_word_cpha1
+            self._xfer_lanes = self._xfer_lanes_cpha1
+        else:
+            self._xfer_word = self._xfer_word_cpha0
+            self._xfer_lanes = self._xfer_lanes_cpha0
+        if self._bfm is not None:
+            self._xfer_word = self._xfer_word_bfm
+
+        # the bit order is handled by the mask order, so words never have to be reversed
+        self._word_masks = self._kernel_masks(config.word_width)
+        self._first_mask = _bit_masks(config.word_width, config.msb_first)[0]
+
+    def _sclk_timers(self, sclk_freq: float) -> Tuple[Timer, Timer, Timer]:
+        """ The (period, half period, quarter period) timers for a sclk frequency, built once per frequency """
+        try:
+            return self._sclk_timer_cache[sclk_freq]
+        except KeyError:
+            steps = [get_sim_steps(1 / (div * sclk_freq), 'sec', round_mode='round') for div in (1, 2, 4)]
+            timers = tuple(Timer(step, units='step') for step in steps)
+            self._sclk_timer_cache[sclk_freq] = timers
+            # the BFM waits in ps, whatever the simulator precision
+            for timer, step in zip(timers, steps):
+                self._step_ps[timer] = round(get_time_from_sim_steps(step, 'ps'))
+            return timers
+
+    def _kernel_masks(self, word_width: int) -> Tuple:
+        """ The mask table the word kernel iterates over for a word width """
+        if self._config.ddr:
+            return _ddr_masks(word_width, self._config.msb_first, self._config.cpol)
+        if self._config.cpha:
+            return _bit_masks(word_width, self._config.msb_first)
+        return _propagate_masks(word_width, self._config.msb_first)
+
+    def _lane_masks(self, word_width: int, lanes: int) -> Tuple:
+        """ The table the dual/quad kernel iterates over: one group of (lane, mask) per sclk cycle """
+        config = self._config
+        key = (word_width, lanes, config.msb_first, config.cpha, config.cpol, config.ddr)
+        try:
+            return self._lane_masks_cache[key]
+        except KeyError:
+            groups = _lane_groups(self._io, word_width, lanes, config.msb_first)
+            if config.ddr:
+                groups = tuple(zip(_ddr_levels(len(groups), config.cpol), groups, groups[1:] + ((),)))
+            elif not config.cpha:
+                groups = tuple(zip(groups, groups[1:] + ((),)))
+            self._lane_masks_cache[key] = groups
+            return groups
+
+    def _first_drive(self, tx_word: Optional[int], word_width: int, lanes: int) -> Optional[Tuple]:
+        """ The (signal, value) pairs to put on the wire before the first edge of a word (CPHA=0 or DDR) """
+        if tx_word is None:
+            return None
+        if lanes == 1:
+            return ((self._mosi, bool(tx_word & _bit_masks(word_width, self._config.msb_first)[0])),)
+        return tuple((lane, bool(tx_word & mask)) for lane, mask in self._lane_masks(word_width, lanes)[0][-2])
+
+    @property
+    def profile(self) -> Optional[SpiProfile]:
+        return self._profile
+
+    @profile.setter
+    def profile(self, profile: Optional[SpiProfile]) -> None:
+        """ The engine is restarted with the new profile once it is idle, so no frame is split between two """
+        self._profile = profile
+        if self._idle.is_set():
+            # _run is parked waiting for the TX queue, it can be swapped out straight away
+            self._restart()
+        elif self._profile_restart is None:
+            self._profile_restart = cocotb.start_soon(self._restart_when_idle())
+
+    async def _restart_when_idle(self) -> None:
+        await self._idle.wait()
+        self._profile_restart = None
+        if self._run_profile is not self._profile:
+            self._restart()
+
     def _restart(self) -> None:
         if self._run_coroutine_obj is not None:
             self._run_coroutine_obj.kill()
-        self._run_coroutine_obj = cocotb.start_soon(self._run())
+        self._run_profile = self._profile
+        if self._run_profile is None:
+            self._run_coroutine_obj = cocotb.start_soon(self._run())
+        else:
+            self._run_coroutine_obj = cocotb.start_soon(_profiled(self._run(), self._run_profile))
 
-    async def write(self, data: Iterable[int], *, burst: bool = False):
-        self.write_nowait(data, burst=burst)
-        await self._idle.wait()
+    async def write(
+        self, data: Iterable[int], *, burst: bool = False, target: int = 0, timeout_ns: Optional[float] = None,
+    ) -> SpiTransaction:
+        transaction = await self._queue_words_waiting(data, burst, target, True, timeout_ns)
+        await self._deadline(self._idle.wait(), timeout_ns, "the TX queue to drain")
+        return transaction
 
-    def write_nowait(self, data: Iterable[int], *, burst: bool = False) -> None:
+    def write_nowait(self, data: Iterable[int], *, burst: bool = False, target: int = 0) -> SpiTransaction:
         """ Write the data to the MOSI line
 
         Args:
-            data: an iterable of ints, if the wordwidth is 8, a bytearray is typically appropriate
+            data: an iterable of ints, if the wordwidth is 8, a bytearray is typically appropriate. Buffers
+                (bytes, array.array, memoryview, NumPy arrays) are queued in bulk
             burst: if true, CS is not deasserted between writes
+            target: the chip select to address, with its own SpiConfig
+
+        Returns:
+            the SpiTransaction of the queued words, the received words also go to the RX queue
+
+        Raises:
+            QueueFull: the words do not fit in the TX queue under its tx_queue_limit
+        """
+        return self._queue_words(data, burst, target, to_rx_queue=True)
+
+    async def write_stream(
+        self, source: AsyncIterable[Union[int, Iterable[int]]], *, burst: bool = False, target: int = 0,
+        timeout_ns: Optional[float] = None,
+    ) -> int:
+        """ Write the words or chunks of words an async iterable yields, pulling them only as the TX queue drains
+
+        Each chunk is queued like write(), as the queue drains below its tx_queue_limit, so an async
+        generator can feed an arbitrarily long run with a bounded amount of data held in memory.
+
+        Returns:
+            the number of words written, once they have all been clocked out
         """
-        if self._config.msb_first:
-            for b in data:
-                self.queue_tx.append((int(b), burst))
+        count = 0
+        async for chunk in source:
+            if isinstance(chunk, int):
+                chunk = (chunk,)
+            count += (await self._queue_words_waiting(chunk, burst, target, True, timeout_ns)).length
+        await self._deadline(self._idle.wait(), timeout_ns, "the TX queue to drain")
+        return count
+
+    async def xfer(
+        self, data: Iterable[int], *, burst: bool = False, target: int = 0, timeout_ns: Optional[float] = None,
+    ) -> List[int]:
+        """ Clock the data full duplex and return exactly the words received meanwhile """
+        transaction = await self._queue_words_waiting(data, burst, target, False, timeout_ns)
+        return await self._deadline(transaction.wait(), timeout_ns, "the transfer to complete")
+
+    def xfer_nowait(self, data: Iterable[int], *, burst: bool = False, target: int = 0) -> SpiTransaction:
+        """ Queue the data like write_nowait(), but the received words only go to the returned SpiTransaction
+
+        Coroutines sharing the master can each await their own transaction, the RX queue is left alone.
+        """
+        return self._queue_words(data, burst, target, to_rx_queue=False)
+
+    def _queue_words(self, data: Iterable[int], burst: bool, target: int, to_rx_queue: bool) -> SpiTransaction:
+        self._check_target(target)
+        words = _tx_words(data)
+        if self.full_tx() or len(words) > self._tx_room():
+            raise QueueFull()
+        transaction = self._new_transaction(len(words), target, to_rx_queue)
+        self._append_words(words, burst, target, transaction)
+        return transaction
+
+    async def _queue_words_waiting(
+        self, data: Iterable[int], burst: bool, target: int, to_rx_queue: bool, timeout_ns: Optional[float],
+    ) -> SpiTransaction:
+        """ Queue the words like _queue_words(), a part at a time as the TX queue has room for them """
+        self._check_target(target)
+        words = _tx_words(data)
+        async with self._tx_lock:
+            await self._deadline(self._wait_tx_space(), timeout_ns, "room in the TX queue")
+            transaction = self._new_transaction(len(words), target, to_rx_queue)
+            start = 0
+            while True:
+                end = start + min(len(words) - start, self._tx_room())
+                self._append_words(words[start:end], burst, target, transaction)
+                start = end
+                if start == len(words):
+                    return transaction
+                await self._deadline(self._wait_tx_space(), timeout_ns, "room in the TX queue")
+
+    def _tx_room(self) -> float:
+        """ The number of words the TX queue has room for """
+        if not self.tx_queue_limit:
+            return float('inf')
+        return max(0, self.tx_queue_limit - self._tx_count)
+
+    def _new_transaction(self, length: int, target: int, to_rx_queue: bool) -> SpiTransaction:
+        transaction = SpiTransaction(length, target, to_rx_queue=to_rx_queue)
+        if self.stats is not None:
+            transaction.queued_ns = get_sim_time('ns')
+        return transaction
+
+    def _append_words(
+        self, words: Union[List[int], memoryview], burst: bool, target: int, transaction: SpiTransaction,
+    ) -> None:
+        if not len(words):
+            return
+        if isinstance(words, memoryview):
+            # a buffer is queued as a single block, _run takes the words off it one at a time
+            self.queue_tx.append((words, burst, target, transaction))
         else:
-            for b in data:
-                self.queue_tx.append((reverse_word(int(b), self._config.word_width), burst))
+            self.queue_tx.extend(zip(words, repeat(burst), repeat(target), repeat(transaction)))
+        self._tx_count += len(words)
         self.sync.set()
         self._idle.clear()
 
-    async def read(self, count: int = -1):
-        while self.empty_rx():
-            self.sync.clear()
-            await self.sync.wait()
+    async def write_bytes(
+        self, data: bytes, *, byteorder: str = 'big', burst: bool = False, target: int = 0,
+        timeout_ns: Optional[float] = None,
+    ) -> SpiTransaction:
+        words = self._pack_bytes(data, byteorder, target)
+        transaction = await self._queue_words_waiting(words, burst, target, True, timeout_ns)
+        await self._deadline(self._idle.wait(), timeout_ns, "the TX queue to drain")
+        return transaction
+
+    def write_bytes_nowait(
+        self, data: bytes, *, byteorder: str = 'big', burst: bool = False, target: int = 0,
+    ) -> SpiTransaction:
+        """ Pack bytes into words of the target's word width (8, 16, 32 or 64 bits) and write them
+
+        Args:
+            data: a bytes-like object, its length a multiple of the word size
+            byteorder: 'big' or 'little', the order of the bytes within a word
+            burst: if true, CS is not deasserted between writes
+            target: the chip select to address, with its own SpiConfig
+        """
+        return self.write_nowait(self._pack_bytes(data, byteorder, target), burst=burst, target=target)
+
+    def _pack_bytes(self, data: bytes, byteorder: str, target: int) -> array:
+        self._check_target(target)
+        words = array(_word_typecode(self._configs[target].word_width))
+        words.frombytes(data)
+        if byteorder != sys.byteorder and words.itemsize > 1:
+            words.byteswap()
+        return words
+
+    async def transfer(
+        self, message: Union[SpiMessage, Iterable[SpiTransfer]], *, target: int = 0,
+        timeout_ns: Optional[float] = None,
+    ) -> SpiMessage:
+        await self._deadline(self._wait_tx_space(), timeout_ns, "room in the TX queue")
+        message = self.transfer_nowait(message, target=target)
+        await self._deadline(message.done.wait(), timeout_ns, "the transfer to complete")
+        return message
+
+    def transfer_nowait(self, message: Union[SpiMessage, Iterable[SpiTransfer]], *, target: int = 0) -> SpiMessage:
+        """ Queue a chain of transfers to be clocked under a single chip select assertion
+
+        Words are clocked back to back, without the idle sclk periods and frame spacing that
+        separate the words given to write(). The words received during each segment are
+        stored in its rx list, they are not added to the RX queue.
+
+        Args:
+            message: an SpiMessage, or an iterable of SpiTransfer to build one from
+            target: the chip select to address, with its own SpiConfig
+
+        Returns:
+            the queued SpiMessage, its done Event is set once it has been clocked out
+        """
+        self._check_target(target)
+        if self.full_tx():
+            raise QueueFull()
+        if not isinstance(message, SpiMessage):
+            message = SpiMessage(message)
+        config = self._configs[target]
+        for xfer in message.transfers:
+            # catch lanes or widths the bus can not clock before anything goes on the wire
+            lanes = xfer.lanes
+            if lanes != 1 and (lanes not in (2, 4) or None in self._io[:lanes]):
+                raise ValueError(f"{lanes} lanes are not available on this bus")
+            if (xfer.word_width or config.word_width) % (lanes * 2 if config.ddr else lanes):
+                raise ValueError(f"The word width does not fit on {lanes} lanes" + (" with DDR" if config.ddr else ""))
+        message.target = target
+        message.done.clear()
+        if self.stats is not None:
+            message.queued_ns = get_sim_time('ns')
+        self.queue_tx.append((message, True, target, None))
+        self._tx_count += 1
+        self.sync.set()
+        self._idle.clear()
+        return message
+
+    def _check_target(self, target: int) -> None:
+        if not 0 <= target < len(self._configs):
+            raise ValueError(f"Expected target to be in range({len(self._configs)})")
+
+    async def read(self, count: int = -1, *, timeout_ns: Optional[float] = None):
+        await self._deadline(self._wait_rx(), timeout_ns, "received data")
         return self.read_nowait(count)
 
     def read_nowait(self, count: int = -1) -> Iterable[int]:
-        if count < 0:
-            count = len(self.queue_rx)
+        words = self._pop_rx(count)
         if self._config.word_width == 8:
-            data = bytearray()
-        else:
-            data = []
-        for k in range(count):
-            data.append(self.queue_rx.popleft())
-        return data
+            return bytearray(words)
+        return words
+
+    async def read_array(self, count: int = -1, *, timeout_ns: Optional[float] = None) -> array:
+        await self._deadline(self._wait_rx(), timeout_ns, "received data")
+        return self.read_array_nowait(count)
+
+    def read_array_nowait(self, count: int = -1) -> array:
+        """ Read count words into an array.array sized for the word width (up to 64 bits)
+
+        The array supports the buffer protocol, so np.frombuffer() or memoryview() can wrap it without a copy.
+        """
+        return array(_word_typecode(self._config.word_width), self._pop_rx(count))
+
+    async def read_bytes(
+        self, count: int = -1, *, byteorder: str = 'big', timeout_ns: Optional[float] = None,
+    ) -> bytes:
+        await self._deadline(self._wait_rx(), timeout_ns, "received data")
+        return self.read_bytes_nowait(count, byteorder=byteorder)
+
+    def read_bytes_nowait(self, count: int = -1, *, byteorder: str = 'big') -> bytes:
+        """ Read count words and unpack them into bytes, the inverse of write_bytes()
+
+        Args:
+            count: the number of words to read, all of them by default
+            byteorder: 'big' or 'little', the order of the bytes within a word
+        """
+        words = self.read_array_nowait(count)
+        if byteorder != sys.byteorder and words.itemsize > 1:
+            words.byteswap()
+        return words.tobytes()
+
+    def __aiter__(self) -> 'SpiMaster':
+        """ async for iterates over the received words as they arrive, draining the RX queue """
+        return self
+
+    async def __anext__(self) -> int:
+        await self._deadline(self._wait_rx(), None, "received data")
+        return self._pop_rx(1)[0]
+
+    async def _wait_rx(self) -> None:
+        while self.empty_rx():
+            self.sync.clear()
+            await self.sync.wait()
+
+    async def _wait_tx_space(self) -> None:
+        while self.full_tx():
+            self._tx_dequeue.clear()
+            await self._tx_dequeue.wait()
+
+    async def _deadline(self, awaitable, timeout_ns: Optional[float], what: str):
+        """ Await a trigger or coroutine, giving up after timeout_ns (the master's timeout_ns by default) """
+        return await _deadline(awaitable, self.timeout_ns if timeout_ns is None else timeout_ns, what)
+
+    def _pop_rx(self, count: int) -> List[int]:
+        queue_rx = self.queue_rx
+        self._rx_dequeue.set()
+        if count < 0 or count == len(queue_rx):
+            words = list(queue_rx)
+            queue_rx.clear()
+            return words
+        popleft = queue_rx.popleft
+        return [popleft() for _ in range(count)]
 
     def count_tx(self) -> int:
-        return len(self.queue_tx)
+        return self._tx_count
 
     def empty_tx(self) -> bool:
         return not self.queue_tx
 
+    def full_tx(self) -> bool:
+        return 0 < self.tx_queue_limit <= self._tx_count
+
     def count_rx(self) -> int:
         return len(self.queue_rx)
 
     def empty_rx(self) -> bool:
         return not self.queue_rx
 
+    def full_rx(self) -> bool:
+        return 0 < self.rx_queue_limit <= len(self.queue_rx)
+
     def idle(self) -> bool:
         return self.empty_tx() and self.empty_rx()
 
     def clear(self) -> None:
-        """ Clears the RX and TX queues """
+        """ Clears the RX and TX queues, the dropped transactions resolve with what they received so far """
+        for item, _, _, transaction in self.queue_tx:
+            (item if isinstance(item, SpiMessage) else transaction).done.set()
         self.queue_tx.clear()
         self.queue_rx.clear()
+        self._tx_count = 0
+        self._tx_dequeue.set()
+        self._rx_dequeue.set()
 
-    async def wait(self) -> None:
+    async def wait(self, *, timeout_ns: Optional[float] = None) -> None:
         """ Wait for idle """
-        await self._idle.wait()
+        await self._deadline(self._idle.wait(), timeout_ns, "the TX queue to drain")
 
     async def _run(self):
+        # sclk, mosi and miso are all handled from this single timeline, so every bit costs
+        # exactly two timer wake-ups (one per half period) and nothing else
+        # with stats, the start of the frame in progress and the number of words clocked in it
+        frame_start_ns = None
+        frame_words = 0
         while True:
             while not self.queue_tx:
-                self._sclk.value = int(self._config.cpol)
+                self._sclk.value = self._sclk_idle
                 self._idle.set()
                 self.sync.clear()
                 await self.sync.wait()
 
-            tx_word, burst = self.queue_tx.popleft()
-            rx_word = 0
+            # with a full RX queue, hold off clocking words that would add to it until it is read
+            transaction = self.queue_tx[0][3]
+            if transaction is not None and transaction.to_rx_queue and self.full_rx():
+                self._rx_dequeue.clear()
+                await self._rx_dequeue.wait()
+                continue
+
+            tx_word, burst, target, transaction = self.queue_tx.popleft()
+            if isinstance(tx_word, memoryview):
+                # a block queued in bulk, the rest of it stays at the head of the queue
+                if len(tx_word) > 1:
+                    self.queue_tx.appendleft((tx_word[1:], burst, target, transaction))
+                tx_word = tx_word[0]
+            self._tx_count -= 1
+            self._tx_dequeue.set()
+            if target != self._target:
+                # the targets share sclk, which has to move to the idle level of the new one
+                self._select(target)
+                self._sclk.value = self._sclk_idle
+
+            model = self._backdoors[target]
+            if model is not None and (
+                not isinstance(tx_word, SpiMessage) or all(xfer.lanes == 1 for xfer in tx_word.transfers)
+            ):
+                self._run_backdoor(model, tx_word, burst, target, transaction)
+                self.sync.set()
+                continue
+
+            profile = self._run_profile
+            if profile is not None:
+                start_ns = get_sim_time('ns')
+
+            stats = self.stats
+            if stats is not None and frame_start_ns is None:
+                frame_start_ns = get_sim_time('ns')
+
+            if isinstance(tx_word, SpiMessage):
+                await self._xfer_message(tx_word)
+                if profile is not None:
+                    _profile_message(profile, tx_word, self._config, get_sim_time('ns') - start_ns)
+                if stats is not None:
+                    self._record_message(tx_word, frame_start_ns)
+                    frame_start_ns = None
+                tx_word.done.set()
+                self.sync.set()
+                continue
 
             self.log.debug("Write byte 0x%02x", tx_word)
 
@@ -183,85 +824,504 @@ class SpiMaster:
             # https://en.wikipedia.org/wiki/Serial_Peripheral_Interface
             # this is also compliant with Linux Kernel definiton of SPI
 
-            # if CPHA=0, the first bit is typically clocked out on edge of chip select
-            if not self._config.cpha:
-                self._mosi.value = bool(tx_word & (1 << self._config.word_width - 1))
+            # if CPHA=0 (or DDR), the first bit is typically clocked out on edge of chip select
+            if self._drive_first:
+                self._mosi.value = bool(tx_word & self._first_mask)
 
             # set the chip select
             if self.has_cs:
-                self._cs.value = int(not self._config.cs_active_low)
-            await Timer(self._SpiClock.period, units='step')
+                self._cs.value = self._cs_active
+            await self._sclk_period
+
+            rx_word = await self._xfer_word(tx_word, self._word_masks, self._sclk_step)
 
-            await self._SpiClock.start()
+            # wait another sclk period before restoring the chip select and mosi to idle (not necessarily part of spec)
+            await self._sclk_period
+            self._mosi.value = int(self._config.data_output_idle)
+            frame_end = not burst or self.empty_tx() or self.queue_tx[0][2] != target
+            if self.has_cs and frame_end:
+                self._cs.value = self._cs_inactive
 
-            if self._config.cpha:
-                # if CPHA=1, the first edge is propagate, the second edge is sample
-                for k in range(self._config.word_width):
-                    # the out changes on the leading edge of clock
-                    await Edge(self._sclk)
-                    self._mosi.value = bool(tx_word & (1 << (self._config.word_width - 1 - k)))
+            if stats is not None:
+                frame_words += 1
+                if frame_end:
+                    self._record_frame(frame_start_ns, frame_words)
+                    frame_start_ns = None
+                    frame_words = 0
 
-                    # while the in captures on the trailing edge of the clock
-                    await Edge(self._sclk)
-                    rx_word |= bool(self._miso.value.integer) << (self._config.word_width - 1 - k)
+            # wait some time before starting the next transaction
+            if not 0 == self._config.frame_spacing_ns:
+                await Timer(self._config.frame_spacing_ns, units='ns')
+
+            if profile is not None:
+                profile.frames += frame_end
+                profile.bits += self._config.word_width
+                profile.sim_ns += get_sim_time('ns') - start_ns
+
+            self._receive(transaction, rx_word)
+            self.sync.set()
+
+    def _receive(self, transaction: SpiTransaction, rx_word: int) -> None:
+        """ Hand a received word to the transaction it belongs to, and to the RX queue for write() """
+        transaction.rx.append(rx_word)
+        # if the ignore_rx_value has been set, ignore all rx_word equal to the set value
+        if transaction.to_rx_queue and rx_word != self._config.ignore_rx_value:
+            self.queue_rx.append(rx_word)
+        if len(transaction.rx) == transaction.length:
+            transaction.done.set()
+            if self.stats is not None and transaction.queued_ns is not None:
+                self.stats.record_latency(get_sim_time('ns') - transaction.queued_ns)
+
+    def _record_frame(self, start_ns: float, words: int) -> None:
+        """ Add a frame of words to the stats, the chip select has just been deasserted """
+        config = self._config
+        period_ns = self._step_ps[self._sclk_period] / 1000
+        self.stats.record_frame(
+            start_ns, get_sim_time('ns'), words * config.word_width,
+            # each word has a sclk period of setup and one of hold, and is followed by the frame spacing
+            setup_ns=words * 2 * period_ns, spacing_ns=words * config.frame_spacing_ns,
+        )
+
+    def _record_message(self, message: SpiMessage, start_ns: float) -> None:
+        """ Add a transfer chain to the stats, once clocked out along with its final frame spacing """
+        config = self._config
+        period_ns = self._step_ps[self._sclk_period] / 1000
+        transfers = message.transfers
+        if transfers:
+            # a chain is recorded as a single frame, even when cs_change splits it up on the wire
+            assertions = 1 + sum(xfer.cs_change for xfer in transfers[:-1])
+            self.stats.record_frame(
+                start_ns, get_sim_time('ns') - config.frame_spacing_ns,
+                sum(len(xfer.rx) * (xfer.word_width or config.word_width) for xfer in transfers),
+                setup_ns=assertions * 2 * period_ns, spacing_ns=assertions * config.frame_spacing_ns,
+            )
+        if message.queued_ns is not None:
+            self.stats.record_latency(get_sim_time('ns') - message.queued_ns)
+
+    def _run_backdoor(
+        self, model: 'SpiSlaveBase', tx_word: Union[int, SpiMessage], burst: bool, target: int,
+        transaction: Optional[SpiTransaction],
+    ) -> None:
+        """ The zero sim time counterpart of _run and _xfer_message, for a target with a backdoor model """
+        config = self._config
+        if isinstance(tx_word, SpiMessage):
+            message = tx_word
+            idle_word = -1 if config.data_output_idle else 0
+            frame: List[Tuple[int, int]] = []
+            segments: List[Tuple[SpiTransfer, int]] = []
+            for n, xfer in enumerate(message.transfers):
+                word_width = xfer.word_width or config.word_width
+                words = list(map(int, xfer.tx)) if xfer.tx is not None else [idle_word] * xfer.length
+                frame.extend((w, word_width) for w in words)
+                segments.append((xfer, len(words)))
+                # the chip select is only deasserted by cs_change, and then the model sees a new frame
+                if xfer.cs_change or n == len(message.transfers) - 1:
+                    rx = self._backdoor_frame(model, frame)
+                    for seg, count in segments:
+                        seg.rx, rx = rx[:count], rx[count:]
+                    frame, segments = [], []
+            if self.stats is not None and message.queued_ns is not None:
+                self.stats.record_latency(get_sim_time('ns') - message.queued_ns)
+            message.done.set()
+            return
+
+        # gather the words that would have shared one chip select assertion on the wire
+        words = [tx_word]
+        transactions = [transaction]
+        while (
+            burst and self.queue_tx and self.queue_tx[0][2] == target
+            and not isinstance(self.queue_tx[0][0], SpiMessage)
+        ):
+            tx_word, burst, _, transaction = self.queue_tx.popleft()
+            if isinstance(tx_word, memoryview):
+                if burst:
+                    words.extend(tx_word.tolist())
+                    transactions.extend(repeat(transaction, len(tx_word)))
+                    continue
+                # without burst, only the first word of the block belongs to this frame
+                if len(tx_word) > 1:
+                    self.queue_tx.appendleft((tx_word[1:], burst, target, transaction))
+                tx_word = tx_word[0]
+            words.append(tx_word)
+            transactions.append(transaction)
+
+        self._tx_count -= len(words) - 1
+        rx_words = self._backdoor_frame(model, [(w, config.word_width) for w in words])
+        for transaction, rx_word in zip(transactions, rx_words):
+            self._receive(transaction, rx_word)
+
+    def _backdoor_frame(self, model: 'SpiSlaveBase', words: List[Tuple[int, int]]) -> List[int]:
+        """ Hand one chip select frame of (word, width) pairs to a model, returns the words it shifted out """
+        msb_first = self._config.msb_first
+        frame = 0
+        num_bits = 0
+        for word, width in words:
+            word &= (1 << width) - 1
+            frame = (frame << width) | (word if msb_first else reverse_word(word, width))
+            num_bits += width
+
+        rx_frame = model.backdoor(frame, num_bits)
+        if self._run_profile is not None:
+            self._run_profile.frames += 1
+            self._run_profile.bits += num_bits
+
+        rx = []
+        for _, width in words:
+            num_bits -= width
+            word = (rx_frame >> num_bits) & ((1 << width) - 1)
+            rx.append(word if msb_first else reverse_word(word, width))
+        return rx
+
+    async def _xfer_message(self, message: SpiMessage) -> None:
+        config = self._config
+        transfers = message.transfers
+        if not transfers:
+            return
+
+        # in a dual/quad segment without tx data the master samples the lanes instead of driving them
+        idle_word = -1 if config.data_output_idle else 0
+        tx_words = [
+            list(map(int, xfer.tx)) if xfer.tx is not None else [idle_word if xfer.lanes == 1 else None] * xfer.length
+            for xfer in transfers
+        ]
+
+        cs_asserted = False
+        sclk_period = self._sclk_period
+        for n, xfer in enumerate(transfers):
+            words = tx_words[n]
+            word_width = xfer.word_width or config.word_width
+            lanes = xfer.lanes
+            if lanes == 1:
+                xfer_word = self._xfer_word
+                masks = self._kernel_masks(word_width)
             else:
-                # if CPHA=0, the first edge is sample, the second edge is propagate
-                # we already clocked out one bit on edge of chip select, so we will clock out less bits
-                for k in range(self._config.word_width - 1):
-                    await Edge(self._sclk)
-                    rx_word |= bool(self._miso.value.integer) << (self._config.word_width - 1 - k)
+                xfer_word = self._xfer_lanes
+                masks = self._lane_masks(word_width, lanes)
+            sclk_period, half_period, quarter_period = self._sclk_timers(xfer.sclk_freq or config.sclk_freq)
+            step = quarter_period if config.ddr else half_period
+            word_delay = Timer(xfer.word_delay_ns, units='ns') if xfer.word_delay_ns else None
+            last = n == len(transfers) - 1
+
+            if not cs_asserted:
+                # if CPHA=0 (or DDR), the first bit is clocked out on edge of chip select
+                if self._drive_first and words:
+                    for signal, value in self._first_drive(words[0], word_width, lanes) or ():
+                        signal.value = value
+                if self.has_cs:
+                    self._cs.value = self._cs_active
+                cs_asserted = True
+                await sclk_period
+
+            # with CPHA=0 (or DDR), the last edge of a word already propagates the first bit(s) of the next
+            # word, so that the clock can keep running across words and segments
+            next_drive = None
+            if self._drive_first and not last and not xfer.cs_change and tx_words[n + 1]:
+                next_xfer = transfers[n + 1]
+                next_drive = self._first_drive(
+                    tx_words[n + 1][0], next_xfer.word_width or config.word_width, next_xfer.lanes,
+                )
+
+            xfer.rx = rx = []
+            for k, tx_word in enumerate(words):
+                if k + 1 < len(words):
+                    if not self._drive_first:
+                        rx.append(await xfer_word(tx_word, masks, step))
+                    else:
+                        word_drive = self._first_drive(words[k + 1], word_width, lanes)
+                        rx.append(await xfer_word(tx_word, masks, step, word_drive))
+                    if word_delay is not None:
+                        await word_delay
+                else:
+                    rx.append(await xfer_word(tx_word, masks, step, next_drive))
+
+            if xfer.delay_ns:
+                await Timer(xfer.delay_ns, units='ns')
+
+            if xfer.cs_change and not last:
+                await sclk_period
+                self._mosi.value = int(config.data_output_idle)
+                if self.has_cs:
+                    self._cs.value = self._cs_inactive
+                cs_asserted = False
+                if not 0 == config.frame_spacing_ns:
+                    await Timer(config.frame_spacing_ns, units='ns')
+
+        # like Linux, cs_change on the last segment leaves the chip select asserted
+        await sclk_period
+        self._mosi.value = int(config.data_output_idle)
+        if self.has_cs and not transfers[-1].cs_change:
+            self._cs.value = self._cs_inactive
+
+        if not 0 == config.frame_spacing_ns:
+            await Timer(config.frame_spacing_ns, units='ns')
+
+    async def _xfer_word_cpha0(
+        self, tx_word: int, masks: Tuple[Tuple[int, int], ...], half_period: Timer, next_drive: Optional[Tuple] = None,
+    ) -> int:
+        # if CPHA=0, the leading edge is sample, the trailing edge is propagate
+        # the first bit was clocked out before the first edge, so the last trailing edge only
+        # has something to send when the next word follows straight on (next_drive)
+        sclk, mosi, miso = self._sclk, self._mosi, self._miso
+        sclk_idle, sclk_active = self._sclk_idle, self._sclk_active
 
-                    await Edge(self._sclk)
-                    self._mosi.value = bool(tx_word & (1 << (self._config.word_width - 2 - k)))
+        rx_word = 0
+        for mask, next_mask in masks:
+            sclk.value = sclk_active
+            if miso.value.integer:
+                rx_word |= mask
+            await half_period
+
+            sclk.value = sclk_idle
+            if next_mask:
+                mosi.value = bool(tx_word & next_mask)
+            elif next_drive:
+                for signal, value in next_drive:
+                    signal.value = value
+            await half_period
 
-                # but we haven't sampled enough times, so we will wait for another edge to sample
-                await Edge(self._sclk)
-                rx_word |= bool(self._miso.value.integer)
+        return rx_word
 
-            # set sclk back to idle state
-            await self._SpiClock.stop()
-            self._sclk.value = self._config.cpol
+    async def _xfer_word_cpha1(
+        self, tx_word: int, masks: Tuple[int, ...], half_period: Timer, next_drive: Optional[Tuple] = None,
+    ) -> int:
+        # if CPHA=1, the leading edge is propagate, the trailing edge is sample
+        sclk, mosi, miso = self._sclk, self._mosi, self._miso
+        sclk_idle, sclk_active = self._sclk_idle, self._sclk_active
 
-            # wait another sclk period before restoring the chip select and mosi to idle (not necessarily part of spec)
-            await Timer(self._SpiClock.period, units='step')
-            self._mosi.value = int(self._config.data_output_idle)
-            if self.has_cs:
-                if not burst or self.empty_tx():
-                    self._cs.value = int(self._config.cs_active_low)
+        rx_word = 0
+        for mask in masks:
+            sclk.value = sclk_active
+            mosi.value = bool(tx_word & mask)
+            await half_period
 
-            # wait some time before starting the next transaction
-            if not 0 == self._config.frame_spacing_ns:
-                await Timer(self._config.frame_spacing_ns, units='ns')
+            # miso was driven by the slave on the leading edge, half a period ago
+            sclk.value = sclk_idle
+            if miso.value.integer:
+                rx_word |= mask
+            await half_period
 
-            if not self._config.msb_first:
-                rx_word = reverse_word(rx_word, self._config.word_width)
+        return rx_word
 
-            # if the ignore_rx_value has been set, ignore all rx_word equal to the set value
-            if rx_word != self._config.ignore_rx_value:
-                self.queue_rx.append(rx_word)
+    async def _xfer_word_ddr(
+        self, tx_word: int, masks: Tuple[Tuple[int, int, int], ...], quarter_period: Timer,
+        next_drive: Optional[Tuple] = None,
+    ) -> int:
+        # with DDR, every edge samples a bit, and the next bit is propagated a quarter period later, in
+        # the middle between two edges, so that it never changes on the edge the slave samples it on
+        sclk, mosi, miso = self._sclk, self._mosi, self._miso
 
-            self.sync.set()
+        rx_word = 0
+        for level, mask, next_mask in masks:
+            sclk.value = level
+            if miso.value.integer:
+                rx_word |= mask
+            await quarter_period
+
+            if next_mask:
+                mosi.value = bool(tx_word & next_mask)
+            elif next_drive:
+                for signal, value in next_drive:
+                    signal.value = value
+            await quarter_period
+
+        return rx_word
+
+    async def _xfer_word_bfm(
+        self, tx_word: int, masks: Tuple, step: Timer, next_drive: Optional[Tuple] = None,
+    ) -> int:
+        # the BFM clocks the word in the simulator and Python only wakes up once it is done. mosi_next
+        # is the level the BFM leaves on mosi after the word: the first bit of the next word when the
+        # clock keeps running (next_drive), else the last bit
+        bfm = self._bfm
+        word_width = len(masks)
+        mosi_end = bool(tx_word & _bit_masks(word_width, self._config.msb_first)[-1])
+        late_drive = []
+        for signal, value in next_drive or ():
+            if signal is self._mosi:
+                mosi_end = value
+            else:
+                late_drive.append((signal, value))
+
+        bfm.tx_word.value = tx_word & ((1 << word_width) - 1)
+        bfm.mosi_next.value = mosi_end
+        bfm.word_width.value = word_width
+        bfm.step_ps.value = self._step_ps[step]
+        self._bfm_req ^= 1
+        bfm.req.value = self._bfm_req
+        await self._bfm_ack
+
+        # keep the pass-through level in step with the pin, so that the next level driven from Python shows
+        self._mosi.value = mosi_end
+        for signal, value in late_drive:
+            signal.value = value
+        return bfm.rx_word.value.integer
+
+    async def _xfer_lanes_cpha0(
+        self, tx_word: Optional[int], masks: Tuple, half_period: Timer, next_drive: Optional[Tuple] = None,
+    ) -> int:
+        # dual/quad spi is half duplex, the master either drives all lanes (tx_word) or samples them all
+        sclk = self._sclk
+        sclk_idle, sclk_active = self._sclk_idle, self._sclk_active
+
+        rx_word = 0
+        for group, next_group in masks:
+            sclk.value = sclk_active
+            if tx_word is None:
+                for lane, mask in group:
+                    if lane.value.integer:
+                        rx_word |= mask
+            await half_period
+
+            sclk.value = sclk_idle
+            if next_group:
+                if tx_word is not None:
+                    for lane, mask in next_group:
+                        lane.value = bool(tx_word & mask)
+            elif next_drive:
+                for signal, value in next_drive:
+                    signal.value = value
+            await half_period
+
+        return rx_word
+
+    async def _xfer_lanes_cpha1(
+        self, tx_word: Optional[int], masks: Tuple, half_period: Timer, next_drive: Optional[Tuple] = None,
+    ) -> int:
+        sclk = self._sclk
+        sclk_idle, sclk_active = self._sclk_idle, self._sclk_active
+
+        rx_word = 0
+        for group in masks:
+            sclk.value = sclk_active
+            if tx_word is not None:
+                for lane, mask in group:
+                    lane.value = bool(tx_word & mask)
+            await half_period
+
+            sclk.value = sclk_idle
+            if tx_word is None:
+                for lane, mask in group:
+                    if lane.value.integer:
+                        rx_word |= mask
+            await half_period
+
+        return rx_word
+
+    async def _xfer_lanes_ddr(
+        self, tx_word: Optional[int], masks: Tuple, quarter_period: Timer, next_drive: Optional[Tuple] = None,
+    ) -> int:
+        sclk = self._sclk
+
+        rx_word = 0
+        for level, group, next_group in masks:
+            sclk.value = level
+            if tx_word is None:
+                for lane, mask in group:
+                    if lane.value.integer:
+                        rx_word |= mask
+            await quarter_period
+
+            if next_group:
+                if tx_word is not None:
+                    for lane, mask in next_group:
+                        lane.value = bool(tx_word & mask)
+            elif next_drive:
+                for signal, value in next_drive:
+                    signal.value = value
+            await quarter_period
+
+        return rx_word
 
 
 class SpiSlaveBase(ABC):
     _config: SpiConfig
 
-    def __init__(self, bus: SpiBus):
+    # the longest a frame may take once the chip select is asserted, and the default timeout of the
+    # blocking calls, which then raise SpiFrameTimeout; None waits forever
+    timeout_ns: Optional[float] = None
+
+    # the SpiProfile the frames are counted into, from the next frame on once set, None to run
+    # without any instrumentation
+    profile: Optional[SpiProfile] = None
+
+    def __init__(self, bus: SpiBus, bfm: Optional[SpiSlaveBfm] = None, *, target: int = 0):
+        """
+        Args:
+            bus: the SpiBus of the slave
+            bfm: a spi_bfm_slave instance driving miso, which then shifts the words in the simulator
+            target: the chip select the slave sits on, on a bus with several cs signals. A slave can not
+                follow one bit of a cs vector, it needs a bus with that bit as a signal of its own
+        """
         self.log = logging.getLogger(f"cocotb.{bus.sclk._path}")
 
         self._sclk = bus.sclk
         self._mosi = bus.mosi
         self._miso = bus.miso
-        self._cs = bus.cs
+        chip_selects = _bus_chip_selects(bus)
+        if not 0 <= target < len(chip_selects):
+            raise ValueError(f"Expected target to be in range({len(chip_selects)})")
+        self._cs, cs_bit = chip_selects[target]
+        if cs_bit is not None:
+            raise ValueError("A slave can not sit on one bit of a cs vector, give it a chip select signal of its own")
+        self._io = _bus_lanes(bus)
+
+        # with a BFM driving miso, the levels driven from Python go to its pass-through input instead
+        self._bfm = bfm
+        if bfm is not None:
+            self._miso = bfm.miso_in
+            self._io = tuple(self._miso if lane is bus.miso else lane for lane in self._io)
+            self._bfm_ack = Edge(bfm.ack)
+            self._bfm_req = 0
+            bfm.req.setimmediatevalue(0)
 
         self._miso.value = self._config.data_output_idle
 
+        # the triggers are reused for every bit rather than rebuilt
+        self._sclk_edge = Edge(self._sclk)
+        self._lane_groups_cache: Dict[Tuple[int, int], Tuple] = {}
+        self._configure()
+
         self.idle = Event()
         self.idle.set()
 
         self._run_coroutine_obj = None
         self._restart()
 
+    async def reconfigure(self, config: SpiConfig, *, timeout_ns: Optional[float] = None) -> None:
+        """ Change the config between transactions, without rebuilding the slave """
+        await self.wait(timeout_ns=timeout_ns)
+
+        restart = config.cs_active_low != self._config.cs_active_low
+        self._config = config
+        self._configure()
+        if restart:
+            # the idle slave is waiting on the frame start edge of the old chip select polarity
+            self._restart()
+
+    def _configure(self) -> None:
+        """ Specialize the frame triggers and the shift kernel for the current config """
+        if self._config.cs_active_low:
+            self._frame_start = FallingEdge(self._cs)
+            self._frame_end = RisingEdge(self._cs)
+        else:
+            self._frame_start = RisingEdge(self._cs)
+            self._frame_end = FallingEdge(self._cs)
+        self._cs_inactive = int(self._config.cs_active_low)
+        self._sclk_edge_or_frame_end = First(self._sclk_edge, self._frame_end)
+        self._frame_spacing = Timer(self._config.frame_spacing_ns, units='ns')
+
+        if self._bfm is not None:
+            self._bfm.cpha.value = int(self._config.cpha)
+            self._bfm.ddr.value = int(self._config.ddr)
+            self._bfm.cs_active_low.value = int(self._config.cs_active_low)
+            self._shift_kernel = self._shift_bfm
+        elif self._config.ddr:
+            self._shift_kernel = self._shift_ddr
+        elif self._config.cpha:
+            self._shift_kernel = self._shift_cpha1
+        else:
+            self._shift_kernel = self._shift_cpha0
+
     def _restart(self):
         if self._run_coroutine_obj is not None:
             self._run_coroutine_obj.kill()
@@ -277,37 +1337,168 @@ class SpiSlaveBase(ABC):
         Returns:
             the received word on the MOSI line
         """
+        if self.profile is not None:
+            self.profile.bits += num_bits
+        return await self._shift_kernel(_bit_masks(num_bits), tx_word)
+
+    async def _shift_cpha0(self, masks: Tuple[int, ...], tx_word: Optional[int]) -> int:
+        # when CPHA=0, the slave should sample on the first edge and shift out on the second
+        mosi, miso, cs = self._mosi, self._miso, self._cs
+        edge_or_frame_end = self._sclk_edge_or_frame_end
+        frame_end = self._frame_end
+        cs_inactive = self._cs_inactive
+        data_output_idle = self._config.data_output_idle
+
         rx_word = 0
+        for mask in masks:
+            # If both events happen at the same time, the returned one is indeterminate, thus
+            # checking the chip select level as well
+            if (await edge_or_frame_end) == frame_end or cs.value == cs_inactive:
+                raise SpiFrameError("End of frame in the middle of a transaction")
+            if mosi.value.integer:
+                rx_word |= mask
 
-        frame_end = RisingEdge(self._cs) if self._config.cs_active_low else FallingEdge(self._cs)
+            if (await edge_or_frame_end) == frame_end or cs.value == cs_inactive:
+                raise SpiFrameError("End of frame in the middle of a transaction")
+            miso.value = data_output_idle if tx_word is None else bool(tx_word & mask)
 
-        for k in range(num_bits):
-            # If both events happen at the same time, the returned one is indeterminate, thus
-            # checking for cs = 1
-            if (await First(Edge(self._sclk), frame_end)) == frame_end or self._cs.value == 1:
+        return rx_word
+
+    async def _shift_cpha1(self, masks: Tuple[int, ...], tx_word: Optional[int]) -> int:
+        # when CPHA=1, the slave should shift out on the first edge and sample on the second
+        mosi, miso, cs = self._mosi, self._miso, self._cs
+        edge_or_frame_end = self._sclk_edge_or_frame_end
+        frame_end = self._frame_end
+        cs_inactive = self._cs_inactive
+        data_output_idle = self._config.data_output_idle
+
+        rx_word = 0
+        for mask in masks:
+            if (await edge_or_frame_end) == frame_end or cs.value == cs_inactive:
                 raise SpiFrameError("End of frame in the middle of a transaction")
+            miso.value = data_output_idle if tx_word is None else bool(tx_word & mask)
 
-            if self._config.cpha:
-                # when CPHA=1, the slave should shift out on the first edge
-                if tx_word is not None:
-                    self._miso.value = bool(tx_word & (1 << (num_bits - 1 - k)))
-                else:
-                    self._miso.value = self._config.data_output_idle
-            else:
-                # when CPHA=0, the slave should sample on the first edge
-                rx_word |= int(self._mosi.value.integer) << (num_bits - 1 - k)
+            if (await edge_or_frame_end) == frame_end or cs.value == cs_inactive:
+                raise SpiFrameError("End of frame in the middle of a transaction")
+            if mosi.value.integer:
+                rx_word |= mask
+
+        return rx_word
+
+    async def _shift_ddr(self, masks: Tuple[int, ...], tx_word: Optional[int]) -> int:
+        # with DDR, the slave samples and shifts out on every edge, so a bit lasts half a sclk period
+        mosi, miso, cs = self._mosi, self._miso, self._cs
+        edge_or_frame_end = self._sclk_edge_or_frame_end
+        frame_end = self._frame_end
+        cs_inactive = self._cs_inactive
+        data_output_idle = self._config.data_output_idle
 
-            # do the opposite of what was done on the first edge
-            if (await First(Edge(self._sclk), frame_end)) == frame_end or self._cs.value == 1:
+        rx_word = 0
+        for mask in masks:
+            if (await edge_or_frame_end) == frame_end or cs.value == cs_inactive:
                 raise SpiFrameError("End of frame in the middle of a transaction")
+            if mosi.value.integer:
+                rx_word |= mask
+            miso.value = data_output_idle if tx_word is None else bool(tx_word & mask)
 
-            if self._config.cpha:
-                rx_word |= int(self._mosi.value.integer) << (num_bits - 1 - k)
-            else:
-                if tx_word is not None:
-                    self._miso.value = bool(tx_word & (1 << (num_bits - 1 - k)))
+        return rx_word
+
+    async def _shift_bfm(self, masks: Tuple[int, ...], tx_word: Optional[int]) -> int:
+        # the BFM follows the sclk edges in the simulator and Python only wakes up once the word is done
+        bfm = self._bfm
+        num_bits = len(masks)
+        if tx_word is None:
+            tx_word = -1 if self._config.data_output_idle else 0
+
+        bfm.tx_word.value = tx_word & ((1 << num_bits) - 1)
+        bfm.word_width.value = num_bits
+        self._bfm_req ^= 1
+        bfm.req.value = self._bfm_req
+        await self._bfm_ack
+
+        if bfm.frame_error.value.integer:
+            raise SpiFrameError("End of frame in the middle of a transaction")
+        # the BFM holds the last bit on miso, keep the pass-through level in step with it
+        self._miso.value = bool(tx_word & masks[-1])
+        return bfm.rx_word.value.integer
+
+    async def _shift_lanes(self, num_bits: int, lanes: int, tx_word: Optional[int] = None) -> int:
+        """ Shift a dual/quad spi phase over the io0..io3 lanes.
+
+        The phase is half duplex: when tx_word is given it is driven on the lanes, otherwise the
+        lanes are sampled. Unlike _shift, with CPHA=0 or DDR the first bits of tx_word are put on
+        the lanes straight away, ahead of the first edge.
+
+        Args:
+            num_bits: the number of bits to shift, a multiple of lanes
+            lanes: the number of lanes (1, 2 or 4), the highest lane carries the first bit of each cycle
+            tx_word: the word to be transmitted on the lanes
+
+        Returns:
+            the word received on the lanes
+        """
+        if self.profile is not None:
+            self.profile.bits += num_bits
+        try:
+            groups = self._lane_groups_cache[(num_bits, lanes)]
+        except KeyError:
+            groups = _lane_groups(self._io, num_bits, lanes)
+            self._lane_groups_cache[(num_bits, lanes)] = groups
+
+        cs = self._cs
+        edge_or_frame_end = self._sclk_edge_or_frame_end
+        frame_end = self._frame_end
+        cs_inactive = self._cs_inactive
+
+        rx_word = 0
+        if self._config.ddr:
+            # with DDR, every edge samples a group and shifts out the next one
+            if tx_word is not None:
+                for lane, mask in groups[0]:
+                    lane.value = bool(tx_word & mask)
+            for group, next_group in zip(groups, groups[1:] + ((),)):
+                if (await edge_or_frame_end) == frame_end or cs.value == cs_inactive:
+                    raise SpiFrameError("End of frame in the middle of a transaction")
+                if tx_word is None:
+                    for lane, mask in group:
+                        if lane.value.integer:
+                            rx_word |= mask
                 else:
-                    self._miso.value = self._config.data_output_idle
+                    for lane, mask in next_group:
+                        lane.value = bool(tx_word & mask)
+        elif self._config.cpha:
+            # when CPHA=1, the slave should shift out on the first edge and sample on the second
+            for group in groups:
+                if (await edge_or_frame_end) == frame_end or cs.value == cs_inactive:
+                    raise SpiFrameError("End of frame in the middle of a transaction")
+                if tx_word is not None:
+                    for lane, mask in group:
+                        lane.value = bool(tx_word & mask)
+
+                if (await edge_or_frame_end) == frame_end or cs.value == cs_inactive:
+                    raise SpiFrameError("End of frame in the middle of a transaction")
+                if tx_word is None:
+                    for lane, mask in group:
+                        if lane.value.integer:
+                            rx_word |= mask
+        else:
+            # when CPHA=0, the slave should sample on the first edge and shift out the next bits on the second
+            if tx_word is not None:
+                for lane, mask in groups[0]:
+                    lane.value = bool(tx_word & mask)
+            for group, next_group in zip(groups, groups[1:] + ((),)):
+                if (await edge_or_frame_end) == frame_end or cs.value == cs_inactive:
+                    raise SpiFrameError("End of frame in the middle of a transaction")
+                if tx_word is None:
+                    for lane, mask in group:
+                        if lane.value.integer:
+                            rx_word |= mask
+
+                if (await edge_or_frame_end) == frame_end or cs.value == cs_inactive:
+                    raise SpiFrameError("End of frame in the middle of a transaction")
+                if tx_word is not None:
+                    for lane, mask in next_group:
+                        lane.value = bool(tx_word & mask)
 
         return rx_word
 
@@ -328,49 +1519,66 @@ class SpiSlaveBase(ABC):
         Returns:
             the received word on the MOSI line
         """
-        rx_word = 0
-
-        frame_end = RisingEdge(self._cs) if self._config.cs_active_low else FallingEdge(self._cs)
+        if self.profile is not None:
+            self.profile.bits += num_bits
+        mosi, miso = self._mosi, self._miso
+        edge_or_frame_end = self._sclk_edge_or_frame_end
+        frame_end = self._frame_end
         propagate_out_delay = Timer(delay, units=delay_units)
+        propagate_or_abort = First(propagate_out_delay, frame_end, self._sclk_edge)
+        # with DDR every edge reads in, like the first edge of CPHA=0 without the closing edge
+        ddr = self._config.ddr
+        cpha = self._config.cpha and not ddr
 
-        for k in range(num_bits):
-            f = await First(Edge(self._sclk), frame_end)
-            if not self._config.cpha:
-                # when CPHA=0, the first thing the slave should do is read in
-                rx_word |= int(self._mosi.value.integer) << (num_bits - 1 - k)
-                most_recent_bit = int(self._mosi.value.integer)
+        rx_word = 0
+        for mask in _bit_masks(num_bits):
+            f = await edge_or_frame_end
+            if cpha:
+                # when CPHA=1, the first edge is ignored and the second thing we should do is read in
+                s = await edge_or_frame_end
+                if frame_end in (f, s):
+                    raise SpiFrameError("End of frame in the middle of a transaction")
+            elif f == frame_end:
+                raise SpiFrameError("End of frame in the middle of a transaction")
 
-                w = await First(propagate_out_delay, frame_end, Edge(self._sclk))
+            most_recent_bit = mosi.value.integer
+            if most_recent_bit:
+                rx_word |= mask
 
-                if w != propagate_out_delay:
-                    if w == frame_end:
-                        raise SpiFrameError("Unexpected end of frame in the middle of a transaction")
-                    else:
-                        raise SpiFrameError("Unexpected edge of sclk while waiting to propagate next bit")
+            w = await propagate_or_abort
+            if w != propagate_out_delay:
+                if w == frame_end:
+                    raise SpiFrameError("Unexpected end of frame in the middle of a transaction")
+                else:
+                    raise SpiFrameError("Unexpected edge of sclk while waiting to propagate next bit")
 
-                self._miso.value = bool(most_recent_bit)
+            miso.value = bool(most_recent_bit)
 
-            s = await First(Edge(self._sclk), frame_end)
+            if not cpha and not ddr and (await edge_or_frame_end) == frame_end:
+                # when CPHA=0, the first thing the slave should do is read in, the second edge just closes the bit
+                raise SpiFrameError("End of frame in the middle of a transaction")
 
-            if self._config.cpha:
-                # when CPHA=1, the second thing we should do is read in
-                rx_word |= int(self._mosi.value.integer) << (num_bits - 1 - k)
-                most_recent_bit = int(self._mosi.value.integer)
+        return rx_word
 
-                w = await First(propagate_out_delay, frame_end, Edge(self._sclk))
+    def backdoor(self, frame: int, num_bits: int) -> int:
+        """ Apply a whole frame to the model in zero sim time, with the same side effects as on the wire
 
-                if w != propagate_out_delay:
-                    if w == frame_end:
-                        raise SpiFrameError("Unexpected end of frame in the middle of a transaction")
-                    else:
-                        raise SpiFrameError("Unexpected edge of sclk while waiting to propagate next bit")
+        Args:
+            frame: the bits received on MOSI during one chip select assertion, the first one in the MSB
+            num_bits: the number of bits in the frame
 
-                self._miso.value = bool(most_recent_bit)
+        Returns:
+            the bits the model shifts out on MISO during the frame, in the same order
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not implement a backdoor")
 
-            if frame_end in (f, s):
-                raise SpiFrameError("End of frame in the middle of a transaction")
+    def _idle_bits(self, num_bits: int) -> int:
+        """ The MISO bits of a backdoor frame during which the model does not drive anything """
+        return (1 << num_bits) - 1 if self._config.data_output_idle else 0
 
-        return rx_word
+    async def wait(self, *, timeout_ns: Optional[float] = None) -> None:
+        """ Wait for the end of the current frame """
+        await _deadline(self.idle.wait(), self.timeout_ns if timeout_ns is None else timeout_ns, "the end of the frame")
 
     @abstractmethod
     async def _transaction(self, frame_start, frame_end):
@@ -378,91 +1586,263 @@ class SpiSlaveBase(ABC):
         raise NotImplementedError("Please implement the _transaction method")
 
     async def _run(self):
-        if self._config.cs_active_low:
-            frame_start = FallingEdge(self._cs)
-            frame_end = RisingEdge(self._cs)
-        else:
-            frame_start = RisingEdge(self._cs)
-            frame_end = FallingEdge(self._cs)
-
-        frame_spacing = Timer(self._config.frame_spacing_ns, units='ns')
-
         while True:
             self.idle.set()
-            if (await First(frame_start, frame_spacing)) == frame_start:
+            frame_start = self._frame_start
+            if (await First(frame_start, self._frame_spacing)) == frame_start:
                 raise SpiFrameError(f"There must be at least {self._config.frame_spacing_ns} ns between frames")
-            await self._transaction(frame_start, frame_end)
-
-
-class _SpiClock(BaseClock):
-    def __init__(self, signal, period, units="step", start_high=True):
-        BaseClock.__init__(self, signal)
-        self.period = cocotb.utils.get_sim_steps(period, units, round_mode="round")
-        self.half_period = cocotb.utils.get_sim_steps(period / 2.0, units, round_mode="round")
-        self.frequency = 1.0 / cocotb.utils.get_time_from_sim_steps(self.period, units='us')
-
-        self.signal = signal
-
-        self.start_high = start_high
+            transaction = self._transaction(frame_start, self._frame_end)
+            if self.profile is not None:
+                transaction = _profiled(transaction, self.profile, frame=True)
+            if not self.timeout_ns:
+                await transaction
+                continue
+
+            # a single deadline per frame, started along with it, the bits are not timed individually
+            transaction = cocotb.start_soon(transaction)
+            await First(transaction, frame_start)
+            try:
+                await with_timeout(transaction, self.timeout_ns, 'ns')
+            except SimTimeoutError:
+                transaction.kill()
+                raise SpiFrameTimeout(f"The frame did not end within {self.timeout_ns} ns") from None
+
+
+async def _deadline(awaitable, timeout_ns: Optional[float], what: str):
+    """ Await a trigger or coroutine, raising SpiFrameTimeout if it has not fired after timeout_ns """
+    if not timeout_ns:
+        return await awaitable
+    try:
+        return await with_timeout(awaitable, timeout_ns, 'ns')
+    except SimTimeoutError:
+        raise SpiFrameTimeout(f"Timed out after {timeout_ns} ns waiting for {what}") from None
+
+
+def _profile_message(profile: SpiProfile, message: SpiMessage, config: SpiConfig, sim_ns: float) -> None:
+    """ Count a transfer chain clocked on the wire, one frame per chip select assertion """
+    transfers = message.transfers
+    if not transfers:
+        return
+    profile.frames += 1 + sum(xfer.cs_change for xfer in transfers[:-1])
+    profile.bits += sum(len(xfer.rx) * (xfer.word_width or config.word_width) for xfer in transfers)
+    profile.sim_ns += sim_ns
+
+
+async def _profiled(coro, profile: SpiProfile, *, frame: bool = False):
+    """ Run a coroutine, counting its trigger awaits and the wall-clock time of its steps into profile
+
+    With frame, the coroutine handles one frame, which starts at its first wake-up (the frame start
+    edge a _transaction awaits first) and ends when it returns.
+    """
+    profiled = _Profiled(coro, profile)
+    result = await profiled
+    if frame:
+        profile.frames += 1
+        if profiled.first_ns is not None:
+            profile.sim_ns += get_sim_time('ns') - profiled.first_ns
+    return result
+
+
+class _Profiled:
+    """ Awaitable that steps a coroutine itself, to see every trigger it yields to the scheduler """
+    def __init__(self, coro, profile: SpiProfile) -> None:
+        self._coro = coro
+        self._profile = profile
+        self.first_ns: Optional[float] = None
+
+    def __await__(self):
+        profile = self._profile
+        clock = time.perf_counter
+        steps = self._coro.__await__()
+        value = None
+        error = None
+        while True:
+            start = clock()
+            try:
+                if error is None:
+                    trigger = steps.send(value)
+                else:
+                    trigger = steps.throw(error)
+            except StopIteration as e:
+                return e.value
+            finally:
+                profile.wall_s += clock() - start
+            profile.awaits += 1
+            try:
+                value = yield trigger
+                error = None
+            except BaseException as e:
+                value = None
+                error = e
+            if self.first_ns is None:
+                self.first_ns = get_sim_time('ns')
+
+
+@lru_cache(maxsize=None)
+def _bit_masks(width: int, msb_first: bool = True) -> Tuple[int, ...]:
+    """ Single bit masks for a word of the given width, in the order they go on the wire """
+    masks = tuple(1 << k for k in range(width))
+    return masks[::-1] if msb_first else masks
+
+
+@lru_cache(maxsize=None)
+def _propagate_masks(width: int, msb_first: bool = True) -> Tuple[Tuple[int, int], ...]:
+    """ Pairs every sampled bit with the bit to propagate on the following trailing edge (CPHA=0) """
+    masks = _bit_masks(width, msb_first)
+    return tuple(zip(masks, masks[1:] + (0,)))
+
+
+# the native integer formats that memoryview can index
+_WORD_FORMATS = frozenset('?bBhHiIlLqQ')
+
+# the array typecode of every word size, the smallest one where several share a size
+_ARRAY_TYPECODES = {array(typecode).itemsize * 8: typecode for typecode in 'QLIHB'}
+
+
+def _word_typecode(word_width: int) -> str:
+    """ The array typecode that holds a word of the given width """
+    try:
+        return _ARRAY_TYPECODES[word_width if word_width <= 8 else 1 << (word_width - 1).bit_length()]
+    except KeyError:
+        raise ValueError(f"There is no array type for {word_width} bit words") from None
+
+
+def _word_block(data) -> Optional[memoryview]:
+    """ A flat copy of the words of a buffer (bytes, array.array, memoryview, NumPy array), None for other data
+
+    The words are copied in one go, so that the caller is free to reuse its buffer, but they are only
+    turned into ints as they are clocked.
+    """
+    # numpy is optional, if it has not been imported the data can not be an array
+    np = sys.modules.get('numpy')
+    if np is not None and isinstance(data, np.ndarray):
+        data = np.ascontiguousarray(data.ravel(), dtype=data.dtype.newbyteorder('='))
+    try:
+        view = memoryview(data)
+    except TypeError:
+        return None
+    if view.format not in _WORD_FORMATS:
+        return None
+    return memoryview(view.tobytes()).cast(view.format)
+
+
+def _tx_words(data: Iterable[int]) -> Union[List[int], memoryview]:
+    """ The words of a write, a buffer as a memoryview block and anything else as a list of ints """
+    block = _word_block(data)
+    if block is None:
+        return list(map(int, data))
+    return block
+
+
+def _bus_chip_selects(bus: SpiBus) -> List[Tuple]:
+    """ The (signal, bit) chip select of every target, bit is None unless cs is a vector """
+    if hasattr(bus, 'cs'):
+        if len(bus.cs) == 1:
+            return [(bus.cs, None)]
+        return [(bus.cs, k) for k in range(len(bus.cs))]
+    chip_selects = []
+    while hasattr(bus, f'cs{len(chip_selects)}'):
+        chip_selects.append((getattr(bus, f'cs{len(chip_selects)}'), None))
+    return chip_selects
+
+
+def _cs_levels(chip_selects: List[Tuple], configs: List[SpiConfig]) -> List[Tuple]:
+    """ The (signal, asserted value, deasserted value) of every target
+
+    For a cs vector the values cover the whole vector, so that selecting one target keeps all the
+    others deasserted, whatever their polarity.
+    """
+    vector_idle = 0
+    for (cs, bit), config in zip(chip_selects, configs):
+        if bit is not None:
+            vector_idle |= int(config.cs_active_low) << bit
+
+    levels = []
+    for (cs, bit), config in zip(chip_selects, configs):
+        if bit is None:
+            levels.append((cs, int(not config.cs_active_low), int(config.cs_active_low)))
+        else:
+            levels.append((cs, vector_idle ^ (1 << bit), vector_idle))
+    return levels
 
-        self._idle = Event()
-        self._sync = Event()
-        self._start = Event()
 
-        self._idle.set()
+def _bus_lanes(bus: SpiBus) -> Tuple:
+    """ The io0..io3 lanes of a bus, io0/io1 fall back to mosi/miso and missing lanes are None """
+    return (
+        getattr(bus, 'io0', bus.mosi),
+        getattr(bus, 'io1', bus.miso),
+        getattr(bus, 'io2', None),
+        getattr(bus, 'io3', None),
+    )
 
-        self._run_coroutine_obj = None
-        self._restart()
 
-    def _restart(self):
-        if self._run_coroutine_obj is not None:
-            self._run_cr.kill()
-        self._run_cr = cocotb.start_soon(self._run())
+def _lane_groups(io: Tuple, width: int, lanes: int, msb_first: bool = True) -> Tuple:
+    """ Splits the wire-order bit masks of a word into one group of (lane, mask) per sclk cycle """
+    if lanes not in (1, 2, 4) or None in io[:lanes]:
+        raise ValueError(f"{lanes} lanes are not available on this bus")
+    if width % lanes:
+        raise ValueError(f"The word width must be a multiple of the {lanes} lanes")
+    masks = _bit_masks(width, msb_first)
+    signals = io[lanes - 1::-1]
+    return tuple(tuple(zip(signals, masks[k:k + lanes])) for k in range(0, width, lanes))
 
-    async def stop(self) -> None:
-        self.stop_no_wait()
-        await self._idle.wait()
 
-    def stop_no_wait(self) -> None:
-        self._start.clear()
-        self._sync.set()
+def _ddr_levels(edges: int, cpol: bool) -> Tuple[int, ...]:
+    """ The sclk level after each edge of a DDR word, which has to end back on the idle level """
+    if edges % 2:
+        raise ValueError("DDR needs an even number of bits per lane, so that sclk returns to its idle level")
+    return (int(not cpol), int(cpol)) * (edges // 2)
 
-    async def start(self) -> None:
-        self.start_no_wait()
 
-    def start_no_wait(self) -> None:
-        self._start.set()
-        self._sync.set()
+@lru_cache(maxsize=None)
+def _ddr_masks(width: int, msb_first: bool = True, cpol: bool = False) -> Tuple[Tuple[int, int, int], ...]:
+    """ (sclk level, sampled bit, next bit to propagate) for every edge of a DDR word """
+    return tuple(
+        (level, mask, next_mask)
+        for level, (mask, next_mask) in zip(_ddr_levels(width, cpol), _propagate_masks(width, msb_first))
+    )
 
-    async def _run(self):
-        t = Timer(self.half_period)
-        if self.start_high:
-            while True:
-                while not self._start.is_set():
-                    self._idle.set()
-                    self._sync.clear()
-                    await self._sync.wait()
-
-                self._idle.clear()
-                self.signal.value = 1
-                await t
-                if self._start.is_set():
-                    self.signal.value = 0
-                    await t
-        else:
-            while True:
-                while not self._start.is_set():
-                    self._idle.set()
-                    self._sync.clear()
-                    await self._sync.wait()
 
-                self._idle.clear()
-                self.signal.value = 0
-                await t
-                if self._start.is_set():
-                    self.signal.value = 1
-                    await t
+# every byte with its bits reversed, as a bytes.translate() table
+_REVERSED_BYTES = bytes(sum(((b >> k) & 1) << (7 - k) for k in range(8)) for b in range(256))
 
 
 def reverse_word(n: int, width: int) -> int:
-    return int('{:0{width}b}'.format(n, width=width)[::-1], 2)
+    """ Reverse the order of the lowest width bits of n, for any width
+
+    The word is reversed a byte at a time through a lookup table, the bytes themselves by swapping
+    the byte order, so no string is built.
+    """
+    num_bytes = (width + 7) // 8
+    n &= (1 << width) - 1
+    reversed_word = int.from_bytes(n.to_bytes(num_bytes, 'little').translate(_REVERSED_BYTES), 'big')
+    return reversed_word >> (num_bytes * 8 - width)
+
+
+def reverse_words(words, width: int):
+    """ reverse_word over a whole buffer in one call
+
+    Args:
+        words: a bytes-like object (for 8 bit words), a NumPy integer array or an iterable of ints
+        width: the number of bits per word
+
+    Returns:
+        a bytearray, a NumPy array of the same dtype and shape, or a list, following the input
+    """
+    if isinstance(words, (bytes, bytearray, memoryview)) and width == 8:
+        return bytearray(bytes(words).translate(_REVERSED_BYTES))
+
+    # numpy is optional, if it has not been imported the words can not be an array
+    np = sys.modules.get('numpy')
+    if np is not None and isinstance(words, np.ndarray):
+        if width > 64 or words.dtype == object:
+            return np.array([reverse_word(int(w), width) for w in words.flat], dtype=object).reshape(words.shape)
+        table = np.frombuffer(_REVERSED_BYTES, dtype=np.uint8)
+        padded = words.astype('<u8') & np.uint64((1 << width) - 1)
+        # reverse the bits of each little endian byte and read the bytes back as big endian, that
+        # reverses the 64 bit words
+        reversed_bytes = table[padded.view(np.uint8)]
+        reversed_words = reversed_bytes.view('>u8').reshape(words.shape)
+        return (reversed_words >> np.uint64(64 - width)).astype(words.dtype)
+
+    return [reverse_word(w, width) for w in words]
@@ -0,0 +1,125 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: 2021 Spencer Chang
+# Timing statistics of a bus, kept in fixed size histograms
+from array import array
+from typing import Dict
+from typing import Optional
+
+# the histograms have one bucket per power of two of ns, bucket k counts the durations in
+# [2**(k-1), 2**k) ns (bucket 0 the zero durations) and the last one everything longer
+HISTOGRAM_BUCKETS = 48
+
+
+def _bucket(ns: float) -> int:
+    return min(int(ns).bit_length(), HISTOGRAM_BUCKETS - 1)
+
+
+class SpiBusStats:
+    def __init__(self) -> None:
+        """ The timing of the frames a SpiMaster clocks, to see how close to saturation a bus runs
+
+        The master records every frame into it when it is given one (SpiMaster(..., stats=SpiBusStats())).
+        The distributions are log2 histograms in fixed size arrays, so recording a frame is a handful
+        of additions whatever the length of the simulation. All times are in ns of sim time.
+        """
+        # enqueue to completion of every write(), xfer() and transfer()
+        self.latency = array('Q', bytes(8 * HISTOGRAM_BUCKETS))
+        # the time the chip select is asserted for, per frame, and the idle time between frames
+        self.active = array('Q', bytes(8 * HISTOGRAM_BUCKETS))
+        self.idle = array('Q', bytes(8 * HISTOGRAM_BUCKETS))
+        self.reset()
+
+    def reset(self) -> None:
+        for histogram in (self.latency, self.active, self.idle):
+            histogram[:] = array('Q', bytes(8 * HISTOGRAM_BUCKETS))
+        self.frames = 0
+        self.bits = 0
+        self.latency_count = 0
+        self.latency_total_ns = 0.0
+        self.latency_max_ns = 0.0
+        self.active_ns = 0.0
+        self.idle_ns = 0.0
+        # the sclk periods of setup and hold around each word, and the frame_spacing_ns waits
+        self.setup_ns = 0.0
+        self.spacing_ns = 0.0
+        self.first_ns: Optional[float] = None
+        self.last_ns: Optional[float] = None
+
+    def record_latency(self, ns: float) -> None:
+        self.latency[_bucket(ns)] += 1
+        self.latency_count += 1
+        self.latency_total_ns += ns
+        if ns > self.latency_max_ns:
+            self.latency_max_ns = ns
+
+    def record_frame(self, start_ns: float, end_ns: float, bits: int, setup_ns: float, spacing_ns: float) -> None:
+        """ Add a chip select frame, asserted from start_ns to end_ns, followed by spacing_ns of frame spacing """
+        if self.last_ns is None:
+            self.first_ns = start_ns
+        else:
+            idle_ns = start_ns - self.last_ns
+            self.idle[_bucket(idle_ns)] += 1
+            self.idle_ns += idle_ns
+        active_ns = end_ns - start_ns
+        self.active[_bucket(active_ns)] += 1
+        self.active_ns += active_ns
+        self.last_ns = end_ns
+        self.frames += 1
+        self.bits += bits
+        self.setup_ns += setup_ns
+        self.spacing_ns += spacing_ns
+
+    @property
+    def span_ns(self) -> float:
+        """ From the start of the first frame to the end of the last one """
+        return self.last_ns - self.first_ns if self.frames else 0.0
+
+    @property
+    def utilization(self) -> float:
+        """ The fraction of the span the chip select is asserted for """
+        return self.active_ns / self.span_ns if self.span_ns else 0.0
+
+    @property
+    def bits_per_s(self) -> float:
+        """ The bits clocked over the span, the throughput achieved on the bus """
+        return self.bits * 1e9 / self.span_ns if self.span_ns else 0.0
+
+    @property
+    def overhead(self) -> float:
+        """ The fraction of the span lost to setup/hold periods and frame spacing """
+        return (self.setup_ns + self.spacing_ns) / self.span_ns if self.span_ns else 0.0
+
+    @property
+    def mean_latency_ns(self) -> float:
+        return self.latency_total_ns / self.latency_count if self.latency_count else 0.0
+
+    def latency_percentile(self, q: float) -> float:
+        """ An upper bound of the q-th percentile (0 to 100) of the latency, from its histogram """
+        rank = q / 100 * self.latency_count
+        seen = 0
+        for k, count in enumerate(self.latency):
+            seen += count
+            if count and seen >= rank:
+                return float(1 << k) if k < HISTOGRAM_BUCKETS - 1 else self.latency_max_ns
+        return 0.0
+
+    def as_dict(self) -> Dict:
+        """ The totals, derived figures and histograms, e.g. to be dumped as JSON """
+        return {
+            "frames": self.frames,
+            "bits": self.bits,
+            "span_ns": self.span_ns,
+            "active_ns": self.active_ns,
+            "idle_ns": self.idle_ns,
+            "setup_ns": self.setup_ns,
+            "spacing_ns": self.spacing_ns,
+            "utilization": self.utilization,
+            "bits_per_s": self.bits_per_s,
+            "overhead": self.overhead,
+            "latency_count": self.latency_count,
+            "mean_latency_ns": self.mean_latency_ns,
+            "max_latency_ns": self.latency_max_ns,
+            "latency_histogram": self.latency.tolist(),
+            "active_histogram": self.active.tolist(),
+            "idle_histogram": self.idle.tolist(),
+        }
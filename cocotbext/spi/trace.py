@@ -0,0 +1,234 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: 2021 Spencer Chang
+# Records frames into a compact binary trace, and replays a trace into a SpiMaster
+#
+# A trace is a header followed by one record per frame: a fixed size record header (time in ns,
+# target, word width, mode flags, word size in bytes, word count) then the MOSI and the MISO words,
+# little endian, with the word size of the array typecode that holds the word width.
+import dataclasses
+import mmap
+import struct
+import sys
+from array import array
+from dataclasses import dataclass
+from typing import BinaryIO
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Union
+
+from cocotb.triggers import Timer
+from cocotb.utils import get_sim_time
+
+from .monitor import SpiFrame
+from .spi import _word_typecode
+from .spi import SpiConfig
+from .spi import SpiMaster
+from .spi import SpiMessage
+from .spi import SpiTransfer
+
+_MAGIC = b'SPITRACE'
+_VERSION = 1
+_HEADER = struct.Struct('<8sI')
+_RECORD = struct.Struct('<dBBBBI')
+
+_CPOL = 1
+_CPHA = 2
+_MSB_FIRST = 4
+_DDR = 8
+
+
+@dataclass
+class SpiTraceRecord:
+    """ One frame of a trace, mosi and miso are views into the mapped file while it is open """
+    time_ns: float
+    target: int
+    word_width: int
+    cpol: bool
+    cpha: bool
+    msb_first: bool
+    ddr: bool
+    mosi: Union[memoryview, array]
+    miso: Union[memoryview, array]
+
+    def config(self, config: SpiConfig) -> SpiConfig:
+        """ config, with the mode and word width the frame was recorded with """
+        return dataclasses.replace(
+            config, word_width=self.word_width, cpol=self.cpol, cpha=self.cpha, msb_first=self.msb_first, ddr=self.ddr,
+        )
+
+
+class SpiTraceRecorder:
+    def __init__(
+        self,
+        file: Union[str, BinaryIO],
+        config: SpiConfig,
+        *,
+        target: int = 0,
+        buffer_size: int = 1 << 20,
+    ) -> None:
+        """ Writes frames into a binary trace, buffered and flushed buffer_size bytes at a time
+
+        The recorder is callable with a batch of frames, so it can be the callback of a SpiMonitor.
+
+        Args:
+            file: the path of the trace, or a binary file opened for writing
+            config: the SpiConfig the frames are recorded with, can be changed along with the bus
+            target: the chip select recorded with the frames
+            buffer_size: the number of bytes held before they are written out
+        """
+        self._file = open(file, 'wb') if isinstance(file, str) else file
+        self._owns_file = isinstance(file, str)
+        self.config = config
+        self.target = target
+        self.buffer_size = buffer_size
+        self._buffer = bytearray(_HEADER.pack(_MAGIC, _VERSION))
+
+    def __call__(self, frames: List[SpiFrame]) -> None:
+        for frame in frames:
+            self.record(frame.mosi, frame.miso, frame.start_time)
+
+    def record(self, mosi, miso, time_ns: Optional[float] = None, *, target: Optional[int] = None) -> None:
+        """ Add a frame to the trace
+
+        Args:
+            mosi: the words sent by the master
+            miso: the words received by the master, as many as mosi
+            time_ns: the start of the frame, the current sim time by default
+            target: overrides the target of the recorder for this frame
+        """
+        config = self.config
+        typecode = _word_typecode(config.word_width)
+        mosi = array(typecode, mosi)
+        miso = array(typecode, miso)
+        if len(mosi) != len(miso):
+            raise ValueError("Expected as many MISO words as MOSI words")
+        if sys.byteorder != 'little' and mosi.itemsize > 1:
+            mosi.byteswap()
+            miso.byteswap()
+
+        flags = (
+            (_CPOL if config.cpol else 0) | (_CPHA if config.cpha else 0)
+            | (_MSB_FIRST if config.msb_first else 0) | (_DDR if config.ddr else 0)
+        )
+        buffer = self._buffer
+        buffer += _RECORD.pack(
+            get_sim_time('ns') if time_ns is None else time_ns, self.target if target is None else target,
+            config.word_width, flags, mosi.itemsize, len(mosi),
+        )
+        buffer += mosi
+        buffer += miso
+        if len(buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """ Write out the buffered frames """
+        self._file.write(self._buffer)
+        self._buffer.clear()
+        self._file.flush()
+
+    def close(self) -> None:
+        self.flush()
+        if self._owns_file:
+            self._file.close()
+
+    def __enter__(self) -> 'SpiTraceRecorder':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class SpiTrace:
+    def __init__(self, path: str) -> None:
+        """ A memory mapped trace, the records are read straight from the mapping as they are iterated
+
+        The words of a record are views into the mapping, nothing is parsed ahead or copied (except
+        on a big endian host), so a trace of any size can be replayed in constant memory.
+        """
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+        magic, version = _HEADER.unpack_from(self._view)
+        if magic != _MAGIC:
+            raise ValueError(f"{path} is not a SPI trace")
+        if version != _VERSION:
+            raise ValueError(f"Unsupported SPI trace version {version}")
+
+    def __iter__(self) -> Iterator[SpiTraceRecord]:
+        view = self._view
+        offset = _HEADER.size
+        end = len(view)
+        while offset < end:
+            time_ns, target, word_width, flags, itemsize, count = _RECORD.unpack_from(view, offset)
+            offset += _RECORD.size
+            typecode = _word_typecode(itemsize * 8)
+            size = itemsize * count
+            mosi = view[offset:offset + size].cast(typecode)
+            miso = view[offset + size:offset + 2 * size].cast(typecode)
+            offset += 2 * size
+            if sys.byteorder != 'little' and itemsize > 1:
+                mosi, miso = array(typecode, mosi), array(typecode, miso)
+                mosi.byteswap()
+                miso.byteswap()
+            yield SpiTraceRecord(
+                time_ns, target, word_width,
+                bool(flags & _CPOL), bool(flags & _CPHA), bool(flags & _MSB_FIRST), bool(flags & _DDR),
+                mosi, miso,
+            )
+
+    async def replay(self, master: SpiMaster, *, target: Optional[int] = None, timing: bool = False) -> int:
+        """ Clock the MOSI words of every frame out of a SpiMaster, one chip select assertion per frame
+
+        The master is reconfigured whenever the mode of a frame differs from its config.
+
+        Args:
+            master: the SpiMaster to drive
+            target: the chip select to replay every frame to, by default the one each frame was recorded on
+            timing: if true, the frames start at the same offsets from each other as they were recorded,
+                else as soon as the bus is free
+
+        Returns:
+            the number of frames replayed
+        """
+        count = 0
+        start_ns = first_ns = None
+        for record in self:
+            frame_target = record.target if target is None else target
+            config = master._configs[frame_target]
+            if record.config(config) != config:
+                await master.reconfigure(record.config(config), target=frame_target)
+
+            if timing:
+                if start_ns is None:
+                    start_ns, first_ns = get_sim_time('ns'), record.time_ns
+                delay = start_ns + (record.time_ns - first_ns) - get_sim_time('ns')
+                if delay > 0:
+                    await Timer(delay, units='ns', round_mode='round')
+
+            if not len(record.mosi):
+                continue
+            message = SpiMessage([SpiTransfer(tx=record.mosi, word_width=record.word_width)])
+            await master.transfer(message, target=frame_target)
+            count += 1
+        return count
+
+    def close(self) -> None:
+        """ Unmap the trace
+
+        The words of the records are views into the mapping, drop the records (or copy the words to
+        keep, e.g. with list()) before closing. Records that are still alive keep the mapping open,
+        it is unmapped once the last of them is dropped.
+        """
+        self._view.release()
+        try:
+            self._mmap.close()
+        except BufferError:
+            # records still hold views into the mapping, freeing them unmaps it
+            pass
+
+    def __enter__(self) -> 'SpiTrace':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,248 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: 2021 Spencer Chang
+# Decodes the frames of a bus out of a VCD waveform dump, without a simulator
+import logging
+import re
+from typing import BinaryIO
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+from typing import Union
+
+from .monitor import _FrameWords
+from .monitor import SpiFrame
+from .spi import SpiConfig
+
+_log = logging.getLogger("cocotb.spi.vcd")
+
+# the roles of the signals, indices into the value lists of the decoder
+_SCLK, _MOSI, _MISO, _CS = range(4)
+
+_TIME_UNITS_NS = {'s': 1e9, 'ms': 1e6, 'us': 1e3, 'ns': 1.0, 'ps': 1e-3, 'fs': 1e-6}
+
+
+def decode_vcd(
+    file: Union[str, BinaryIO],
+    config: SpiConfig,
+    *,
+    scope: Optional[str] = None,
+    sclk_name: str = 'sclk',
+    mosi_name: str = 'mosi',
+    miso_name: str = 'miso',
+    cs_name: str = 'cs',
+    cs_bit: Optional[int] = None,
+) -> Iterator[SpiFrame]:
+    """ Yields the frames of a bus recorded in a VCD file, as SpiMonitor would have seen them
+
+    The dump is streamed line by line, only the value changes of the four signals are looked at and
+    only the words of the frame in progress are held, so memory use does not grow with the size of
+    the dump. Like the SpiMonitor, the bits are sampled on the capture edges of sclk, with the
+    MOSI/MISO levels from before any change in the same time step.
+
+    Args:
+        file: the path of the VCD file, or a binary file opened for reading
+        config: the SpiConfig the bus is clocked with (mode, bit order, chip select polarity, word width)
+        scope: the dotted scope of the signals, e.g. 'tb.dut.spi0'. Without it, each name must be
+            the last part of a single signal in the dump
+        sclk_name, mosi_name, miso_name, cs_name: the names of the signals
+        cs_bit: the bit of the chip select to follow, when cs is a vector
+
+    Returns:
+        an iterator over the frames, with times in ns
+    """
+    if isinstance(file, str):
+        with open(file, 'rb') as f:
+            yield from decode_vcd(
+                f, config, scope=scope, sclk_name=sclk_name, mosi_name=mosi_name, miso_name=miso_name,
+                cs_name=cs_name, cs_bit=cs_bit,
+            )
+        return
+
+    names = (sclk_name, mosi_name, miso_name, cs_name)
+    if scope is not None:
+        names = tuple(f"{scope}.{name}" for name in names)
+    roles, time_ns = _read_header(file, names)
+    decoder = _FrameDecoder(config, cs_bit)
+    new = decoder.new
+
+    # the value changes of the four signals are picked out of large chunks by a regex, the changes
+    # of every other signal and the time stamps never get to Python
+    idents = b'|'.join(re.escape(ident) for ident in sorted(roles, key=len, reverse=True))
+    pattern = re.compile(
+        rb'\n(?:([01xzXZ])(' + idents + rb')|[bB]([01xzXZ]+)[ \t]+(' + idents + rb'))(?=[ \t\r]*\n)',
+    )
+
+    step = None
+    for stamp, scalar, scalar_ident, vector, vector_ident in _changes(file, pattern):
+        if stamp != step:
+            # the first change of a time step, the previous one is complete
+            if step is not None:
+                frame = decoder.step(int(step) * time_ns)
+                if frame is not None:
+                    yield frame
+            step = stamp
+        if scalar:
+            # a scalar change, e.g. '1!', x and z read as 0
+            for role in roles[scalar_ident]:
+                new[role] = 1 if scalar == b'1' else 0
+        else:
+            # a vector change, e.g. 'b1010 !'
+            level = int(vector.translate(_X_TO_0), 2)
+            for role in roles[vector_ident]:
+                new[role] = level
+    if step is not None:
+        frame = decoder.step(int(step) * time_ns)
+        if frame is not None:
+            yield frame
+
+
+# x and z bits of a vector read as 0
+_X_TO_0 = bytes.maketrans(b'xzXZ', b'0000')
+
+
+class _FrameDecoder:
+    """ Turns the levels of the four signals at every time step into frames, like SpiMonitor """
+    def __init__(self, config: SpiConfig, cs_bit: Optional[int]) -> None:
+        self.config = config
+        self.cs_bit = cs_bit
+        self.cs_inactive = int(config.cs_active_low)
+        # the sclk level right after a capture edge, None when both edges capture (DDR)
+        self.capture_level = None if config.ddr else int(config.cpol == config.cpha)
+
+        # the levels at the end of the previous time step, and the ones the current time step moves to
+        cs_idle = self.cs_inactive if cs_bit is None else self.cs_inactive << cs_bit
+        self.old = [0, 0, 0, cs_idle]
+        self.new = list(self.old)
+
+        self.active = False
+        self.words = _FrameWords(config)
+        self.start_time = 0.0
+
+    def step(self, time: float) -> Optional[SpiFrame]:
+        """ Apply the changes of a time step, returns the frame it ends if any """
+        old, new = self.old, self.new
+        cs = new[_CS] if self.cs_bit is None else (new[_CS] >> self.cs_bit) & 1
+        asserted = cs != self.cs_inactive
+        if asserted and not self.active:
+            self.active = True
+            self.words.reset()
+            self.start_time = time
+
+        # the bits are sampled with the levels from before the edge
+        sclk = new[_SCLK]
+        if self.active and sclk != old[_SCLK] and (self.capture_level is None or sclk == self.capture_level):
+            self.words.add(old[_MOSI] & 1, old[_MISO] & 1)
+        old[:] = new
+
+        if not self.active or asserted:
+            return None
+        self.active = False
+        words = self.words
+        if words.word_bits:
+            _log.warning("Frame ended %d bits into a word", words.word_bits)
+        mosi, miso = words.words()
+        return SpiFrame(mosi, miso, words.num_bits, self.start_time, time)
+
+
+def _changes(file: BinaryIO, pattern: 're.Pattern', chunk_size: int = 1 << 22) -> Iterator[Tuple]:
+    """ The time stamp and the groups of every line of the file the pattern matches
+
+    The file is read chunk_size bytes at a time. The time stamp of a change is looked up backwards
+    from it in the chunk, only once per time step, so the time stamps are not matched one by one.
+    """
+    stamp = b'0'
+    # the lines are matched along with the newline before them
+    rest = b'\n'
+    while True:
+        chunk = file.read(chunk_size)
+        if not chunk:
+            buffer = rest + b'\n'
+        else:
+            # only whole lines are matched, the partial last one waits for the next chunk
+            end = chunk.rfind(b'\n') + 1
+            if not end:
+                rest += chunk
+                continue
+            buffer = rest + chunk[:end]
+            rest = b'\n' + chunk[end:]
+
+        stamp_pos = -1
+        for match in pattern.finditer(buffer):
+            pos = buffer.rfind(b'\n#', 0, match.start())
+            if pos != stamp_pos:
+                stamp_pos = pos
+                stamp = buffer[pos + 2:buffer.index(b'\n', pos + 2)]
+            yield (stamp,) + match.groups()
+        # the last time stamp of the chunk carries over to the changes at the start of the next one
+        pos = buffer.rfind(b'\n#')
+        if pos >= 0:
+            stamp = buffer[pos + 2:buffer.index(b'\n', pos + 2)]
+        if not chunk:
+            return
+
+
+def _read_header(file: BinaryIO, names: Tuple[str, ...]) -> Tuple[Dict[bytes, Tuple[int, ...]], float]:
+    """ Reads the declarations up to $enddefinitions
+
+    Returns:
+        the roles of the identifier codes of the signals, and the time unit of the dump in ns
+    """
+    time_ns = 1.0
+    scopes: List[str] = []
+    # every (full name, identifier code) of the dump that ends with one of the names
+    found: List[Tuple[str, bytes]] = []
+    leaves = {name.rpartition('.')[2] for name in names}
+
+    tokens = _tokens(file)
+    for token in tokens:
+        if token == '$scope':
+            next(tokens)
+            scopes.append(next(tokens))
+        elif token == '$upscope':
+            scopes.pop()
+        elif token == '$var':
+            next(tokens)
+            next(tokens)
+            ident = next(tokens)
+            ref = next(tokens)
+            if ref in leaves:
+                found.append(('.'.join(scopes + [ref]), ident.encode()))
+        elif token == '$timescale':
+            text = ''
+            for token in tokens:
+                if token == '$end':
+                    break
+                text += token
+            number = text.rstrip('munpfs')
+            time_ns = float(number) * _TIME_UNITS_NS[text[len(number):]]
+            continue
+        elif token == '$enddefinitions':
+            break
+        else:
+            continue
+        # skip to the $end of the declaration
+        for token in tokens:
+            if token == '$end':
+                break
+    else:
+        raise ValueError("The VCD file has no $enddefinitions")
+
+    roles: Dict[bytes, Tuple[int, ...]] = {}
+    for role, name in enumerate(names):
+        if '.' in name:
+            matches = [ident for full_name, ident in found if full_name == name]
+        else:
+            matches = [ident for full_name, ident in found if full_name.rpartition('.')[2] == name]
+        if not matches:
+            raise ValueError(f"There is no signal {name} in the VCD file")
+        if len(set(matches)) > 1:
+            raise ValueError(f"Several signals are named {name} in the VCD file, give their scope")
+        roles[matches[0]] = roles.get(matches[0], ()) + (role,)
+    return roles, time_ns
+
+
+def _tokens(file: BinaryIO) -> Iterator[str]:
+    for line in file:
+        yield from line.decode('latin-1').split()
@@ -19,23 +19,38 @@ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 THE SOFTWARE.
 """
+import array
+import dataclasses
 import itertools
 import logging
 import os
+import tempfile
 
 import cocotb
 import cocotb_test.simulator
+import pytest
+from cocotb.queue import QueueFull
 from cocotb.regression import TestFactory
+from cocotb.triggers import RisingEdge
 from cocotb.triggers import Timer
+from cocotb.utils import get_sim_time
 
 from cocotbext.spi import SpiBus
+from cocotbext.spi import SpiBusStats
 from cocotbext.spi import SpiConfig
+from cocotbext.spi import SpiFrameTimeout
 from cocotbext.spi import SpiMaster
+from cocotbext.spi import SpiMonitor
+from cocotbext.spi import SpiProfile
+from cocotbext.spi import SpiTrace
+from cocotbext.spi import SpiTraceRecorder
 from cocotbext.spi.devices.generic import SpiSlaveLoopback
 
 
 class TB:
-    def __init__(self, dut, sclk_freq, word_width, spi_mode, msb_first, ignore_rx_value):
+    def __init__(
+        self, dut, sclk_freq, word_width, spi_mode, msb_first, ignore_rx_value, ddr=False, profile=None, stats=None,
+    ):
         self.dut = dut
         self.log = logging.getLogger("cocotb.tb")
         self.log.setLevel(logging.DEBUG)
@@ -51,24 +66,29 @@ class TB:
             frame_spacing_ns=10,
             ignore_rx_value=ignore_rx_value,
             cs_active_low=True,
+            ddr=ddr,
         )
 
         dut.spi_mode.value = spi_mode
         dut.spi_word_width.value = word_width
 
-        self.source = SpiMaster(self.bus, self.config)
+        self.source = SpiMaster(self.bus, self.config, profile=profile, stats=stats)
         self.sink = SpiSlaveLoopback(self.bus, self.config)
 
 
-async def run_test(dut, payload_lengths, payload_data, sclk_freq=25e6, word_width=16, spi_mode=1, msb_first=True, ignore_rx_value=None):
-    tb = TB(dut, sclk_freq, word_width, spi_mode, msb_first, ignore_rx_value)
+async def run_test(
+    dut, payload_lengths, payload_data, sclk_freq=25e6, word_width=16, spi_mode=1, msb_first=True,
+    ignore_rx_value=None, ddr=False,
+):
+    tb = TB(dut, sclk_freq, word_width, spi_mode, msb_first, ignore_rx_value, ddr)
     tb.log.info(
-        "Running test with sclk_freq=%s mode=%s, msb_first=%s, word_width=%s, ignore_rx_value=%s",
+        "Running test with sclk_freq=%s mode=%s, msb_first=%s, word_width=%s, ignore_rx_value=%s, ddr=%s",
         sclk_freq,
         spi_mode,
         msb_first,
         word_width,
         ignore_rx_value,
+        ddr,
     )
 
     await Timer(10, 'us')
@@ -93,6 +113,369 @@ async def run_test(dut, payload_lengths, payload_data, sclk_freq=25e6, word_widt
     await Timer(100, 'us')
 
 
+@cocotb.test()
+async def run_test_reconfigure(dut):
+    """ Walk the configuration matrix with a single master/slave pair """
+    tb = TB(dut, 25e6, 8, 0, True, None)
+
+    await Timer(10, 'us')
+
+    test_data = incrementing_payload(8)
+    for sclk_freq, word_width, spi_mode, msb_first, ddr in itertools.product(
+        [15e6, 25e6], [8, 16, 32], [0, 1, 2, 3], [True, False], [False, True],
+    ):
+        tb.log.info(
+            "Reconfigure to sclk_freq=%s mode=%s, msb_first=%s, word_width=%s, ddr=%s",
+            sclk_freq, spi_mode, msb_first, word_width, ddr,
+        )
+        config = SpiConfig(
+            word_width=word_width,
+            sclk_freq=sclk_freq,
+            cpol=bool(spi_mode in [2, 3]),
+            cpha=bool(spi_mode in [1, 3]),
+            msb_first=msb_first,
+            frame_spacing_ns=10,
+            cs_active_low=True,
+            ddr=ddr,
+        )
+        dut.spi_mode.value = spi_mode
+        dut.spi_word_width.value = word_width
+        await tb.source.reconfigure(config)
+        await tb.sink.reconfigure(config)
+
+        await tb.source.write(test_data)
+        rx_data = await tb.source.read()
+        sink_content = await tb.sink.get_contents()
+        assert list(rx_data[1:]) + [sink_content] == list(test_data)
+
+    await Timer(10, 'us')
+
+
+@cocotb.test()
+async def run_test_bulk(dut):
+    """ Queue and drain buffers in bulk, packing bytes into 16 and 32 bit words """
+    tb = TB(dut, 25e6, 16, 1, True, None)
+
+    await Timer(10, 'us')
+
+    for word_width, byteorder in itertools.product([16, 32], ['big', 'little']):
+        config = dataclasses.replace(tb.config, word_width=word_width)
+        dut.spi_word_width.value = word_width
+        await tb.source.reconfigure(config)
+        await tb.sink.reconfigure(config)
+
+        word_bytes = word_width // 8
+        test_data = incrementing_payload(word_bytes * 16)
+
+        await tb.source.write_bytes(test_data, byteorder=byteorder)
+        rx_data = await tb.source.read_bytes(byteorder=byteorder)
+        sink_content = await tb.sink.get_contents()
+        assert rx_data[word_bytes:] + sink_content.to_bytes(word_bytes, byteorder) == test_data
+
+        # typed arrays go through the same path
+        words = array.array('H' if word_width == 16 else 'I', range(1, 9))
+        await tb.source.write(memoryview(words))
+        rx_words = await tb.source.read_array()
+        assert list(rx_words[1:]) == list(words[:-1])
+
+    await Timer(10, 'us')
+
+
+@cocotb.test()
+async def run_test_xfer(dut):
+    """ Pipeline xfer() calls from several coroutines, each gets the words received for its own data """
+    tb = TB(dut, 25e6, 8, 1, True, 0)
+
+    await Timer(10, 'us')
+
+    async def client(n):
+        tx = [n * 16 + k for k in range(4)]
+        rx = []
+        for _ in range(3):
+            rx.append(await tb.source.xfer(tx, burst=True))
+        return tx, rx
+
+    clients = [cocotb.start_soon(client(n)) for n in range(1, 4)]
+    results = [await c for c in clients]
+
+    # the loopback returns the previous word on the bus, whoever queued it
+    last_words = {tx[-1] for tx, _ in results}
+    for n, (tx, rx) in enumerate(results):
+        for k, words in enumerate(rx):
+            assert words[1:] == tx[:-1]
+            assert n == k == 0 or words[0] in last_words
+    assert tb.source.empty_rx()
+
+    # a write() handle carries the ignored words as well, the RX queue does not
+    await tb.source.xfer([0x55])
+    transaction = await tb.source.write([0, 1, 0, 2])
+    assert await transaction == [0x55, 0, 1, 0]
+    assert list(await tb.source.read()) == [0x55, 1]
+    assert await tb.sink.get_contents() == 2
+
+    await Timer(10, 'us')
+
+
+@cocotb.test()
+async def run_test_stream(dut):
+    """ Stream words through bounded queues, fed by an async generator and drained with async for """
+    tb = TB(dut, 25e6, 8, 0, True, None)
+    tb.source.tx_queue_limit = 4
+    tb.source.rx_queue_limit = 8
+
+    await Timer(10, 'us')
+
+    test_data = incrementing_payload(96)
+
+    async def feed():
+        for k in range(0, len(test_data), 3):
+            # the generator is only resumed once the TX queue has drained below its limit
+            assert tb.source.count_tx() < 4
+            yield test_data[k:k + 3]
+
+    async def drain():
+        rx_data = []
+        async for word in tb.source:
+            assert tb.source.count_rx() < 8
+            rx_data.append(word)
+            if len(rx_data) == len(test_data):
+                return rx_data
+            # a slow reader, the master has to stall on the full RX queue
+            await Timer(2, 'us')
+
+    reader = cocotb.start_soon(drain())
+    assert await tb.source.write_stream(feed()) == len(test_data)
+    rx_data = await reader
+    sink_content = await tb.sink.get_contents()
+    assert rx_data[1:] + [sink_content] == list(test_data)
+
+    await Timer(10, 'us')
+
+
+@cocotb.test()
+async def run_test_queue_limit(dut):
+    """ Writes longer than the TX queue limit go in a part at a time, the queue never holds more than the limit """
+    tb = TB(dut, 25e6, 8, 0, True, None)
+    tb.source.tx_queue_limit = 4
+
+    await Timer(10, 'us')
+
+    # words that do not fit are refused as a whole
+    with pytest.raises(QueueFull):
+        tb.source.write_nowait(range(10))
+    assert tb.source.count_tx() == 0
+
+    max_count = 0
+
+    async def watch():
+        nonlocal max_count
+        while True:
+            await RisingEdge(tb.bus.sclk)
+            max_count = max(max_count, tb.source.count_tx())
+
+    watcher = cocotb.start_soon(watch())
+    test_data = incrementing_payload(64)
+    await tb.source.write(test_data)
+    await tb.source.write(list(test_data), burst=True)
+    assert len(await tb.source.xfer(list(range(10)))) == 10
+    await tb.source.write_bytes(bytes(12))
+    watcher.kill()
+
+    assert 0 < max_count <= 4
+    assert len(await tb.source.read()) == 2 * len(test_data) + 12
+
+    await Timer(10, 'us')
+
+
+@cocotb.test()
+async def run_test_timeout(dut):
+    """ A blocking call that can never complete raises SpiFrameTimeout instead of hanging """
+    tb = TB(dut, 25e6, 8, 0, True, None)
+    tb.source.timeout_ns = 5000
+
+    await Timer(10, 'us')
+
+    # nothing was written, so nothing is ever received
+    start = get_sim_time('ns')
+    with pytest.raises(SpiFrameTimeout):
+        await tb.source.read(1)
+    assert get_sim_time('ns') - start == 5000
+
+    # the per call timeout overrides the master's
+    start = get_sim_time('ns')
+    with pytest.raises(SpiFrameTimeout):
+        await tb.source.read(1, timeout_ns=100)
+    assert get_sim_time('ns') - start == 100
+
+    # within the deadline nothing changes
+    await tb.source.write([0x5A])
+    assert await tb.sink.get_contents(timeout_ns=1000) == 0x5A
+    assert len(await tb.source.read(1)) == 1
+
+    await Timer(10, 'us')
+
+
+@cocotb.test()
+async def run_test_monitor(dut):
+    """ A monitor on the bus sees the same words as the master and the slave """
+    tb = TB(dut, 25e6, 16, 1, False, None)
+
+    batches = []
+    monitor = SpiMonitor(tb.bus, tb.config, batch_size=4, callback=batches.append)
+    queued = SpiMonitor(tb.bus, tb.config)
+
+    await Timer(10, 'us')
+
+    test_data = [0x1234 * (k + 1) & 0xffff for k in range(8)]
+    for word in test_data:
+        await tb.source.write([word])
+    rx_data = list(await tb.source.read())
+
+    # one frame per write, the frames come in batches
+    assert [len(batch) for batch in batches] == [4, 4]
+    frames = [frame for batch in batches for frame in batch]
+    assert [frame.mosi for frame in frames] == [[word] for word in test_data]
+    assert [frame.miso for frame in frames] == [[word] for word in rx_data]
+    assert all(frame.num_bits == 16 and frame.start_time < frame.end_time for frame in frames)
+
+    assert queued.count() == len(test_data)
+    assert (await queued.recv()).mosi == [test_data[0]]
+
+    # a burst is a single frame
+    await tb.source.write(test_data[:3], burst=True)
+    monitor.flush()
+    assert batches[-1][-1].mosi == test_data[:3]
+
+    await Timer(10, 'us')
+
+
+@cocotb.test()
+async def run_test_trace(dut):
+    """ Record the frames seen by a monitor, then replay the trace into the master """
+    tb = TB(dut, 25e6, 16, 0, True, None)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bus.spitrace")
+        recorder = SpiTraceRecorder(path, tb.config, buffer_size=64)
+        monitor = SpiMonitor(tb.bus, tb.config, batch_size=3, callback=recorder)
+
+        await Timer(10, 'us')
+
+        test_data = [[0x1234], [0xABCD, 0x5A5A], [0x0001, 0x0002, 0x0003]]
+        for words in test_data:
+            await tb.source.write(words, burst=True)
+        recorder.close()
+        tb.source.clear()
+
+        frames = []
+        monitor.callback = frames.extend
+        with SpiTrace(path) as trace:
+            records = [(record.word_width, record.mosi.tolist(), record.miso.tolist()) for record in trace]
+            assert [(width, mosi) for width, mosi, _ in records] == [(16, words) for words in test_data]
+            assert all(len(miso) == len(mosi) for _, mosi, miso in records)
+
+            assert await trace.replay(tb.source, timing=True) == len(test_data)
+        monitor.flush()
+        assert [frame.mosi for frame in frames] == test_data
+
+    await Timer(10, 'us')
+
+
+@cocotb.test()
+async def run_test_profile(dut):
+    """ The profiling counters of the master and the slave follow the frames clocked """
+    master_profile = SpiProfile()
+    slave_profile = SpiProfile()
+    tb = TB(dut, 25e6, 16, 1, True, None, profile=master_profile)
+    tb.sink.profile = slave_profile
+
+    await Timer(10, 'us')
+    master_profile.reset()
+
+    start = get_sim_time('ns')
+    await tb.source.write([0x1234, 0x5678, 0x9ABC])
+    await tb.source.write([0x1111, 0x2222], burst=True)
+    await tb.sink.wait()
+    elapsed = get_sim_time('ns') - start
+
+    # one frame per word, then a single frame for the burst
+    assert master_profile.frames == 4
+    assert master_profile.bits == 5 * 16
+    assert 0 < master_profile.sim_ns <= elapsed
+    # at least one wake-up per sclk edge
+    assert master_profile.awaits_per_frame >= 2 * 16
+    assert master_profile.wall_s > 0
+
+    # the loopback handles one word per frame, and stops at the end of the burst frame
+    assert slave_profile.frames == 4
+    assert slave_profile.bits == 4 * 16
+    assert 0 < slave_profile.sim_ns_per_frame < elapsed
+    assert slave_profile.awaits >= 4 * 16
+
+    # resetting is just zeroing the counters, the instances keep counting into the same profile
+    slave_profile.reset()
+    assert slave_profile == SpiProfile()
+    await tb.source.write([0x4321])
+    await tb.sink.wait()
+    assert slave_profile.frames == 1
+
+    # a profile attached to a master after it was built counts the awaits and time too, not just the frames
+    late_profile = SpiProfile()
+    tb.source.profile = late_profile
+    await tb.source.write([0x1357, 0x2468])
+    await tb.sink.wait()
+    assert late_profile.frames == 2
+    assert late_profile.bits == 2 * 16
+    assert late_profile.awaits_per_frame >= 2 * 16
+    assert late_profile.wall_s > 0 and late_profile.sim_ns > 0
+
+    # and detaching it stops the counting
+    tb.source.profile = None
+    await tb.source.write([0x1357])
+    await tb.sink.wait()
+    assert late_profile.frames == 2
+
+    await Timer(10, 'us')
+
+
+@cocotb.test()
+async def run_test_stats(dut):
+    """ The bus stats of the master account for every frame and the gaps between them """
+    stats = SpiBusStats()
+    tb = TB(dut, 25e6, 16, 0, True, None, stats=stats)
+
+    await Timer(10, 'us')
+
+    start = get_sim_time('ns')
+    await tb.source.write([0x1234, 0x5678, 0x9ABC, 0xDEF0])
+    await Timer(1, 'us')
+    await tb.source.write([0x1111, 0x2222], burst=True)
+    elapsed = get_sim_time('ns') - start
+
+    assert stats.frames == 5
+    assert stats.bits == 6 * 16
+    assert sum(stats.active) == 5
+    assert sum(stats.idle) == 4
+    assert stats.active_ns + stats.idle_ns == stats.span_ns <= elapsed
+    assert 0 < stats.utilization < 1
+    assert 0 < stats.bits_per_s < 25e6
+
+    # a period of 40 ns before and after each word, and 10 ns of frame spacing after it
+    assert stats.setup_ns == 6 * 2 * 40
+    assert stats.spacing_ns == 6 * 10
+
+    # one latency per write, the first one waited for its four frames
+    assert stats.latency_count == 2
+    assert stats.latency_max_ns >= 4 * 16 * 40
+    assert stats.mean_latency_ns <= stats.latency_percentile(100)
+
+    assert stats.as_dict()["frames"] == 5
+    stats.reset()
+    assert stats.frames == 0 and not any(stats.latency)
+
+    await Timer(10, 'us')
+
+
 def size_list():
     return list(range(1, 16)) + [128]
 
@@ -112,6 +495,15 @@ if cocotb.SIM_NAME:
     factory.add_option("ignore_rx_value", [None, 0, 128])
     factory.generate_tests()
 
+    factory = TestFactory(run_test)
+    factory.add_option("payload_lengths", [size_list])
+    factory.add_option("payload_data", [incrementing_payload])
+    factory.add_option("word_width", [8, 16, 32])
+    factory.add_option("spi_mode", [0, 1, 2, 3])
+    factory.add_option("msb_first", [True, False])
+    factory.add_option("ddr", [True])
+    factory.generate_tests(prefix="ddr_")
+
 
 # cocotb-test
 tests_dir = os.path.dirname(__file__)
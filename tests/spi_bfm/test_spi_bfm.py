@@ -0,0 +1,109 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: 2021 Spencer Chang
+import logging
+import os
+
+import cocotb
+import cocotb_test.simulator
+from cocotb.regression import TestFactory
+from cocotb.triggers import Timer
+
+from cocotbext.spi import bfm_sources
+from cocotbext.spi import SpiBus
+from cocotbext.spi import SpiConfig
+from cocotbext.spi import SpiMaster
+from cocotbext.spi import SpiMasterBfm
+from cocotbext.spi import SpiSlaveBfm
+from cocotbext.spi import SpiTransfer
+from cocotbext.spi.devices.generic import SpiSlaveLoopback
+
+
+class TB:
+    def __init__(self, dut, word_width, spi_mode, msb_first, ddr):
+        self.dut = dut
+        self.log = logging.getLogger("cocotb.tb")
+        self.log.setLevel(logging.DEBUG)
+
+        self.bus = SpiBus.from_entity(dut, cs_name="ncs")
+
+        self.config = SpiConfig(
+            word_width=word_width,
+            sclk_freq=25e6,
+            cpol=bool(spi_mode in [2, 3]),
+            cpha=bool(spi_mode in [1, 3]),
+            msb_first=msb_first,
+            frame_spacing_ns=10,
+            cs_active_low=True,
+            ddr=ddr,
+        )
+
+        dut.spi_mode.value = spi_mode
+        dut.spi_word_width.value = word_width
+
+        self.source = SpiMaster(self.bus, self.config, bfm=SpiMasterBfm.from_prefix(dut, "master_bfm"))
+        self.sink = SpiSlaveLoopback(self.bus, self.config, bfm=SpiSlaveBfm.from_prefix(dut, "slave_bfm"))
+
+
+async def run_test(dut, word_width=16, spi_mode=1, msb_first=True, ddr=False):
+    tb = TB(dut, word_width, spi_mode, msb_first, ddr)
+    tb.log.info("Running test with mode=%s, msb_first=%s, word_width=%s, ddr=%s", spi_mode, msb_first, word_width, ddr)
+
+    await Timer(10, 'us')
+
+    mask = (1 << word_width) - 1
+    for length in [1, 2, 5, 16]:
+        test_data = [(0x1234_5678_9ABC_DEF1 * (k + 1)) & mask for k in range(length)]
+        await tb.source.write(test_data)
+
+        rx_data = await tb.source.read()
+        sink_content = await tb.sink.get_contents()
+        assert list(rx_data[1:]) + [sink_content] == test_data
+
+    # transfer chains keep the clock running across words, through the BFM as well
+    message = await tb.source.transfer([SpiTransfer(tx=[0xA5 & mask])])
+    assert message.transfers[0].rx == [test_data[-1]]
+
+    await Timer(10, 'us')
+
+
+if cocotb.SIM_NAME:
+    factory = TestFactory(run_test)
+    factory.add_option("word_width", [8, 16, 32, 40])
+    factory.add_option("spi_mode", [0, 1, 2, 3])
+    factory.add_option("msb_first", [True, False])
+    factory.add_option("ddr", [False, True])
+    factory.generate_tests()
+
+
+# cocotb-test
+
+tests_dir = os.path.dirname(__file__)
+
+
+def test_spi_bfm(request):
+    dut = "test_spi_bfm"
+    module = os.path.splitext(os.path.basename(__file__))[0]
+    toplevel = dut
+
+    verilog_sources = [
+        os.path.join(tests_dir, f"{dut}.v"),
+    ] + bfm_sources()
+
+    parameters = {}
+
+    extra_env = {f'PARAM_{k}': str(v) for k, v in parameters.items()}
+
+    sim_build = os.path.join(
+        tests_dir, "sim_build",
+        request.node.name.replace('[', '-').replace(']', ''),
+    )
+
+    cocotb_test.simulator.run(
+        python_search=[tests_dir],
+        verilog_sources=verilog_sources,
+        toplevel=toplevel,
+        module=module,
+        parameters=parameters,
+        sim_build=sim_build,
+        extra_env=extra_env,
+    )
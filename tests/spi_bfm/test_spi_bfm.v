@@ -0,0 +1,78 @@
+`timescale 1ns / 1ps
+
+module test_spi_bfm
+(
+    output wire sclk,
+    output wire mosi,
+    output wire miso,
+    inout wire ncs,
+    inout wire [1:0] spi_mode,
+    inout wire [5:0] spi_word_width,
+
+    inout wire master_bfm_sclk_in,
+    inout wire master_bfm_mosi_in,
+    inout wire [63:0] master_bfm_tx_word,
+    inout wire master_bfm_mosi_next,
+    output wire [63:0] master_bfm_rx_word,
+    inout wire [7:0] master_bfm_word_width,
+    inout wire master_bfm_cpha,
+    inout wire master_bfm_ddr,
+    inout wire master_bfm_msb_first,
+    inout wire [31:0] master_bfm_step_ps,
+    inout wire master_bfm_req,
+    output wire master_bfm_ack,
+
+    inout wire slave_bfm_miso_in,
+    inout wire [63:0] slave_bfm_tx_word,
+    output wire [63:0] slave_bfm_rx_word,
+    inout wire [7:0] slave_bfm_word_width,
+    inout wire slave_bfm_cpha,
+    inout wire slave_bfm_ddr,
+    inout wire slave_bfm_cs_active_low,
+    inout wire slave_bfm_req,
+    output wire slave_bfm_ack,
+    output wire slave_bfm_frame_error
+);
+
+spi_bfm_master #(
+    .MAX_WORD_WIDTH(64)
+)
+master_bfm (
+    .sclk_in(master_bfm_sclk_in),
+    .mosi_in(master_bfm_mosi_in),
+    .tx_word(master_bfm_tx_word),
+    .mosi_next(master_bfm_mosi_next),
+    .rx_word(master_bfm_rx_word),
+    .word_width(master_bfm_word_width),
+    .cpha(master_bfm_cpha),
+    .ddr(master_bfm_ddr),
+    .msb_first(master_bfm_msb_first),
+    .step_ps(master_bfm_step_ps),
+    .req(master_bfm_req),
+    .ack(master_bfm_ack),
+    .sclk(sclk),
+    .mosi(mosi),
+    .miso(miso)
+);
+
+spi_bfm_slave #(
+    .MAX_WORD_WIDTH(64)
+)
+slave_bfm (
+    .miso_in(slave_bfm_miso_in),
+    .tx_word(slave_bfm_tx_word),
+    .rx_word(slave_bfm_rx_word),
+    .word_width(slave_bfm_word_width),
+    .cpha(slave_bfm_cpha),
+    .ddr(slave_bfm_ddr),
+    .cs_active_low(slave_bfm_cs_active_low),
+    .req(slave_bfm_req),
+    .ack(slave_bfm_ack),
+    .frame_error(slave_bfm_frame_error),
+    .sclk(sclk),
+    .mosi(mosi),
+    .miso(miso),
+    .cs(ncs)
+);
+
+endmodule // test_spi_bfm
@@ -10,6 +10,7 @@ from cocotb.triggers import Timer
 from cocotbext.spi import SpiBus
 from cocotbext.spi import SpiConfig
 from cocotbext.spi import SpiMaster
+from cocotbext.spi import SpiTransfer
 from cocotbext.spi.devices.ADI import ADXL345
 
 
@@ -59,12 +60,29 @@ async def run_test_adxl345(dut):
 
     await Timer(200, units='ns')
 
+    # test a multibyte read clocked as a single transfer chain
+    message = await tb.source.transfer([
+        SpiTransfer(tx=[tb.sink.create_spi_command("read", 0x2C, multibyte=True)]),
+        SpiTransfer(length=5),
+    ])
+    assert message.transfers[1].rx == [0b0000_1010, 0x00, 0x00, 0x00, 0b0000_0010]
+
+    await Timer(200, units='ns')
+
     # test a multibyte write
     await tb.source.write([tb.sink.create_spi_command("write", 0x1e, multibyte=True), 0x01, 0b11, 0xAA], burst=True)
     assert (await tb.sink.get_register(0x1e)) == 0x01
     assert (await tb.sink.get_register(0x1f)) == 0b11
     assert (await tb.sink.get_register(0x20)) == 0xAA
 
+    await Timer(200, units='ns')
+
+    # DEVID is read only
+    await tb.source.write([tb.sink.create_spi_command("write", 0x00), 0x12], burst=True)
+    assert (await tb.sink.get_register(0x00)) == 0b1110_0101
+    registers = await tb.sink.get_registers()
+    assert registers["DEVID"] == 0b1110_0101 and registers["OFSZ"] == 0xAA
+
     await Timer(5, 'us')
 
 
@@ -25,6 +25,7 @@ import os
 import cocotb
 import cocotb_test.simulator
 from cocotb.triggers import Timer
+from cocotb.utils import get_sim_time
 
 from cocotbext.spi import SpiBus
 from cocotbext.spi import SpiConfig
@@ -85,6 +86,37 @@ async def run_test_ads8028(dut):
 
     await Timer(5, 'us')
 
+
+@cocotb.test()
+async def run_test_ads8028_backdoor(dut):
+    tb = TB(dut)
+    await Timer(10, 'us')
+
+    address_mask = 0xF000
+    data_mask = 0x0FFF
+
+    # program the sequencer in zero sim time
+    tb.source.set_backdoor(tb.sink)
+    start_time = get_sim_time()
+    await tb.source.write([tb.sink.create_spi_word("write", 0b111100011100100)])
+    _ = await tb.source.read()
+    await tb.source.write([tb.sink.create_spi_word("read", 0x0000)])
+    _ = await tb.source.read()
+    await tb.source.write([tb.sink.create_spi_word("read", 0x0000)])
+    ain0 = (await tb.source.read())[0]
+    assert get_sim_time() == start_time
+    assert ain0 & address_mask == 0 << 12
+    assert ain0 & data_mask == 0
+
+    # the next conversion of the sequence comes out on the wire
+    tb.source.set_backdoor(None)
+    await tb.source.write([tb.sink.create_spi_word("read", 0x0000)])
+    ain1 = (await tb.source.read())[0]
+    assert ain1 & address_mask == 1 << 12
+    assert ain1 & data_mask == 1
+
+    await Timer(5, 'us')
+
 # cocotb-test
 
 tests_dir = os.path.dirname(__file__)
@@ -0,0 +1,119 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: 2021 Spencer Chang
+import logging
+import os
+
+import cocotb
+import cocotb_test.simulator
+from cocotb.triggers import Timer
+
+from cocotbext.spi import SpiBus
+from cocotbext.spi import SpiMaster
+from cocotbext.spi.loader import load_device
+
+tests_dir = os.path.dirname(__file__)
+
+
+class TB:
+    def __init__(self, dut, description):
+        self.dut = dut
+        self.log = logging.getLogger("cocotb.tb")
+        self.log.setLevel(logging.DEBUG)
+
+        self.bus = SpiBus.from_entity(dut, cs_name="ncs")
+
+        device = load_device(os.path.join(tests_dir, description))
+        self.config = device._config
+
+        self.source = SpiMaster(self.bus, self.config)
+        self.sink = device(self.bus)
+
+
+@cocotb.test()
+async def run_test_described_adxl345(dut):
+    tb = TB(dut, "adxl345.json")
+    await Timer(10, 'us')
+
+    # test a single byte read
+    await tb.source.write([tb.sink.create_spi_command("read", 0x00), 0x00], burst=True)
+    read_word = (await tb.source.read(2))[1]
+    assert read_word == 0b1110_0101
+
+    await Timer(200, units='ns')
+
+    # test a multibyte read
+    await tb.source.write(
+        [
+            tb.sink.create_spi_command("read", 0x2C, multibyte=True),
+            0x00, 0x00, 0x00, 0x00, 0x00,
+        ], burst=True,
+    )
+    read_word = (await tb.source.read(6))[1:]
+    assert list(read_word) == [0b0000_1010, 0x00, 0x00, 0x00, 0b0000_0010]
+
+    await Timer(200, units='ns')
+
+    # test a multibyte write, DEVID is read only
+    await tb.source.write([tb.sink.create_spi_command("write", 0x1E, multibyte=True), 0x01, 0b11, 0xAA], burst=True)
+    await tb.source.write([tb.sink.create_spi_command("write", 0x00), 0x12], burst=True)
+    registers = await tb.sink.get_registers()
+    assert registers["OFSX"] == 0x01 and registers["OFSY"] == 0b11 and registers["OFSZ"] == 0xAA
+    assert registers["DEVID"] == 0b1110_0101
+
+    await Timer(5, 'us')
+
+
+@cocotb.test()
+async def run_test_described_drv8304(dut):
+    tb = TB(dut, "drv8304.json")
+    await Timer(10, 'us')
+
+    # test a read
+    await tb.source.write([tb.sink.create_spi_word("read", 0x03)])
+    read_word = (await tb.source.read(1))[0]
+    assert read_word & 0x7FF == 0b01101110111
+
+    await Timer(500, units='ns')
+
+    # test a write, and read it back
+    await tb.source.write([tb.sink.create_spi_word("write", 0x05, 0b00101000111)])
+    assert (await tb.sink.get_register(0x05)) == 0b00101000111
+
+    await Timer(500, units='ns')
+
+    await tb.source.write([tb.sink.create_spi_word("read", 0x05)])
+    read_word = (await tb.source.read(1))[0]
+    assert read_word & 0x7FF == 0b00101000111
+
+    await Timer(5, 'us')
+
+
+# cocotb-test
+
+def test_described(request):
+    dut = "test_described"
+    module = os.path.splitext(os.path.basename(__file__))[0]
+    toplevel = dut
+
+    verilog_sources = [
+        os.path.join(tests_dir, f"{dut}.v"),
+    ]
+
+    parameters = {}
+
+    extra_env = {f'PARAM_{k}': str(v) for k, v in parameters.items()}
+
+    sim_build = os.path.join(
+        tests_dir, "sim_build",
+        request.node.name.replace('[', '-').replace(']', ''),
+    )
+
+    cocotb_test.simulator.run(
+        python_search=[tests_dir],
+        verilog_sources=verilog_sources,
+        toplevel=toplevel,
+        module=module,
+        parameters=parameters,
+        sim_build=sim_build,
+        extra_env=extra_env,
+    )
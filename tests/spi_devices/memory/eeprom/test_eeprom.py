@@ -0,0 +1,145 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: 2021 Spencer Chang
+import logging
+import os
+
+import cocotb
+import cocotb_test.simulator
+from cocotb.regression import TestFactory
+from cocotb.triggers import Timer
+
+from cocotbext.spi import SpiBus
+from cocotbext.spi import SpiConfig
+from cocotbext.spi import SpiMaster
+from cocotbext.spi.devices.memory import SpiEeprom
+
+
+class TB:
+    def __init__(self, dut, spi_mode, size, page_size, write_cycle_ns=None):
+        self.dut = dut
+        self.log = logging.getLogger("cocotb.tb")
+        self.log.setLevel(logging.DEBUG)
+
+        self.bus = SpiBus.from_entity(dut, cs_name="ncs")
+
+        self.config = SpiConfig(
+            word_width=8,
+            sclk_freq=25e6,
+            cpol=spi_mode == 3,
+            cpha=spi_mode == 3,
+            msb_first=True,
+            frame_spacing_ns=50,
+            cs_active_low=True,
+        )
+
+        self.source = SpiMaster(self.bus, self.config)
+        self.sink = SpiEeprom(
+            self.bus, size, page_size=page_size, write_cycle_ns=write_cycle_ns, config=self.config,
+        )
+
+    async def command(self, operation, address=None, data=(), length=0):
+        """ Clock a command and its data, and return the bytes received after the command """
+        command = self.sink.create_spi_command(operation, address)
+        await self.source.write(command + list(data) + [0] * length, burst=True)
+        return bytes((await self.source.read(len(command) + len(data) + length))[len(command):])
+
+    async def wait_ready(self):
+        while (await self.command("read_status", length=1))[0] & 0b1:
+            await Timer(1, 'us')
+
+
+async def run_test_eeprom(dut, spi_mode=0):
+    # a 1 Mbit part, with 256 byte pages
+    tb = TB(dut, spi_mode, 128 << 10, 256, write_cycle_ns=2000)
+    await Timer(10, 'us')
+
+    # never written to, reads as erased without allocating anything
+    assert await tb.command("read", 0x1FF00, length=8) == b"\xff" * 8
+    assert tb.sink.pages_allocated == 0
+
+    # a write without write enable is ignored
+    await tb.command("write", 0x100, b"\x12")
+    assert await tb.command("read", 0x100, length=1) == b"\xff"
+
+    # a write wraps around within its page
+    await tb.command("write_enable")
+    assert await tb.command("read_status", length=1) == b"\x02"
+    await tb.command("write", 0x1FE, b"\x01\x02\x03\x04")
+    assert await tb.command("read_status", length=2) == b"\x01\x01"
+    await tb.wait_ready()
+    assert await tb.command("read", 0x1FE, length=2) == b"\x01\x02"
+    assert await tb.command("read", 0x100, length=2) == b"\x03\x04"
+    assert tb.sink.pages_allocated == 1
+
+    # a sequential read goes on across pages, and wraps around at the end of the memory
+    tb.sink.write_memory(0x1FFFE, b"\xaa\xbb")
+    assert await tb.command("read", 0x1FFFC, length=6) == b"\xff\xff\xaa\xbb\xff\xff"
+    assert await tb.command("read", 0xF0, length=0x20) == b"\xff" * 0x10 + b"\x03\x04" + b"\xff" * 0x0E
+
+    # protect the upper half of the memory
+    await tb.command("write_enable")
+    await tb.command("write_status", data=b"\x08")
+    await tb.wait_ready()
+    await tb.command("write_enable")
+    await tb.command("write", 0x10000, b"\x55")
+    await tb.wait_ready()
+    assert await tb.command("read", 0x10000, length=1) == b"\xff"
+    assert await tb.command("read_status", length=1) == b"\x08"
+
+    await Timer(5, 'us')
+
+
+async def run_test_fram(dut, spi_mode=0):
+    # a 64 kbit FRAM, no pages and no write cycle
+    tb = TB(dut, spi_mode, 8 << 10, None)
+    assert tb.sink.write_cycle_ns == 0
+    await Timer(10, 'us')
+
+    # a write goes on to the end of the memory and wraps around to 0
+    await tb.command("write_enable")
+    await tb.command("write", 0x1FFE, b"\x01\x02\x03\x04")
+    assert await tb.command("read_status", length=1) == b"\x00"
+    assert await tb.command("read", 0x1FFE, length=4) == b"\x01\x02\x03\x04"
+
+    await Timer(5, 'us')
+
+
+if cocotb.SIM_NAME:
+    for test in [run_test_eeprom, run_test_fram]:
+        factory = TestFactory(test)
+        factory.add_option("spi_mode", [0, 3])
+        factory.generate_tests()
+
+
+# cocotb-test
+
+tests_dir = os.path.dirname(__file__)
+
+
+def test_eeprom(request):
+    dut = "test_eeprom"
+    module = os.path.splitext(os.path.basename(__file__))[0]
+    toplevel = dut
+
+    verilog_sources = [
+        os.path.join(tests_dir, f"{dut}.v"),
+    ]
+
+    parameters = {}
+
+    extra_env = {f'PARAM_{k}': str(v) for k, v in parameters.items()}
+
+    sim_build = os.path.join(
+        tests_dir, "sim_build",
+        request.node.name.replace('[', '-').replace(']', ''),
+    )
+
+    cocotb_test.simulator.run(
+        python_search=[tests_dir],
+        verilog_sources=verilog_sources,
+        toplevel=toplevel,
+        module=module,
+        parameters=parameters,
+        sim_build=sim_build,
+        extra_env=extra_env,
+    )
@@ -0,0 +1,11 @@
+`timescale 1ns / 1ps
+
+module test_eeprom
+(
+    inout wire sclk,
+    inout wire mosi,
+    inout wire miso,
+    inout wire ncs
+);
+
+endmodule // test_eeprom
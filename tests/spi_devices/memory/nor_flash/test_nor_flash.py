@@ -0,0 +1,131 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: 2021 Spencer Chang
+import logging
+import os
+import tempfile
+
+import cocotb
+import cocotb_test.simulator
+from cocotb.regression import TestFactory
+from cocotb.triggers import Timer
+
+from cocotbext.spi import SpiBus
+from cocotbext.spi import SpiConfig
+from cocotbext.spi import SpiMaster
+from cocotbext.spi.devices.memory import SpiNorFlash
+
+IMAGE_SIZE = 1 << 20
+BOOT_IMAGE = bytes(range(256)) * 2
+
+
+class TB:
+    def __init__(self, dut, spi_mode):
+        self.dut = dut
+        self.log = logging.getLogger("cocotb.tb")
+        self.log.setLevel(logging.DEBUG)
+
+        self.bus = SpiBus.from_entity(dut, cs_name="ncs")
+
+        self.config = SpiConfig(
+            word_width=8,
+            sclk_freq=25e6,
+            cpol=spi_mode == 3,
+            cpha=spi_mode == 3,
+            msb_first=True,
+            frame_spacing_ns=50,
+            cs_active_low=True,
+        )
+
+        self.image = os.path.join(tempfile.mkdtemp(), "flash.bin")
+        SpiNorFlash.create_image(self.image, IMAGE_SIZE, BOOT_IMAGE, 0x1000)
+
+        self.source = SpiMaster(self.bus, self.config)
+        self.sink = SpiNorFlash(self.bus, self.image, config=self.config)
+        self.sink.page_program_ns = 2000
+        self.sink.sector_erase_ns = 5000
+
+    async def command(self, operation, address=None, data=(), length=0):
+        """ Clock a command and its data, and return the bytes received after the command """
+        command = self.sink.create_spi_command(operation, address)
+        await self.source.write(command + list(data) + [0] * length, burst=True)
+        return bytes((await self.source.read(len(command) + len(data) + length))[len(command):])
+
+    async def wait_ready(self):
+        while (await self.command("read_status", length=1))[0] & 0b1:
+            await Timer(1, 'us')
+
+
+async def run_test_nor_flash(dut, spi_mode=0):
+    tb = TB(dut, spi_mode)
+    await Timer(10, 'us')
+
+    assert await tb.command("read_jedec_id", length=3) == bytes((0xEF, 0x40, 20))
+
+    # the reads stream over the whole frame
+    assert await tb.command("read", 0x1000, length=len(BOOT_IMAGE)) == BOOT_IMAGE
+    assert (await tb.command("fast_read", 0x10F0, length=33))[1:] == BOOT_IMAGE[0xF0:0x110]
+
+    # a program without write enable is ignored
+    await tb.command("page_program", 0x2000, b"\x12\x34")
+    assert await tb.command("read", 0x2000, length=2) == b"\xff\xff"
+
+    await tb.command("write_enable")
+    assert (await tb.command("read_status", length=1))[0] & 0b10
+    await tb.command("page_program", 0x2000, b"\x12\x34")
+    # busy, until the program is done
+    assert (await tb.command("read_status", length=2)) == b"\x01\x01"
+    await tb.wait_ready()
+    assert await tb.command("read", 0x2000, length=3) == b"\x12\x34\xff"
+
+    await tb.command("write_enable")
+    await tb.command("sector_erase", 0x1080)
+    await tb.wait_ready()
+    assert await tb.command("read", 0x0FFF, length=3) == b"\xff\xff\xff"
+    assert await tb.command("read", 0x2000, length=1) == b"\x12"
+
+    # the image file is left as it is
+    with open(tb.image, 'rb') as f:
+        f.seek(0x1000)
+        assert f.read(len(BOOT_IMAGE)) == BOOT_IMAGE
+
+    await Timer(5, 'us')
+
+
+if cocotb.SIM_NAME:
+    factory = TestFactory(run_test_nor_flash)
+    factory.add_option("spi_mode", [0, 3])
+    factory.generate_tests()
+
+
+# cocotb-test
+
+tests_dir = os.path.dirname(__file__)
+
+
+def test_nor_flash(request):
+    dut = "test_nor_flash"
+    module = os.path.splitext(os.path.basename(__file__))[0]
+    toplevel = dut
+
+    verilog_sources = [
+        os.path.join(tests_dir, f"{dut}.v"),
+    ]
+
+    parameters = {}
+
+    extra_env = {f'PARAM_{k}': str(v) for k, v in parameters.items()}
+
+    sim_build = os.path.join(
+        tests_dir, "sim_build",
+        request.node.name.replace('[', '-').replace(']', ''),
+    )
+
+    cocotb_test.simulator.run(
+        python_search=[tests_dir],
+        verilog_sources=verilog_sources,
+        toplevel=toplevel,
+        module=module,
+        parameters=parameters,
+        sim_build=sim_build,
+        extra_env=extra_env,
+    )
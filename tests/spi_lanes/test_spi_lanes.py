@@ -0,0 +1,141 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: 2021 Spencer Chang
+import logging
+import os
+
+import cocotb
+import cocotb_test.simulator
+from cocotb.regression import TestFactory
+from cocotb.triggers import Timer
+
+from cocotbext.spi import SpiBus
+from cocotbext.spi import SpiConfig
+from cocotbext.spi import SpiMaster
+from cocotbext.spi import SpiSlaveBase
+from cocotbext.spi import SpiTransfer
+
+
+class MultiLaneSpiSlave(SpiSlaveBase):
+    # command: (write, lanes), writes store four words, reads return them after one dummy word
+    commands = {
+        0xA2: (True, 2),
+        0x32: (True, 4),
+        0x3B: (False, 2),
+        0x6B: (False, 4),
+    }
+
+    def __init__(self, bus, config):
+        self._config = config
+        self.contents = [0] * 4
+        super().__init__(bus)
+
+    async def get_contents(self):
+        await self.idle.wait()
+        return self.contents
+
+    async def _transaction(self, frame_start, frame_end):
+        await frame_start
+        self.idle.clear()
+
+        width = self._config.word_width
+        command = await self._shift_lanes(width, 1)
+        write, lanes = self.commands[command]
+
+        if write:
+            for k in range(len(self.contents)):
+                self.contents[k] = await self._shift_lanes(width, lanes)
+        else:
+            await self._shift_lanes(width, lanes)
+            for word in self.contents:
+                await self._shift_lanes(width, lanes, tx_word=word)
+
+        await frame_end
+
+
+class TB:
+    def __init__(self, dut, spi_mode):
+        self.dut = dut
+        self.log = logging.getLogger("cocotb.tb")
+        self.log.setLevel(logging.DEBUG)
+
+        self.bus = SpiBus.from_entity(dut, cs_name="ncs", io2_name="io2", io3_name="io3")
+
+        self.config = SpiConfig(
+            word_width=8,
+            sclk_freq=25e6,
+            cpol=bool(spi_mode in [2, 3]),
+            cpha=bool(spi_mode in [1, 3]),
+            msb_first=True,
+            frame_spacing_ns=10,
+            cs_active_low=True,
+        )
+
+        self.source = SpiMaster(self.bus, self.config)
+        self.sink = MultiLaneSpiSlave(self.bus, self.config)
+
+
+async def run_test(dut, spi_mode=0, lanes=4):
+    tb = TB(dut, spi_mode)
+    tb.log.info("Running test with mode=%s, lanes=%s", spi_mode, lanes)
+    write_command, read_command = {2: (0xA2, 0x3B), 4: (0x32, 0x6B)}[lanes]
+
+    await Timer(10, 'us')
+
+    test_data = [0x12, 0x34, 0xAB, 0xCD]
+    await tb.source.transfer([
+        SpiTransfer(tx=[write_command]),
+        SpiTransfer(tx=test_data, lanes=lanes),
+    ])
+    assert await tb.sink.get_contents() == test_data
+
+    await Timer(1, 'us')
+
+    message = await tb.source.transfer([
+        SpiTransfer(tx=[read_command]),
+        SpiTransfer(length=1, lanes=lanes),
+        SpiTransfer(length=len(test_data), lanes=lanes),
+    ])
+    tb.log.info("Read data: %s", ','.join(['0x%02x' % x for x in message.transfers[2].rx]))
+    assert message.transfers[2].rx == test_data
+
+    await Timer(10, 'us')
+
+
+if cocotb.SIM_NAME:
+    factory = TestFactory(run_test)
+    factory.add_option("spi_mode", [0, 1, 2, 3])
+    factory.add_option("lanes", [2, 4])
+    factory.generate_tests()
+
+
+# cocotb-test
+tests_dir = os.path.dirname(__file__)
+
+
+def test_spi_lanes(request):
+    dut = "test_spi_lanes"
+    module = os.path.splitext(os.path.basename(__file__))[0]
+    toplevel = dut
+
+    verilog_sources = [
+        os.path.join(tests_dir, f"{dut}.v"),
+    ]
+
+    parameters = {}
+
+    extra_env = {f'PARAM_{k}': str(v) for k, v in parameters.items()}
+
+    sim_build = os.path.join(
+        tests_dir, "sim_build",
+        request.node.name.replace('[', '-').replace(']', ''),
+    )
+
+    cocotb_test.simulator.run(
+        python_search=[tests_dir],
+        verilog_sources=verilog_sources,
+        toplevel=toplevel,
+        module=module,
+        parameters=parameters,
+        sim_build=sim_build,
+        extra_env=extra_env,
+    )
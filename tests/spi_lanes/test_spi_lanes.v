@@ -0,0 +1,13 @@
+`timescale 1ns / 1ps
+
+module test_spi_lanes
+(
+    inout wire sclk,
+    inout wire mosi,
+    inout wire miso,
+    inout wire io2,
+    inout wire io3,
+    inout wire ncs
+);
+
+endmodule // test_spi_lanes
@@ -0,0 +1,31 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: 2021 Spencer Chang
+import os
+
+from cocotbext.spi.loader import load_device
+from cocotbext.spi.loader import load_registers
+from cocotbext.spi.loader import SpiFrameLayout
+
+# the descriptions the described device testbench runs with
+descriptions_dir = os.path.join(os.path.dirname(__file__), os.pardir, "spi_devices", "described")
+
+
+def test_load_device():
+    path = os.path.join(descriptions_dir, "drv8304.json")
+    device = load_device(path)
+    # the class, its decode table and its register map are built once
+    assert load_device(path) is device
+    assert device.__name__ == "DRV8304"
+    assert device._frame_layout == SpiFrameLayout(command_width=5, address_width=4, rw_bit=4, data_width=11)
+    assert device._commands[0b10011] == (True, 0x3, False)
+    assert device._commands[0b00101] == (False, 0x5, False)
+
+    registers = load_registers(os.path.join(descriptions_dir, "drv8304_registers.csv"))
+    assert [register.name for register in registers][:3] == ["FAULT_STATUS_1", "VGS_STATUS_2", "DRIVER_CONTROL"]
+    assert registers[3].reset == 0b01101110111
+    assert registers[2].fields[0].name == "CLR_FLT"
+
+    adxl345 = load_device(os.path.join(descriptions_dir, "adxl345.json"))
+    # the command carries the multibyte bit
+    assert adxl345._commands[0b1110_1100] == (True, 0x2C, True)
+    assert adxl345._commands[0b1010_1100] == (True, 0x2C, False)
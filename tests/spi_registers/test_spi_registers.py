@@ -0,0 +1,42 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: 2021 Spencer Chang
+import pytest
+
+from cocotbext.spi.registers import READ_ONLY
+from cocotbext.spi.registers import SpiRegister
+from cocotbext.spi.registers import SpiRegisterField
+from cocotbext.spi.registers import SpiRegisterMap
+from cocotbext.spi.registers import WRITE_1_TO_CLEAR
+
+
+def test_register_map():
+    registers = SpiRegisterMap([
+        SpiRegister("ID", 0x00, reset=0xE5, access=READ_ONLY),
+        SpiRegister("CTRL", 0x01, reset=0x0A, fields=(SpiRegisterField("RATE", 0, 4), SpiRegisterField("EN", 7))),
+        SpiRegister("STATUS", 0x03, reset=0xF0, access=WRITE_1_TO_CLEAR),
+    ], word_width=8, size=4)
+
+    # writes from the bus follow the access of the register, address 0x02 has none
+    for address in range(4):
+        registers.write(address, 0x33)
+    assert registers.values.tolist() == [0xE5, 0x33, 0x00, 0xC0]
+    assert 0x02 not in registers
+    with pytest.raises(ValueError):
+        registers.check(0x02)
+
+    # the device itself can store anything, and the fields are views into the registers
+    registers[0x00] = 0x1E5
+    assert registers[0x00] == 0xE5
+    registers.set_field("EN", 1)
+    assert registers.get_field("RATE") == 0x3 and registers[0x01] == 0xB3
+
+    # bulk reads and writes increment the address, and wrap around
+    assert registers.read_block(0x03, 3) == [0xC0, 0xE5, 0xB3]
+    registers.write_block(0x01, [0x01, 0x02, 0xFF])
+    assert registers.as_dict() == {"ID": 0xE5, "CTRL": 0x01, "STATUS": 0x00}
+
+    snapshot = registers.snapshot()
+    registers.reset()
+    assert registers.as_dict() == {"ID": 0xE5, "CTRL": 0x0A, "STATUS": 0xF0}
+    registers.restore(snapshot)
+    assert registers[0x01] == 0x01
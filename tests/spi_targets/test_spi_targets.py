@@ -0,0 +1,121 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: 2021 Spencer Chang
+import logging
+import os
+
+import cocotb
+import cocotb_test.simulator
+from cocotb.triggers import Timer
+
+from cocotbext.spi import SpiBus
+from cocotbext.spi import SpiConfig
+from cocotbext.spi import SpiMaster
+from cocotbext.spi import SpiMonitor
+from cocotbext.spi.devices.generic import SpiSlaveLoopback
+
+
+class TB:
+    def __init__(self, dut, cs_vector=False):
+        self.dut = dut
+        self.log = logging.getLogger("cocotb.tb")
+        self.log.setLevel(logging.DEBUG)
+
+        # every target has its own mode, width and bit order
+        self.configs = [
+            SpiConfig(word_width=8, cpol=False, cpha=False, frame_spacing_ns=10),
+            SpiConfig(word_width=16, cpol=True, cpha=True, frame_spacing_ns=10),
+            SpiConfig(word_width=32, sclk_freq=10e6, cpol=False, cpha=True, msb_first=False, frame_spacing_ns=10),
+        ]
+
+        if cs_vector:
+            # bit k of ncs selects target k, each slave sees its bit as a signal of its own
+            self.bus = SpiBus.from_entity(dut, cs_name="ncs")
+            self.source = SpiMaster(self.bus, self.configs)
+            self.sinks = [
+                SpiSlaveLoopback(SpiBus.from_entity(dut, cs_name=f"ncs_bit{k}"), config)
+                for k, config in enumerate(self.configs)
+            ]
+        else:
+            # the slaves sit on their own chip select of the shared bus
+            self.bus = SpiBus.from_entity(dut, cs_name=[f"ncs{k}" for k in range(len(self.configs))])
+            self.source = SpiMaster(self.bus, self.configs)
+            self.sinks = [SpiSlaveLoopback(self.bus, config, target=k) for k, config in enumerate(self.configs)]
+
+
+async def check_targets(tb):
+    last_words = [0] * len(tb.sinks)
+    for k in range(3):
+        for target, sink in enumerate(tb.sinks):
+            mask = (1 << tb.configs[target].word_width) - 1
+            test_data = [((0x5A + k) * (target + 1) * (n + 3)) & mask for n in range(4)]
+
+            tb.log.info("Write data to target %d: %s", target, ','.join(['0x%02x' % x for x in test_data]))
+            await tb.source.write(test_data, target=target)
+            rx_data = await tb.source.read()
+
+            # the loopback returns the word it got on the previous frame of the same target
+            assert list(rx_data) == [last_words[target]] + test_data[:-1]
+            assert await sink.get_contents() == test_data[-1]
+            last_words[target] = test_data[-1]
+
+
+@cocotb.test()
+async def run_test_spi_targets(dut):
+    tb = TB(dut)
+    await Timer(10, 'us')
+
+    await check_targets(tb)
+
+    await Timer(5, 'us')
+
+
+@cocotb.test()
+async def run_test_spi_targets_cs_vector(dut):
+    tb = TB(dut, cs_vector=True)
+    # the monitor follows a single bit of the vector
+    monitor = SpiMonitor(tb.bus, tb.configs[1], target=1)
+    await Timer(10, 'us')
+
+    await check_targets(tb)
+
+    # only the frames of target 1, one per word
+    frames = []
+    while not monitor.empty():
+        frames.append(monitor.recv_nowait())
+    assert len(frames) == 3 * 4
+    assert all(frame.num_bits == 16 for frame in frames)
+
+    await Timer(5, 'us')
+
+
+# cocotb-test
+tests_dir = os.path.dirname(__file__)
+
+
+def test_spi_targets(request):
+    dut = "test_spi_targets"
+    module = os.path.splitext(os.path.basename(__file__))[0]
+    toplevel = dut
+
+    verilog_sources = [
+        os.path.join(tests_dir, f"{dut}.v"),
+    ]
+
+    parameters = {}
+
+    extra_env = {f'PARAM_{k}': str(v) for k, v in parameters.items()}
+
+    sim_build = os.path.join(
+        tests_dir, "sim_build",
+        request.node.name.replace('[', '-').replace(']', ''),
+    )
+
+    cocotb_test.simulator.run(
+        python_search=[tests_dir],
+        verilog_sources=verilog_sources,
+        toplevel=toplevel,
+        module=module,
+        parameters=parameters,
+        sim_build=sim_build,
+        extra_env=extra_env,
+    )
@@ -0,0 +1,19 @@
+`timescale 1ns / 1ps
+
+module test_spi_targets
+(
+    inout wire sclk,
+    inout wire mosi,
+    inout wire miso,
+    inout wire ncs0,
+    inout wire ncs1,
+    inout wire ncs2,
+    inout wire [2:0] ncs
+);
+
+// the bits of the chip select vector, each the chip select of its own slave
+wire ncs_bit0 = ncs[0];
+wire ncs_bit1 = ncs[1];
+wire ncs_bit2 = ncs[2];
+
+endmodule // test_spi_targets
@@ -0,0 +1,21 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: 2021 Spencer Chang
+import pytest
+
+from cocotbext.spi import reverse_word
+from cocotbext.spi import reverse_words
+
+
+def test_reverse_word():
+    # no simulator needed, checked against the reversal of the binary string
+    for width in [1, 3, 8, 13, 32, 40, 64, 65, 100]:
+        mask = (1 << width) - 1
+        for n in [0, 1, 0b1011 & mask, mask, 0x1234_5678_9ABC_DEF0_1234_5678_9ABC & mask]:
+            assert reverse_word(n, width) == int(f'{n:0{width}b}'[::-1], 2)
+
+    assert reverse_words(bytes([0x01, 0x80, 0x0F]), 8) == bytearray([0x80, 0x01, 0xF0])
+    assert reverse_words([1, 2], 40) == [1 << 39, 1 << 38]
+
+    np = pytest.importorskip("numpy")
+    words = np.array([[1, 2], [3, 0xFF_FFFF_FFFE]], dtype=np.uint64)
+    assert reverse_words(words, 40).tolist() == [[1 << 39, 1 << 38], [3 << 38, 0x7F_FFFF_FFFF]]
@@ -0,0 +1,57 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: 2021 Spencer Chang
+import pytest
+
+from cocotbext.spi import decode_vcd
+from cocotbext.spi import reverse_word
+from cocotbext.spi import SpiConfig
+
+
+@pytest.mark.parametrize("spi_mode", [0, 1, 2, 3])
+@pytest.mark.parametrize("msb_first", [True, False])
+def test_decode_vcd(tmp_path, spi_mode, msb_first):
+    # no simulator needed, the dump of two frames is written by hand
+    cpol, cpha = spi_mode in [2, 3], spi_mode in [1, 3]
+    idle, active = int(cpol), int(not cpol)
+    frames = [([0xA5, 0x3C], [0x0F, 0xF0]), ([0x81], [0x7E])]
+
+    lines = [
+        "$timescale 1ns $end",
+        "$scope module tb $end",
+        "$var wire 1 ! sclk $end",
+        "$var wire 1 \" mosi $end",
+        "$var wire 1 # miso $end",
+        "$var wire 1 $ ncs $end",
+        "$var wire 8 % noise [7:0] $end",
+        "$upscope $end",
+        "$enddefinitions $end",
+        "#0", f"{idle}!", "1\"", "1#", "1$", "b0 %",
+    ]
+    time = 0
+    for mosi, miso in frames:
+        time += 100
+        lines += [f"#{time}", "0$"]
+        for tx, rx in zip(mosi, miso):
+            if not msb_first:
+                tx, rx = reverse_word(tx, 8), reverse_word(rx, 8)
+            for k in range(7, -1, -1):
+                # with CPHA=1 the data changes on the leading edge, else ahead of it
+                time += 10
+                lines += [f"#{time}", f"{(tx >> k) & 1}\"", f"{(rx >> k) & 1}#", f"b{k:b} %"]
+                if cpha:
+                    lines.append(f"{active}!")
+                time += 10
+                lines += [f"#{time}", f"{idle if cpha else active}!"]
+                if not cpha:
+                    time += 10
+                    lines += [f"#{time}", f"{idle}!"]
+        time += 20
+        lines += [f"#{time}", "1$"]
+
+    path = tmp_path / "spi.vcd"
+    path.write_text("\n".join(lines) + "\n")
+
+    config = SpiConfig(word_width=8, cpol=cpol, cpha=cpha, msb_first=msb_first)
+    decoded = list(decode_vcd(str(path), config, cs_name="ncs"))
+    assert [(frame.mosi, frame.miso) for frame in decoded] == frames
+    assert decoded[0].start_time == 100